@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Benchmark suite for the scraper and the analysis hot paths.
+
+    python benchmarks/run_benchmarks.py run [--sizes 1000 10000] [--only NAME ...] [--repeat 3]
+    python benchmarks/run_benchmarks.py compare BASELINE.json CANDIDATE.json [--threshold 0.1]
+
+Every (benchmark, size) case runs in its own process, so its peak RSS is not polluted by the
+previous cases. Results (best/median time, peak memory of the benchmarked call, peak RSS of the
+process, throughput) go to benchmarks/results/.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import subprocess
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import json_codec
+from synthetic_catalog import generate_catalog, iter_products
+
+FIXTURES = os.path.join(BENCH_DIR, "fixtures", "betty_articles.jsonl")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+DEFAULT_SIZES = [1000, 10000]
+
+logger = logging.getLogger("benchmarks")
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def load_payloads(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(product id, betty-articles payload) pairs from the fixtures or from a raw archive (file or directory)."""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            return [(entry["id"], entry["payload"]) for entry in map(json.loads, f) if entry]
+    from raw_archive import archive_files, iter_archive
+    return [entry for archive in archive_files(path) for entry in iter_archive(archive)]
+
+
+def make_scraper(work_dir: str):
+    """An offline Scraper whose output folders live in work_dir (it reads config.ini from the cwd)."""
+    shutil.copy(os.path.join(ROOT, "config.ini"), os.path.join(work_dir, "config.ini"))
+    os.chdir(work_dir)
+    from scraper_makro import Scraper
+    logging.getLogger("scraper_makro").setLevel(logging.ERROR)
+    return Scraper(offline=True)
+
+
+# --- Cases: setup(size, work_dir, options) -> (callable, items processed per call) ---
+
+def case_parse_details(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """Scraper.parser_product_details on recorded payloads (network replaced by the recorded response)."""
+    scraper = make_scraper(work_dir)
+    payloads = load_payloads(options["payloads"])
+    by_id = {product_id: payload for product_id, payload in payloads}
+    scraper.fetch_product_payload = lambda product_id, store_ids, details=True: by_id[product_id]
+    ids = [payloads[i % len(payloads)][0] for i in range(size)]
+
+    def run():
+        for product_id in ids:
+            scraper.parser_product_details(product_id)
+    return run, size
+
+
+def case_get_value(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """Scraper.get_value over every fields_map path of recorded payloads."""
+    scraper = make_scraper(work_dir)
+    payloads = load_payloads(options["payloads"])
+    results = [payload["result"][product_id] for product_id, payload in payloads]
+    paths = list(scraper.get_fields_map(scraper.STORE_ID).values())
+    lookups = [(results[i % len(results)], path) for i in range(size) for path in paths]
+
+    def run():
+        for result, path in lookups:
+            scraper.get_value(result, path.copy())
+    return run, len(lookups)
+
+
+def case_merge_jsonl(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """merge_jsonl.merge_jsonl_to_json over a synthetic crawl output folder."""
+    from merge_jsonl import merge_jsonl_to_json
+    folder = generate_catalog(os.path.join(options["data_dir"], f"catalog_{size}"), size)
+    output = os.path.join(work_dir, "results.json")
+    return (lambda: merge_jsonl_to_json(folder, output)), size
+
+
+def case_json_to_csv(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """json_to_csv.json_to_csv over a merged JSON file."""
+    from json_to_csv import json_to_csv
+    json_file = os.path.join(work_dir, "results.json")
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(list(iter_products(size)), f, ensure_ascii=False)
+    csv_file = os.path.join(work_dir, "results.csv")
+    return (lambda: json_to_csv(json_file, csv_file)), size
+
+
+def case_nutrition_vectors(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """cosine_similarity.extract_nutrition_vector over every product."""
+    from cosine_similarity import extract_nutrition_vector, NUTRITION_FEATURES
+    nutrition = [record["nutritionInformation"] for record in iter_products(size)]
+
+    def run():
+        for info in nutrition:
+            extract_nutrition_vector(info, NUTRITION_FEATURES)
+    return run, size
+
+
+def case_find_similar(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """cosine_similarity.find_similar_products for one product against the whole catalog."""
+    import cosine_similarity
+    folder = generate_catalog(os.path.join(options["data_dir"], f"catalog_{size}"), size)
+    df = cosine_similarity.load_product_data(folder)
+    target = df.index[0]
+    return (lambda: cosine_similarity.find_similar_products(target, df, cosine_similarity.NUTRITION_FEATURES)), size
+
+
+def case_find_similar_filtered(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """cosine_similarity.SimilarityIndex.find_similar within the target's top category and brand type."""
+    import cosine_similarity
+    from white_labels import load_white_label_brands
+    folder = generate_catalog(os.path.join(options["data_dir"], f"catalog_{size}"), size)
+    df = cosine_similarity.load_product_data(folder)
+    index = cosine_similarity.SimilarityIndex(
+        df, cosine_similarity.NUTRITION_FEATURES, load_white_label_brands(os.path.join(ROOT, "white_label_brands.json"))
+    )
+    target = index.ids[-1]
+    category = index.category_of(target, 1)
+    return (lambda: index.find_similar(target, 5, category, cosine_similarity.BRAND_TYPES[1])), size
+
+
+def case_brand_prices(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """brand_price.analyze_brand_prices_by_subcategory on an in-memory catalog."""
+    import brand_price
+    from product_snapshot import load_product_data
+    from white_labels import load_white_label_brands
+    folder = generate_catalog(os.path.join(options["data_dir"], f"catalog_{size}"), size)
+    df = load_product_data(folder)
+    white_brands = load_white_label_brands(os.path.join(ROOT, "white_label_brands.json"))
+
+    def run():
+        brand_price.analyze_brand_prices_by_subcategory(
+            df, white_brands, brand_price.PRICE_COLUMN, brand_price.TARGET_MAIN_CATEGORY_PREFIX,
+            brand_price.CATEGORY_SEPARATOR
+        )
+    return run, size
+
+
+def case_cheaper_equivalents(size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """cheaper_equivalents.SavingsStore.refresh, full build on an in-memory catalog."""
+    from cheaper_equivalents import SavingsStore
+    from product_snapshot import load_product_data
+    folder = generate_catalog(os.path.join(options["data_dir"], f"catalog_{size}"), size)
+    df = load_product_data(folder)
+    db_path = os.path.join(work_dir, "savings.db")
+
+    def run():
+        with SavingsStore(db_path) as store:
+            store.refresh(df, full=True)
+    return run, size
+
+
+def case_json_decode(backend: str, size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """json_codec.loads of one JSONL line per product, with the given backend."""
+    lines = [json_codec.dumps_bytes(record) for record in iter_products(size)]
+    loads = json_codec.BACKENDS[backend]["loads"]
+
+    def run():
+        for line in lines:
+            loads(line)
+    return run, size
+
+
+def case_json_encode(backend: str, size: int, work_dir: str, options: dict) -> Tuple[Callable, int]:
+    """json_codec.dumps_bytes of every product record, with the given backend."""
+    records = list(iter_products(size))
+    dumps = json_codec.BACKENDS[backend]["dumps"]
+
+    def run():
+        for record in records:
+            dumps(record)
+    return run, size
+
+
+CASES = {
+    "parse_details": case_parse_details,
+    "get_value": case_get_value,
+    "merge_jsonl": case_merge_jsonl,
+    "json_to_csv": case_json_to_csv,
+    "nutrition_vectors": case_nutrition_vectors,
+    "find_similar": case_find_similar,
+    "find_similar_filtered": case_find_similar_filtered,
+    "brand_prices": case_brand_prices,
+    "cheaper_equivalents": case_cheaper_equivalents,
+}
+# Codec throughput of every installed backend, e.g. json_decode_orjson vs json_decode_json
+for backend_name in sorted(json_codec.BACKENDS):
+    CASES[f"json_decode_{backend_name}"] = partial(case_json_decode, backend_name)
+    CASES[f"json_encode_{backend_name}"] = partial(case_json_encode, backend_name)
+
+
+def run_case(name: str, size: int, repeat: int, options: dict) -> Dict[str, Any]:
+    """Runs one case in the current process (the child side of run_suite)."""
+    result = {"benchmark": name, "size": size}
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    # The benchmarked functions print progress; keep it out of the results
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        func, items = CASES[name](size, work_dir, options)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        # One more, untimed call under tracemalloc: its peak excludes the setup (catalog generation,
+        # DataFrame loading) that dominates the process peak RSS
+        tracemalloc.start()
+        func()
+        peak_alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result.update({
+            "seconds": round(min(timings), 6),
+            "median_seconds": round(statistics.median(timings), 6),
+            "items": items,
+            "throughput": round(items / min(timings), 1) if min(timings) else None,
+            "peak_alloc_mb": round(peak_alloc / (1024 * 1024), 3),
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_suite(names: List[str], sizes: List[int], repeat: int, options: dict, output: str) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        for name in names:
+            with tempfile.NamedTemporaryFile("r", suffix=".json", delete=False) as tmp:
+                result_path = tmp.name
+            command = [sys.executable, os.path.abspath(__file__), "_case", name, str(size), str(repeat),
+                       result_path, json.dumps(options)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            try:
+                with open(result_path, encoding="utf-8") as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = {"benchmark": name, "size": size,
+                          "error": f"exit code {completed.returncode}: {completed.stderr.strip()[-500:]}"}
+            finally:
+                if os.path.exists(result_path):
+                    os.remove(result_path)
+            results.append(result)
+            logger.info(format_result(result))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "commit": git_commit(),
+        "json_backend": json_codec.BACKEND,
+        "repeat": repeat,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results written to {output}")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    label = f"{result['benchmark']:<18} {result['size']:>8}"
+    if "error" in result:
+        return f"{label}  ERROR: {result['error']}"
+    return (f"{label}  {result['seconds']:>10.4f} s  {result['throughput']:>12,.0f} items/s  "
+            f"peak {result.get('peak_alloc_mb')} MB  (RSS {result['peak_rss_mb']} MB)")
+
+
+def compare(baseline_path: str, candidate_path: str, threshold: float, min_seconds: float) -> int:
+    """
+    Prints the time and peak memory ratio (of the benchmarked call) of every case present in both
+    result files and flags regressions: slower (or bigger) by more than threshold. Returns the
+    number of regressions.
+    """
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            return {(r["benchmark"], r["size"]): r for r in json.load(f)["results"] if "seconds" in r}
+
+    baseline, candidate = load(baseline_path), load(candidate_path)
+    regressions = 0
+    print(f"{'benchmark':<18} {'size':>8} {'base s':>10} {'new s':>10} {'time':>7} {'memory':>7}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        time_ratio = new["seconds"] / old["seconds"] if old["seconds"] else 1.0
+        memory_ratio = (new["peak_alloc_mb"] / old["peak_alloc_mb"]
+                        if old.get("peak_alloc_mb") and new.get("peak_alloc_mb") else 1.0)
+        flags = []
+        if time_ratio > 1 + threshold and new["seconds"] - old["seconds"] > min_seconds:
+            flags.append("SLOWER")
+        if memory_ratio > 1 + threshold:
+            flags.append("MORE MEMORY")
+        regressions += bool(flags)
+        print(f"{key[0]:<18} {key[1]:>8} {old['seconds']:>10.4f} {new['seconds']:>10.4f} "
+              f"{time_ratio:>6.2f}x {memory_ratio:>6.2f}x  {' '.join(flags) or 'ok'}")
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key[0]:<18} {key[1]:>8}  only in {'baseline' if key in baseline else 'candidate'}")
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_case":
+        # Child process: python run_benchmarks.py _case NAME SIZE REPEAT RESULT_PATH OPTIONS_JSON
+        _, _, case_name, case_size, case_repeat, result_file, case_options = sys.argv
+        case_result = run_case(case_name, int(case_size), int(case_repeat), json.loads(case_options))
+        with open(result_file, "w", encoding="utf-8") as f:
+            json.dump(case_result, f)
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Run or compare the benchmark suite.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write a result file.")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                            help="Catalog sizes, e.g. 1000 10000 100000 1000000.")
+    run_parser.add_argument("--only", nargs="+", choices=sorted(CASES), default=None, help="Benchmarks to run.")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best and median are kept).")
+    run_parser.add_argument("--payloads", default=FIXTURES,
+                            help="Recorded betty-articles payloads: the fixtures, or a raw archive file/directory.")
+    run_parser.add_argument("--data-dir", default=DATA_DIR, help="Where synthetic catalogs are generated (and reused).")
+    run_parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/<timestamp>.json).")
+
+    compare_parser = subparsers.add_parser("compare", help="Flag regressions between two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Tolerated slowdown (0.10 = 10%%).")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.005,
+                                help="Ignore time differences smaller than this (timer noise).")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        output_file = args.output or os.path.join(RESULTS_DIR, time.strftime("bench_%Y%m%d_%H%M%S.json"))
+        run_options = {"payloads": os.path.abspath(args.payloads), "data_dir": os.path.abspath(args.data_dir)}
+        run_suite(args.only or list(CASES), args.sizes, args.repeat, run_options, output_file)
+    else:
+        sys.exit(1 if compare(args.baseline, args.candidate, args.threshold, args.min_seconds) else 0)
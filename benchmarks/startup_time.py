@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Startup-time check of the analysis tools, measured with `python -X importtime`.
+
+    python benchmarks/startup_time.py [--repeat 5] [--budget-scale 1.0]
+
+Each tool module is imported in a fresh interpreter. Its cumulative import time (best of
+--repeat runs) must stay within its budget, and none of the heavy packages it should only
+load lazily may show up in the import trace. Exits with status 1 when a check fails.
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+# Module -> cumulative import time budget in milliseconds (pandas and NumPy included)
+STARTUP_BUDGETS_MS = {
+    "cosine_similarity": 1000,
+    "brand_price": 1000,
+}
+# Packages the tools must not import at startup: plotting is loaded by the code that draws
+LAZY_PACKAGES = ["matplotlib", "seaborn", "sklearn", "scipy"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$")
+
+
+def import_trace(module: str) -> List[Tuple[str, int, int]]:
+    """(imported module, nesting depth, cumulative us) for every import of `python -X importtime -c 'import module'`."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {completed.stderr.strip()[-500:]}")
+    trace = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            trace.append((match.group(4), len(match.group(3)) // 2, int(match.group(2))))
+    return trace
+
+
+def measure(module: str, repeat: int) -> Dict[str, object]:
+    """
+    Best cumulative import time of the module, the lazy packages its import pulled in and
+    its slowest direct imports.
+    """
+    best, loaded = None, set()
+    for _ in range(repeat):
+        trace = import_trace(module)
+        cumulative = next(us for name, _, us in trace if name == module)
+        best = cumulative if best is None else min(best, cumulative)
+        loaded.update(name.split(".")[0] for name, _, _ in trace)
+    slowest = sorted(((us, name) for name, depth, us in trace if depth == 1), reverse=True)[:5]
+    return {
+        "module": module,
+        "milliseconds": best / 1000,
+        "lazy_loaded": sorted(loaded.intersection(LAZY_PACKAGES)),
+        "slowest": [(name, us / 1000) for us, name in slowest],
+    }
+
+
+def check(repeat: int, budget_scale: float) -> int:
+    """Prints one line per tool and returns the number of failed checks."""
+    failures = 0
+    for module, budget in STARTUP_BUDGETS_MS.items():
+        result = measure(module, repeat)
+        budget *= budget_scale
+        flags = []
+        if result["milliseconds"] > budget:
+            flags.append(f"OVER BUDGET ({budget:.0f} ms)")
+        if result["lazy_loaded"]:
+            flags.append(f"IMPORTS {', '.join(result['lazy_loaded'])}")
+        failures += bool(flags)
+        slowest = ", ".join(f"{name} {ms:.0f} ms" for name, ms in result["slowest"])
+        print(f"{module:<18} {result['milliseconds']:>8.1f} ms  {' '.join(flags) or 'ok'}  ({slowest})")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time of the analysis tools against budgets.")
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module (the fastest one counts).")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every budget, e.g. 2.0 on a slow machine.")
+    args = parser.parse_args()
+    sys.exit(1 if check(args.repeat, args.budget_scale) else 0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import json
+import random
+import argparse
+from typing import Any, Dict, Iterator, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Category tree shaped like the crawled one: main category -> subcategory -> leaves
+CATEGORY_TREE = {
+    "Alimentación general": {
+        "Quesos": ["Quesos frescos", "Quesos curados", "Quesos rallados"],
+        "Lácteos y huevos": ["Yogures", "Leche", "Huevos", "Mantequilla"],
+        "Despensa": ["Aceites", "Arroz", "Legumbres", "Pasta", "Harinas"],
+        "Bebidas": ["Refrescos", "Aguas", "Cervezas", "Vinos"],
+        "Conservas": ["Pescado", "Vegetales"],
+        "Congelados": ["Pizzas", "Verduras", "Helados"],
+        "Charcutería": ["Jamón", "Embutidos"],
+    },
+    "Frescos": {
+        "Carne": ["Vacuno", "Cerdo", "Pollo"],
+        "Frutas": ["Cítricos", "Tropicales"],
+        "Verduras": ["Hortalizas", "Setas"],
+        "Pescados y mariscos": ["Pescado blanco", "Marisco"],
+    },
+    "No alimentación": {
+        "Cocina": ["Menaje", "Utensilios"],
+        "Limpieza": ["Detergentes", "Papel"],
+    },
+}
+OTHER_BRANDS = [f"Marca {i:03d}" for i in range(400)] + ["Danone", "Pascual", "Nestlé", "Central Lechera Asturiana"]
+NUTRIENTS = ["calories", "protein", "fat", "carbohydrates", "sugars", "salt", "saturatedFattyAcids", "fiber"]
+INGREDIENTS = ["Leche", "azúcar", "aceite de palma", "harina de trigo", "sal", "agua", "cacao", "huevo", "levadura"]
+
+
+def white_label_brands() -> List[str]:
+    with open(os.path.join(ROOT, "white_label_brands.json"), encoding="utf-8") as f:
+        return json.load(f).get("general", [])
+
+
+def iter_products(n: int, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """Yields n deterministic product records with the fields and value shapes of the scraper output."""
+    rng = random.Random(seed)
+    categories = [
+        f"{main}/{sub}/{leaf}" for main, subs in CATEGORY_TREE.items() for sub, leaves in subs.items() for leaf in leaves
+    ] + list(CATEGORY_TREE)
+    white = white_label_brands()
+    for i in range(n):
+        pid = f"BTY-X{100000 + i}"
+        grams = rng.choice([100, 250, 500, 1000, 2000])
+        units = rng.choice([1, 1, 1, 2, 6, 12])
+        price = round(rng.uniform(0.5, 40), 2)
+        offer = round(price * rng.uniform(0.7, 0.95), 2) if rng.random() < 0.15 else None
+        nutrition = {
+            key: {"value": str(round(rng.uniform(0, 60), 1)), "unit": "kcal" if key == "calories" else "g"}
+            for key in NUTRIENTS
+        } if rng.random() < 0.7 else {}
+        yield {
+            "supermarket": "Makro Vitoria",
+            "supermarketPostalCode": "01013",
+            "currency": "EUR",
+            "country": "ES",
+            "productIdInSupermarket": pid,
+            "denomination": f"Producto {i} {grams}g",
+            "description": f"Descripción del producto {i}. " + " ".join(rng.sample(INGREDIENTS, 3)),
+            "brand": rng.choice(white) if rng.random() < 0.25 else rng.choice(OTHER_BRANDS),
+            "priceWithTax": round(price * 1.1, 2),
+            "price": price,
+            "unitPrice": round(price * 1000 / (grams * units), 2) if rng.random() < 0.95 else None,
+            "unitPriceWithOffer": round(offer * 1000 / (grams * units), 2) if offer else None,
+            "offerPrice": offer,
+            "kgGross": None,
+            "isWeightArticle": "WEIGHT" if rng.random() < 0.05 else None,
+            "alwaysGoodPrice": None,
+            "promotion": rng.choice(["2x1", "3x2"]) if offer else "",
+            "percentPromotion": round(1 - offer / price, 2) if offer else None,
+            "measuringUnit": {"format": "unidades", "value": grams / 1000, "unit": rng.choice(["KG", "L"])},
+            "units": str(units),
+            "rawIngredients": " ".join(rng.sample(INGREDIENTS, rng.randint(2, 6))),
+            "manufacturer": {"name": f"Proveedor {rng.randint(1, 200)}", "address": None},
+            "countryOfOrigin": None,
+            "categoryInSupermarket": rng.choice(categories),
+            "listingCategories": [],
+            "nutritionInformation": nutrition,
+            "characteristics": "Conservación: Frío" if rng.random() < 0.5 else None,
+            "imageLinks": [f"https://img.example/{pid}.jpg"],
+            "link": f"https://tienda.makro.es/shop/pv/{pid}/0032/0021/Producto-{i}-{grams}g",
+        }
+
+
+def generate_catalog(folder: str, n: int, seed: int = 1) -> str:
+    """
+    Writes a synthetic crawl output (one makro_<id>.jsonl file per product) to folder and returns it.
+    An existing complete catalog of the same size and seed is reused.
+    """
+    marker = os.path.join(folder, ".complete")
+    if os.path.isfile(marker):
+        with open(marker, encoding="utf-8") as f:
+            if f.read().strip() == f"{n} {seed}":
+                return folder
+    os.makedirs(folder, exist_ok=True)
+    for record in iter_products(n, seed):
+        with open(os.path.join(folder, f"makro_{record['productIdInSupermarket']}.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(f"{n} {seed}")
+    return folder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crawl output folder.")
+    parser.add_argument("output", help="Output folder.")
+    parser.add_argument("size", type=int, help="Number of products (e.g. 1000, 10000, 100000, 1000000).")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate_catalog(args.output, args.size, args.seed)
+    sys.stdout.write(f"Wrote {args.size} products to {args.output}\n")
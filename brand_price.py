@@ -1,13 +1,16 @@
 # File: brand_price_analysis.py
 
 import os
-import json
-import jsonlines
+import argparse
+from collections import Counter, defaultdict
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import logging
-import numpy as np # For handling potential NaN in plotting
+import numpy as np
+
+from product_snapshot import load_product_data, iter_product_batches
+from merged_catalog import MergedCatalog
+from white_labels import BRAND_TYPES, WhiteLabelMatcher, load_white_label_brands
+from profiling import add_profile_arguments, maybe_profile
 
 # --- Configuration ---
 JSONL_FOLDER = "jsonl_out"  # !!! ADAPT THIS to your actual output folder name from config.ini
@@ -16,146 +19,300 @@ PRICE_COLUMN = 'unitPrice' # Use 'unitPrice' for fair comparison, or 'priceWithT
 TOP_N_SUBCATEGORIES = 10 # Number of top first-level sub-categories within Alimentación General to plot
 TARGET_MAIN_CATEGORY_PREFIX = "Alimentación general" # The prefix to filter categories (use exact case from JSON)
 CATEGORY_SEPARATOR = "/" # The character separating category levels
+CHUNK_SIZE = 50000 # Products per batch in chunked (out-of-core) mode
 # --- End Configuration ---
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def load_product_data(folder_path: str) -> pd.DataFrame:
-    """Loads all product data from .jsonl files in a folder."""
-    all_products = []
-    if not os.path.isdir(folder_path):
-        logging.error(f"Error: Folder not found: {folder_path}")
-        return pd.DataFrame()
-
-    logging.info(f"Loading product data from: {folder_path}")
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".jsonl"):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with jsonlines.open(file_path, mode='r') as reader:
-                    for product in reader:
-                        all_products.append(product)
-            except Exception as e:
-                logging.error(f"Error reading {filename}: {e}")
-
-    if not all_products:
-        logging.error(f"No product data loaded from {folder_path}. Check the folder and file contents.")
-        return pd.DataFrame()
-
-    df = pd.DataFrame(all_products)
-    logging.info(f"Loaded {len(df)} products.")
+def split_category_levels(categories: pd.Series, separator: str) -> pd.DataFrame:
+    """
+    Vectorized split of 'categoryInSupermarket' into its main category and first subcategory.
+    Each distinct category string is split only once, then broadcast back through its codes.
+    Example: 'Alimentación general/Quesos/Quesos frescos' -> ('Alimentación general', 'Quesos')
+    """
+    categorical = categories.astype('category')
+    codes = categorical.cat.codes.to_numpy()
+
+    unique_parts = pd.Series(categorical.cat.categories, dtype=object).str.split(separator, n=2, expand=True)
+    unique_parts = unique_parts.reindex(columns=[0, 1])
+    levels = {}
+    for column, name in ((0, 'main_category'), (1, 'first_subcategory')):
+        values = unique_parts[column].astype(object).str.strip()
+        values = values.where(values != '')
+        # Code -1 (missing category) picks the trailing None
+        levels[name] = np.append(values.to_numpy(dtype=object), None)[codes]
+    return pd.DataFrame(levels, index=categories.index)
+
+def load_merged_category_frame(merged_path: str, price_col: str, main_category: str = None) -> pd.DataFrame:
+    """
+    Loads the products of one main category (or all of them) from the merged JSONL through its
+    category tree: only the rows of the selected subtree are decoded, and the main_category /
+    first_subcategory columns are filled from the tree's row ranges instead of splitting strings.
+    """
+    columns = ['brand', 'isWhiteLabel', 'whiteLabelFingerprint', 'categoryInSupermarket', price_col]
+    with MergedCatalog(merged_path) as catalog:
+        tree = catalog.category_tree()
+        selected = tree.node((main_category,)) if main_category else tree.root
+        if selected is None:
+            logging.warning(f"Category '{main_category}' not found in {merged_path}.")
+            return pd.DataFrame(columns=columns + GROUP_LEVELS)
+        records = [{key: record.get(key) for key in columns}
+                   for record in catalog.iter_bytes(selected.byte_start, selected.byte_end)]
+
+    df = pd.DataFrame(records, columns=columns)
+    levels = {name: np.full(len(df), None, dtype=object) for name in GROUP_LEVELS}
+    within = (main_category,) if main_category else ()
+    for (main, first_sub), node in tree.groups(2, within):
+        rows = slice(node.start - selected.start, node.end - selected.start)
+        levels['main_category'][rows] = main
+        levels['first_subcategory'][rows] = first_sub
+    for name in GROUP_LEVELS:
+        df[name] = levels[name]
+    logging.info(f"Loaded {len(df)} products from {merged_path} ({main_category or 'all categories'}).")
     return df
 
-def load_white_label_brands(file_path: str) -> set:
-    """Loads white label brands from a JSON file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            brands = set(brand.strip().upper() for brand in data.get("general", []))
-            logging.info(f"Loaded {len(brands)} white-label brand names.")
-            return brands
-    except FileNotFoundError:
-        logging.error(f"Error: White label file not found: {file_path}")
-        return set()
-    except json.JSONDecodeError:
-        logging.error(f"Error: Could not decode JSON from {file_path}")
-        return set()
-    except Exception as e:
-        logging.error(f"Error loading white label brands: {e}")
-        return set()
-
-def extract_first_subcategory(category_string: str, main_category_prefix: str, separator: str) -> str:
-    """
-    Extracts the first level subcategory after the main category prefix.
-    Example: 'Alimentación general/Quesos/Quesos frescos' -> 'Quesos'
-    """
-    if not isinstance(category_string, str) or not category_string.startswith(main_category_prefix):
-        return None # Or return 'Unknown' or ''
-
-    parts = category_string.split(separator)
-    # parts[0] is main_category_prefix
-    if len(parts) > 1 and parts[1]: # Check if there is a part after the first separator and it's not empty
-        return parts[1].strip()
-    else:
-        # Handle cases like "Alimentación general" or "Alimentación general/"
-        return None # Or a placeholder like 'Base Level'
-
-def analyze_brand_prices_by_subcategory(df: pd.DataFrame, white_brands: set, price_col: str, main_category_prefix: str, separator: str):
+def classify_brands(brands: pd.Series, white_brands: WhiteLabelMatcher, tags: pd.Series = None,
+                    fingerprints: pd.Series = None) -> pd.Series:
     """
-    Analyzes prices and counts grouping by the first-level subcategory
-    within the pre-filtered DataFrame.
+    Vectorized white-label classification on a categorical brand column: each distinct brand is
+    matched once and the result is broadcast through the category codes. Rows whose isWhiteLabel
+    tag (tags) was set by the scraper from the current list (fingerprints, see
+    WhiteLabelMatcher.fingerprint) keep it and are not classified at all.
+    Returns a categorical 'White-Label' / 'Non-White-Label' series.
     """
-    if df.empty or white_brands is None:
-        logging.warning("Input DataFrame for subcategory analysis is empty or white brands set is missing.")
-        return None
+    is_white = np.zeros(len(brands), dtype=bool)
+    untagged = np.ones(len(brands), dtype=bool)
+    if tags is not None and fingerprints is not None:
+        # bool, 0/1 (catalog database) or missing for records written before the tag existed
+        numeric = pd.to_numeric(tags, errors='coerce').to_numpy(dtype=float)
+        untagged = np.isnan(numeric) | (fingerprints.to_numpy(dtype=object) != white_brands.fingerprint)
+        is_white[~untagged] = numeric[~untagged] > 0
+    if untagged.any():
+        categorical = brands[untagged].astype(object).where(brands[untagged].notna(), None).astype('category')
+        matched = np.fromiter((brand in white_brands for brand in categorical.cat.categories), dtype=bool,
+                              count=len(categorical.cat.categories))
+        codes = categorical.cat.codes.to_numpy()
+        # Code -1: missing brand, never white-label
+        is_white[untagged] = np.append(matched, False)[codes]
+    return pd.Series(
+        pd.Categorical(np.where(is_white, BRAND_TYPES[0], BRAND_TYPES[1]), categories=BRAND_TYPES),
+        index=brands.index
+    )
 
-    # --- Data Cleaning & Preparation ---
-    required_cols = ['brand', 'categoryInSupermarket', price_col]
-    if not all(col in df.columns for col in required_cols):
-        missing = [col for col in required_cols if col not in df.columns]
-        logging.error(f"Missing required columns in filtered DataFrame: {missing}")
-        return None
+def prepare_brand_price_frame(df: pd.DataFrame, white_brands: WhiteLabelMatcher, price_col: str, separator: str) -> pd.DataFrame:
+    """
+    Builds the narrow (main_category, first_subcategory, brand_type, price) frame the aggregations run on.
+    Rows without a first-level subcategory or without a positive price are dropped.
+    Category levels already present in df (see load_merged_category_frame) are reused as they are.
+    """
+    if set(GROUP_LEVELS) <= set(df.columns):
+        prepared = df[GROUP_LEVELS].copy()
+    else:
+        prepared = split_category_levels(df['categoryInSupermarket'], separator)
+    prepared['brand_type'] = classify_brands(
+        df['brand'], white_brands, df.get('isWhiteLabel'), df.get('whiteLabelFingerprint')
+    )
+    prepared['price'] = pd.to_numeric(df[price_col], errors='coerce')
+    valid = prepared['first_subcategory'].notna() & (prepared['price'] > 0)
+    return prepared[valid]
 
-    df_analysis = df.copy()
+GROUP_LEVELS = ['main_category', 'first_subcategory']
 
-    # 1. Extract First-Level Subcategory
-    df_analysis['first_subcategory'] = df_analysis['categoryInSupermarket'].apply(
-        lambda x: extract_first_subcategory(x, main_category_prefix, separator)
-    )
-    # Remove rows where subcategory couldn't be extracted or is empty/None
-    df_analysis = df_analysis.dropna(subset=['first_subcategory'])
-    df_analysis = df_analysis[df_analysis['first_subcategory'] != '']
+def quantile_column(brand_type: str, q: float) -> str:
+    """Result column name for a price quantile, e.g. ('White-Label', 0.5) -> 'White-Label_p50'."""
+    return f"{brand_type}_p{q * 100:g}"
 
-    if df_analysis.empty:
-        logging.warning(f"No products found with a valid first-level subcategory after '{main_category_prefix}'.")
-        return None
+def quantile_from_counts(value_counts: Counter, q: float) -> float:
+    """
+    Linear-interpolated quantile (same definition as pandas/numpy 'linear')
+    computed from a {value: occurrences} table instead of the raw values.
+    """
+    total = sum(value_counts.values())
+    position = q * (total - 1)
+    lower_rank = int(position)
+    fraction = position - lower_rank
+
+    lower = upper = None
+    seen = 0
+    for value in sorted(value_counts):
+        seen += value_counts[value]
+        if lower is None and seen > lower_rank:
+            lower = value
+        if seen > lower_rank + 1 or seen == total:
+            upper = value
+            break
+    return lower + (upper - lower) * fraction
+
+class BrandPriceAccumulator:
+    """
+    Running per-(main_category, first_subcategory, brand_type) price aggregates.
 
-    # 2. Clean brand names
-    df_analysis['brand'] = df_analysis['brand'].fillna('UNKNOWN').astype(str).str.strip().str.upper()
+    Batches are added one at a time and only the aggregates are kept, so memory does not grow with the
+    number of products. Price sums are kept exact (integers scaled by a power of two), which makes the
+    result independent of how the products were split into batches: the in-memory analysis is simply
+    the one-batch case. With quantiles, each group also keeps a {price: occurrences} table.
+    """
 
-    # 3. Classify brands
-    df_analysis['is_white_label'] = df_analysis['brand'].apply(lambda x: x in white_brands)
-    df_analysis['brand_type'] = df_analysis['is_white_label'].apply(lambda x: 'White-Label' if x else 'Non-White-Label')
+    def __init__(self, quantiles: list = None):
+        self.quantiles = list(quantiles or [])
+        self.sums = {}    # group -> (integer sum, power of two exponent)
+        self.counts = Counter()
+        self.value_counts = defaultdict(Counter)
+
+    def add(self, prepared: pd.DataFrame) -> None:
+        """Adds one batch shaped like prepare_brand_price_frame's output."""
+        if prepared.empty:
+            return
+        # price == mantissa * 2**exponent with an integer mantissa of 53 bits
+        mantissas, exponents = np.frexp(prepared['price'].to_numpy(dtype=float))
+        base_exponent = int(exponents.min()) - 53
+        scaled = (mantissas * 2.0 ** 53).astype(np.int64).astype(object) << (exponents - exponents.min()).astype(object)
+
+        keys = [prepared[level] for level in GROUP_LEVELS] + [prepared['brand_type'].astype(str)]
+        grouped = pd.Series(scaled, index=prepared.index).groupby(keys)
+        for group, int_sum in grouped.sum().items():
+            self._add_sum(group, int_sum, base_exponent)
+        self.counts.update(grouped.size().to_dict())
+
+        if self.quantiles:
+            price_counts = prepared.groupby(keys + [prepared['price']]).size()
+            for (*group, price), occurrences in price_counts.items():
+                self.value_counts[tuple(group)][price] += occurrences
+
+    def _add_sum(self, group: tuple, int_sum: int, exponent: int) -> None:
+        if group not in self.sums:
+            self.sums[group] = (int_sum, exponent)
+            return
+        current_sum, current_exponent = self.sums[group]
+        common = min(current_exponent, exponent)
+        self.sums[group] = ((current_sum << (current_exponent - common)) + (int_sum << (exponent - common)), common)
+
+    def _mean(self, group: tuple) -> float:
+        int_sum, exponent = self.sums[group]
+        numerator, denominator = int_sum, self.counts[group]
+        if exponent >= 0:
+            numerator <<= exponent
+        else:
+            denominator <<= -exponent
+        return numerator / denominator  # int / int is correctly rounded
+
+    def result(self) -> pd.DataFrame:
+        """
+        Returns the wide result table indexed by (main_category, first_subcategory): mean price and product
+        count per brand type, the total count and, if requested, the price quantiles per brand type.
+        """
+        groups = sorted(self.counts)
+        index = pd.MultiIndex.from_tuples(groups, names=GROUP_LEVELS + ['brand_type'])
+        stats = pd.DataFrame({
+            'price': [self._mean(group) for group in groups],
+            'count': [self.counts[group] for group in groups],
+        }, index=index)
+        for q in self.quantiles:
+            stats[q] = [quantile_from_counts(self.value_counts[group], q) for group in groups]
+
+        wide = stats.unstack('brand_type')
+        combined = pd.DataFrame(index=wide.index)
+        for brand_type in BRAND_TYPES:
+            combined[f'{brand_type}_price'] = wide['price'].get(brand_type, np.nan)
+        for brand_type in BRAND_TYPES:
+            combined[f'{brand_type}_count'] = wide['count'].get(brand_type, 0)
+        combined[[f'{t}_count' for t in BRAND_TYPES]] = combined[[f'{t}_count' for t in BRAND_TYPES]].fillna(0).astype(int)
+        combined['total_count'] = combined['White-Label_count'] + combined['Non-White-Label_count']
+        for q in self.quantiles:
+            for brand_type in BRAND_TYPES:
+                combined[quantile_column(brand_type, q)] = wide[q].get(brand_type, np.nan)
+        return combined
+
+def aggregate_brand_prices(prepared: pd.DataFrame, quantiles: list = None) -> pd.DataFrame:
+    """
+    Single groupby pass over every main category at once.
+    Returns the result table indexed by (main_category, first_subcategory).
+    """
+    accumulator = BrandPriceAccumulator(quantiles)
+    accumulator.add(prepared)
+    return accumulator.result()
 
-    # 4. Clean price column
-    df_analysis[price_col] = pd.to_numeric(df_analysis[price_col], errors='coerce')
-    df_cleaned = df_analysis.dropna(subset=[price_col])
-    df_cleaned = df_cleaned[df_cleaned[price_col] > 0]
+def _has_required_columns(df: pd.DataFrame, price_col: str) -> bool:
+    required_cols = ['brand', 'categoryInSupermarket', price_col]
+    missing = [col for col in required_cols if col not in df.columns]
+    if missing:
+        logging.error(f"Missing required columns in DataFrame: {missing}")
+        return False
+    return True
 
-    if df_cleaned.empty:
-        logging.warning(f"No products with valid '{price_col}' found after cleaning within the filtered subcategories.")
+def analyze_brand_prices_all_categories(df: pd.DataFrame, white_brands: WhiteLabelMatcher, price_col: str, separator: str, quantiles: list = None):
+    """
+    Analyzes prices and counts for every main category in one pass, grouping by the
+    first-level subcategory. Returns a table indexed by (main_category, first_subcategory).
+    """
+    if df.empty or white_brands is None:
+        logging.warning("Input DataFrame for subcategory analysis is empty or white brands set is missing.")
+        return None
+    if not _has_required_columns(df, price_col):
         return None
 
-    logging.info(f"Analyzing {len(df_cleaned)} products grouped by first-level subcategory.")
+    prepared = prepare_brand_price_frame(df, white_brands, price_col, separator)
+    if prepared.empty:
+        logging.warning(f"No products with a first-level subcategory and a valid '{price_col}' found.")
+        return None
 
-    # --- Aggregation (by extracted first_subcategory) ---
-    analysis = df_cleaned.groupby(['first_subcategory', 'brand_type']).agg(
-        mean_price=(price_col, 'mean'),
-        product_count=(price_col, 'size')
-    ).reset_index()
+    logging.info(f"Analyzing {len(prepared)} products grouped by main category and first-level subcategory.")
+    analysis = aggregate_brand_prices(prepared, quantiles)
+    logging.info("Analysis by first-level subcategory complete.")
+    return analysis
 
-    # --- Pivot ---
-    price_pivot = analysis.pivot(index='first_subcategory', columns='brand_type', values='mean_price')
-    count_pivot = analysis.pivot(index='first_subcategory', columns='brand_type', values='product_count')
+def analyze_brand_prices_chunked(folder_path: str, white_brands: WhiteLabelMatcher, price_col: str, separator: str,
+                                 batch_size: int = CHUNK_SIZE, quantiles: list = None):
+    """
+    Out-of-core variant of analyze_brand_prices_all_categories: streams the products in batches of
+    batch_size and only keeps running aggregates. Produces the same table as the in-memory path.
+    """
+    if not white_brands:
+        logging.warning("White brands set is missing.")
+        return None
 
-    # --- Combine and Calculate Total Count ---
-    all_first_subcategories = df_cleaned['first_subcategory'].unique()
-    combined_analysis = pd.DataFrame(index=all_first_subcategories)
-    combined_analysis = combined_analysis.join(price_pivot).join(count_pivot, lsuffix='_price', rsuffix='_count')
+    accumulator = BrandPriceAccumulator(quantiles)
+    columns = ['brand', 'isWhiteLabel', 'whiteLabelFingerprint', 'categoryInSupermarket', price_col]
+    analyzed = 0
+    for batch in iter_product_batches(folder_path, batch_size, columns):
+        prepared = prepare_brand_price_frame(batch, white_brands, price_col, separator)
+        accumulator.add(prepared)
+        analyzed += len(prepared)
 
-    combined_analysis.columns = ['White-Label_price', 'Non-White-Label_price', 'White-Label_count', 'Non-White-Label_count']
-    combined_analysis[['White-Label_count', 'Non-White-Label_count']] = combined_analysis[['White-Label_count', 'Non-White-Label_count']].fillna(0).astype(int)
-    combined_analysis['total_count'] = combined_analysis['White-Label_count'] + combined_analysis['Non-White-Label_count']
+    if not analyzed:
+        logging.warning(f"No products with a first-level subcategory and a valid '{price_col}' found.")
+        return None
+    logging.info(f"Analyzed {analyzed} products in batches of {batch_size}.")
+    return accumulator.result()
 
-    logging.info("Analysis by first-level subcategory complete.")
-    return combined_analysis
+def analyze_brand_prices_by_subcategory(df: pd.DataFrame, white_brands: WhiteLabelMatcher, price_col: str, main_category_prefix: str, separator: str, quantiles: list = None):
+    """
+    Analyzes prices and counts grouping by the first-level subcategory
+    within the given main category.
+    """
+    analysis = analyze_brand_prices_all_categories(df, white_brands, price_col, separator, quantiles)
+    if analysis is None:
+        return None
+    if main_category_prefix not in analysis.index.get_level_values('main_category'):
+        logging.warning(f"No products found with a valid first-level subcategory after '{main_category_prefix}'.")
+        return None
+    return analysis.xs(main_category_prefix, level='main_category')
 
-def plot_comparison(analysis_df: pd.DataFrame, value_col_prefix: str, title: str, ylabel: str, xlabel:str):
-    """Generates a grouped bar chart for the provided DataFrame (assumed to be top N)."""
+def plot_comparison(analysis_df: pd.DataFrame, value_col_prefix: str, title: str, ylabel: str, xlabel:str, output_path: str = None):
+    """
+    Generates a grouped bar chart for the provided DataFrame (assumed to be top N).
+    Shows it interactively, or saves it to output_path when one is given (headless mode).
+    matplotlib is only imported here, so runs that draw nothing do not pay for it.
+    """
     if analysis_df is None or analysis_df.empty:
         logging.warning(f"No data to plot for '{title}'.")
         return
 
+    import matplotlib
+    if output_path:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     # Sort by total count for better visualization of top categories
     plot_data = analysis_df.sort_values('total_count', ascending=False).copy()
 
@@ -175,72 +332,135 @@ def plot_comparison(analysis_df: pd.DataFrame, value_col_prefix: str, title: str
     plt.legend(title='Brand Type')
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
-    plt.show()
+    if output_path:
+        plt.savefig(output_path)
+        plt.close(ax.figure)
+        logging.info(f"Saved chart to {output_path}")
+    else:
+        plt.show()
 
+def _safe_file_name(name: str) -> str:
+    """Turns a category name into a file-system friendly name."""
+    return "".join(c if c.isalnum() else "_" for c in name).strip("_") or "category"
 
-# --- Main Execution ---
-if __name__ == "__main__":
-    product_df_full = load_product_data(JSONL_FOLDER)
-    white_brands_set = load_white_label_brands(WHITE_LABEL_FILE)
+def report_main_category(analysis: pd.DataFrame, main_category: str, top_n: int, price_col: str, output_dir: str = None):
+    """
+    Plots the top N subcategories of one main category.
+    In headless mode (output_dir given) also writes the full result table as CSV next to the charts.
+    """
+    top_n_subcategories_df = analysis.nlargest(top_n, 'total_count')
+    if top_n_subcategories_df.empty:
+        logging.warning(f"No valid first-level sub-categories found within '{main_category}' after analysis, cannot select top {top_n}.")
+        return
 
-    if not product_df_full.empty and white_brands_set:
+    num_selected = len(top_n_subcategories_df)
+    logging.info(f"Selected top {num_selected} most populated first-level sub-categories within '{main_category}' for plotting.")
+    plot_xlabel = f"First-Level Subcategory within {main_category}"
+
+    price_chart = count_chart = None
+    if output_dir:
+        base_name = os.path.join(output_dir, _safe_file_name(main_category))
+        analysis.to_csv(f"{base_name}.csv", sep=';', encoding='utf-8')
+        price_chart, count_chart = f"{base_name}_price.png", f"{base_name}_count.png"
+
+    plot_comparison(
+        top_n_subcategories_df,
+        value_col_prefix='_price',
+        title=f'Mean {price_col} (Top {num_selected} Sub-Cats in {main_category}): White-Label vs. Non-White-Label',
+        ylabel=f'Mean {price_col} (€)',
+        xlabel=plot_xlabel,
+        output_path=price_chart
+    )
 
-        # --- Filter for TARGET_MAIN_CATEGORY_PREFIX ---
-        if 'categoryInSupermarket' not in product_df_full.columns:
-             logging.error("Column 'categoryInSupermarket' not found. Cannot filter.")
-             product_df_target_main = pd.DataFrame()
-        else:
-            # Ensure case-sensitive match if needed, otherwise use .str.lower() on both sides
-            product_df_full['categoryInSupermarket_clean'] = product_df_full['categoryInSupermarket'].fillna('').astype(str).str.strip()
-            # Using TARGET_MAIN_CATEGORY_PREFIX directly for case-sensitivity as in example
-            target_filter = product_df_full['categoryInSupermarket_clean'].str.startswith(TARGET_MAIN_CATEGORY_PREFIX + CATEGORY_SEPARATOR, na=False) \
-                            | (product_df_full['categoryInSupermarket_clean'] == TARGET_MAIN_CATEGORY_PREFIX) # Include if it's exactly the main category
-            product_df_target_main = product_df_full[target_filter].copy()
-            logging.info(f"Filtered down to {len(product_df_target_main)} products potentially in categories starting with '{TARGET_MAIN_CATEGORY_PREFIX}'.")
-
-        # --- Proceed only if we have products in the target main category ---
-        if not product_df_target_main.empty:
-            # Analyze these products, grouping by the *first subcategory*
-            analysis_results_subcat = analyze_brand_prices_by_subcategory(
-                product_df_target_main,
+    plot_comparison(
+        top_n_subcategories_df,
+        value_col_prefix='_count',
+        title=f'Product Count (Top {num_selected} Sub-Cats in {main_category}): White-Label vs. Non-White-Label',
+        ylabel='Number of Products',
+        xlabel=plot_xlabel,
+        output_path=count_chart
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="White-label vs. non-white-label price analysis by subcategory.")
+    parser.add_argument("--all-categories", action="store_true",
+                        help=f"Analyze every main category instead of only '{TARGET_MAIN_CATEGORY_PREFIX}'.")
+    parser.add_argument("--category", default=TARGET_MAIN_CATEGORY_PREFIX,
+                        help="Main category to analyze when --all-categories is not set.")
+    parser.add_argument("--output-dir", default=None,
+                        help="Headless mode: write result tables (CSV) and charts (PNG) here instead of showing them.")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Stream products in batches instead of loading the whole catalog in memory.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="Products per batch in --chunked mode.")
+    parser.add_argument("--catalog", default=None,
+                        help="Read the products from this catalog database (catalog_store.py) instead of JSONL_FOLDER.")
+    parser.add_argument("--merged", default=None,
+                        help="Read the products from this merged JSONL (merge_jsonl.py), selecting categories "
+                             "through its category tree.")
+    parser.add_argument("--quantiles", type=float, nargs="*", default=[],
+                        help="Also report these price quantiles per brand type, e.g. --quantiles 0.25 0.5 0.75.")
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    args = parse_args()
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    with maybe_profile("brand_price", args):
+        white_brands_set = load_white_label_brands(WHITE_LABEL_FILE)
+        source = args.catalog or JSONL_FOLDER
+        if args.chunked:
+            analysis_all = analyze_brand_prices_chunked(
+                source,
                 white_brands_set,
                 PRICE_COLUMN,
-                TARGET_MAIN_CATEGORY_PREFIX,
-                CATEGORY_SEPARATOR
+                CATEGORY_SEPARATOR,
+                args.chunk_size,
+                args.quantiles
+            )
+        elif args.merged:
+            product_df_full = load_merged_category_frame(
+                args.merged, PRICE_COLUMN, None if args.all_categories else args.category
             )
+            analysis_all = analyze_brand_prices_all_categories(
+                product_df_full,
+                white_brands_set,
+                PRICE_COLUMN,
+                CATEGORY_SEPARATOR,
+                args.quantiles
+            ) if not product_df_full.empty and white_brands_set else None
+        else:
+            product_df_full = load_product_data(source)
+            analysis_all = analyze_brand_prices_all_categories(
+                product_df_full,
+                white_brands_set,
+                PRICE_COLUMN,
+                CATEGORY_SEPARATOR,
+                args.quantiles
+            ) if not product_df_full.empty and white_brands_set else None
 
-            if analysis_results_subcat is not None and not analysis_results_subcat.empty:
-
-                # --- Select Top N First-Level Sub-Categories ---
-                top_n_subcategories_df = analysis_results_subcat.nlargest(TOP_N_SUBCATEGORIES, 'total_count')
-
-                if top_n_subcategories_df.empty:
-                    logging.warning(f"No valid first-level sub-categories found within '{TARGET_MAIN_CATEGORY_PREFIX}' after analysis, cannot select top {TOP_N_SUBCATEGORIES}.")
-                else:
-                    num_selected = len(top_n_subcategories_df)
-                    logging.info(f"Selected top {num_selected} most populated first-level sub-categories within '{TARGET_MAIN_CATEGORY_PREFIX}' for plotting.")
-                    plot_xlabel = f"First-Level Subcategory within {TARGET_MAIN_CATEGORY_PREFIX}"
-
-
-                    # --- Plotting using the filtered top N subcategory data ---
-                    plot_comparison(
-                        top_n_subcategories_df,
-                        value_col_prefix='_price',
-                        title=f'Mean {PRICE_COLUMN} (Top {num_selected} Sub-Cats in {TARGET_MAIN_CATEGORY_PREFIX}): White-Label vs. Non-White-Label',
-                        ylabel=f'Mean {PRICE_COLUMN} (€)',
-                        xlabel=plot_xlabel
-                    )
-
-                    plot_comparison(
-                        top_n_subcategories_df,
-                        value_col_prefix='_count',
-                        title=f'Product Count (Top {num_selected} Sub-Cats in {TARGET_MAIN_CATEGORY_PREFIX}): White-Label vs. Non-White-Label',
-                        ylabel='Number of Products',
-                        xlabel=plot_xlabel
-                    )
-            else:
-                logging.warning(f"Analysis by first-level subcategory within '{TARGET_MAIN_CATEGORY_PREFIX}' did not produce results suitable for plotting.")
+        if analysis_all is None or analysis_all.empty:
+            logging.warning("Analysis by first-level subcategory did not produce results suitable for plotting.")
         else:
-            logging.warning(f"No products found belonging to categories starting with '{TARGET_MAIN_CATEGORY_PREFIX}'. Cannot perform analysis.")
-    else:
-        print("Could not load product data or white label brands. Exiting analysis.")
\ No newline at end of file
+            if args.output_dir:
+                summary_path = os.path.join(args.output_dir, "brand_price_by_subcategory.csv")
+                analysis_all.to_csv(summary_path, sep=';', encoding='utf-8')
+                logging.info(f"Saved result table to {summary_path}")
+
+            available = analysis_all.index.get_level_values('main_category').unique()
+            main_categories = list(available) if args.all_categories else [args.category]
+            for main_category in main_categories:
+                if main_category not in available:
+                    logging.warning(f"No products found belonging to categories starting with '{main_category}'. Cannot perform analysis.")
+                    continue
+                report_main_category(
+                    analysis_all.xs(main_category, level='main_category'),
+                    main_category,
+                    TOP_N_SUBCATEGORIES,
+                    PRICE_COLUMN,
+                    args.output_dir
+                )
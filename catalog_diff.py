@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import time
+import heapq
+import logging
+import argparse
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import json_codec
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+KEY_FIELD = "productIdInSupermarket"
+# Fields compared by default: the price fields of the scraper plus the promotion
+DIFF_FIELDS = ["priceWithTax", "price", "unitPrice", "unitPriceWithOffer", "offerPrice", "kgGross",
+               "promotion", "percentPromotion"]
+RUN_SIZE = 100000  # Records sorted in memory per run file
+
+
+def iter_input_lines(path: str) -> Iterator[bytes]:
+    """
+    The JSON lines of a crawl output: a merged JSONL file, or a folder of .jsonl files
+    (the per-product outputs or shards), read in file name order.
+    """
+    paths = [path] if os.path.isfile(path) else [
+        os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".jsonl")
+    ]
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            for line in f:
+                line = line.rstrip(b"\r\n")
+                if line.strip():
+                    yield line
+
+
+def _write_run(run: List[Tuple[str, bytes]], directory: str, number: int) -> str:
+    run.sort(key=lambda entry: entry[0])
+    path = os.path.join(directory, f"run_{number:05d}.tsv")
+    with open(path, "wb") as f:
+        for key, line in run:
+            f.write(json_codec.dumps_bytes(key) + b"\t" + line + b"\n")
+    return path
+
+
+def _read_run(path: str) -> Iterator[Tuple[str, bytes]]:
+    with open(path, "rb") as f:
+        for entry in f:
+            key, line = entry.rstrip(b"\n").split(b"\t", 1)
+            yield json_codec.loads(key), line
+
+
+def external_sort(path: str, directory: str, run_size: int = RUN_SIZE) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (product ID, JSON line) sorted by product ID, holding at most run_size records in memory:
+    the input is cut into sorted run files, which are then merged. When a product ID occurs more
+    than once, only its last record (in input order) is kept. Records without ID are skipped.
+    """
+    runs, run = [], []
+    for line in iter_input_lines(path):
+        key = json_codec.loads(line).get(KEY_FIELD)
+        if not key:
+            continue
+        run.append((str(key), line))
+        if len(run) >= run_size:
+            runs.append(_write_run(run, directory, len(runs)))
+            run = []
+    if run:
+        runs.append(_write_run(run, directory, len(runs)))
+
+    # heapq.merge is stable: for equal keys, entries of earlier runs come first
+    previous = None
+    for entry in heapq.merge(*(_read_run(run_path) for run_path in runs), key=lambda entry: entry[0]):
+        if previous is not None and entry[0] != previous[0]:
+            yield previous
+        previous = entry
+    if previous is not None:
+        yield previous
+
+
+def field_deltas(old: Dict[str, Any], new: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    """{field: {"old", "new"[, "delta"]}} for every compared field that differs; numeric fields get a delta."""
+    deltas = {}
+    for field in fields if fields is not None else sorted(old.keys() | new.keys()):
+        before, after = old.get(field), new.get(field)
+        if before == after:
+            continue
+        delta = {"old": before, "new": after}
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (before, after)):
+            delta["delta"] = round(after - before, 6)
+        deltas[field] = delta
+    return deltas
+
+
+def diff_catalogs(old_path: str, new_path: str, output_path: str, fields: Optional[List[str]] = DIFF_FIELDS,
+                  run_size: int = RUN_SIZE) -> Dict[str, Any]:
+    """
+    Streaming merge-join of two crawl outputs sorted by product ID. Writes one JSONL change per
+    added, removed or changed product (fields=None compares every field) and returns the summary.
+    """
+    stats = {"old": 0, "new": 0, "added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as old_tmp, tempfile.TemporaryDirectory() as new_tmp, \
+            open(output_path, "w", encoding="utf-8") as out:
+        old_iter = external_sort(old_path, old_tmp, run_size)
+        new_iter = external_sort(new_path, new_tmp, run_size)
+        old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+
+        def emit(change: str, key: str, **extra: Any) -> None:
+            stats[change] += 1
+            out.write(json_codec.dumps({"change": change, KEY_FIELD: key, **extra}) + "\n")
+
+        while old_entry is not None or new_entry is not None:
+            if new_entry is None or (old_entry is not None and old_entry[0] < new_entry[0]):
+                stats["old"] += 1
+                emit("removed", old_entry[0])
+                old_entry = next(old_iter, None)
+            elif old_entry is None or new_entry[0] < old_entry[0]:
+                stats["new"] += 1
+                record = json_codec.loads(new_entry[1])
+                emit("added", new_entry[0], fields={field: record.get(field) for field in fields or record})
+                new_entry = next(new_iter, None)
+            else:
+                stats["old"] += 1
+                stats["new"] += 1
+                # Byte-identical lines cannot differ: skip decoding them
+                deltas = {} if old_entry[1] == new_entry[1] else field_deltas(
+                    json_codec.loads(old_entry[1]), json_codec.loads(new_entry[1]), fields
+                )
+                if deltas:
+                    emit("changed", new_entry[0], fields=deltas)
+                else:
+                    stats["unchanged"] += 1
+                old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["records_per_second"] = round((stats["old"] + stats["new"]) / elapsed) if elapsed else None
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff two crawl outputs: new, removed and re-priced products.")
+    parser.add_argument("old", help="Previous crawl: merged JSONL file or folder of .jsonl files.")
+    parser.add_argument("new", help="Current crawl: merged JSONL file or folder of .jsonl files.")
+    parser.add_argument("--output", default="changes.jsonl", help="Change set to write (JSONL).")
+    parser.add_argument("--fields", nargs="*", default=DIFF_FIELDS, help="Fields compared for changes.")
+    parser.add_argument("--all-fields", action="store_true", help="Compare every field instead of --fields.")
+    parser.add_argument("--run-size", type=int, default=RUN_SIZE, help="Records sorted in memory at a time.")
+    args = parser.parse_args()
+
+    summary = diff_catalogs(args.old, args.new, args.output, None if args.all_fields else args.fields, args.run_size)
+    logger.info(f"{summary['added']} added, {summary['removed']} removed, {summary['changed']} changed, "
+                f"{summary['unchanged']} unchanged ({summary['records_per_second']} records/sec) -> {args.output}")
+    sys.stdout.write(json_codec.dumps(summary) + "\n")
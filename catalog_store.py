@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterator, List, Optional
+
+import json_codec
+
+# Scalar product fields stored in typed columns (the full record is kept as JSON next to them)
+TEXT_FIELDS = [
+    "supermarket", "supermarketPostalCode", "currency", "country", "denomination", "brand",
+    "promotion", "units", "isWeightArticle", "categoryInSupermarket", "link", "whiteLabelFingerprint",
+]
+REAL_FIELDS = [
+    "priceWithTax", "price", "unitPrice", "unitPriceWithOffer", "offerPrice", "kgGross", "percentPromotion",
+]
+# Boolean tags stored as INTEGER 0/1 (NULL for records written before the tag existed)
+FLAG_FIELDS = ["isWhiteLabel"]
+# nutritionInformation keys (see Scraper._handle_nutrition), stored as <key> REAL and <key>Unit TEXT
+NUTRITION_FIELDS = [
+    "calories", "protein", "fat", "sugars", "carbohydrates", "fiber", "saturatedFattyAcids", "salt",
+]
+
+COLUMNS = (
+    ["productIdInSupermarket"] + TEXT_FIELDS + REAL_FIELDS + FLAG_FIELDS
+    + [column for key in NUTRITION_FIELDS for column in (key, f"{key}Unit")]
+    + ["record"]
+)
+
+
+def _to_real(value: Any) -> Optional[float]:
+    """Numbers (or numeric strings such as "1,5" or "<0.5") as float, anything else as None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", ".").lstrip("<> ").strip())
+    except ValueError:
+        return None
+
+
+def _to_flag(value: Any) -> Optional[int]:
+    return None if value is None else int(bool(value))
+
+
+def _to_text(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, str) else json_codec.dumps(value)
+
+
+class CatalogStore:
+    """
+    Current product catalog in SQLite, one row per productIdInSupermarket.
+
+    Records are upserted in batched transactions (WAL mode, so readers are never blocked by a
+    running crawl). Brand, category and unitPrice are indexed, price and nutrition values are
+    stored in typed columns, and the full record is kept as JSON so the JSONL outputs can be
+    reproduced from the store.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 500) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pending = []
+        self.conn = sqlite3.connect(db_path)
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        types = (
+            [(field, "TEXT") for field in TEXT_FIELDS]
+            + [(field, "REAL") for field in REAL_FIELDS]
+            + [(field, "INTEGER") for field in FLAG_FIELDS]
+            + [column for key in NUTRITION_FIELDS for column in ((key, "REAL"), (f"{key}Unit", "TEXT"))]
+        )
+        columns = ",\n".join(f'"{column}" {column_type}' for column, column_type in types)
+        self.conn.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS products (
+                productIdInSupermarket TEXT PRIMARY KEY,
+                {columns},
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_brand ON products (brand);
+            CREATE INDEX IF NOT EXISTS idx_products_category ON products (categoryInSupermarket);
+            CREATE INDEX IF NOT EXISTS idx_products_unit_price ON products (unitPrice);
+        """)
+        # Catalogs created before a column existed (e.g. the white-label tag) get it appended
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(products)")}
+        for column, column_type in types:
+            if column not in existing:
+                self.conn.execute(f'ALTER TABLE products ADD COLUMN "{column}" {column_type}')
+
+    @staticmethod
+    def _row(items: Dict[str, Any]) -> list:
+        row = [str(items["productIdInSupermarket"])]
+        row += [_to_text(items.get(field)) for field in TEXT_FIELDS]
+        row += [_to_real(items.get(field)) for field in REAL_FIELDS]
+        row += [_to_flag(items.get(field)) for field in FLAG_FIELDS]
+        nutrition = items.get("nutritionInformation")
+        nutrition = nutrition if isinstance(nutrition, dict) else {}
+        for key in NUTRITION_FIELDS:
+            entry = nutrition.get(key)
+            entry = entry if isinstance(entry, dict) else {}
+            row += [_to_real(entry.get("value")), _to_text(entry.get("unit"))]
+        row.append(json_codec.dumps(items))
+        return row
+
+    def upsert(self, items: Dict[str, Any]) -> None:
+        """Queue a product record (as written to JSONL); written with the next batch."""
+        if not items.get("productIdInSupermarket"):
+            return
+        self.pending.append(self._row(items))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        names = ", ".join(f'"{column}"' for column in COLUMNS)
+        updates = ", ".join(f'"{column}" = excluded."{column}"' for column in COLUMNS[1:])
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO products ({names}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT (productIdInSupermarket) DO UPDATE SET {updates}",
+                self.pending
+            )
+        self.pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self) -> "CatalogStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """The stored record of a product, or None."""
+        row = self.conn.execute(
+            "SELECT record FROM products WHERE productIdInSupermarket = ?", (product_id,)
+        ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def query(self, brand: Optional[str] = None, category_prefix: Optional[str] = None,
+              min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Records filtered by brand (exact), category (categoryInSupermarket equal to the prefix or one
+        of its subcategories) and unitPrice range (inclusive), all answered from the indexes.
+        """
+        where, params = [], []
+        if brand is not None:
+            where.append("brand = ?")
+            params.append(brand)
+        if category_prefix is not None:
+            # "/" + 1 == "0": the half-open range covers exactly the "<prefix>/..." strings
+            where.append("(categoryInSupermarket = ? OR (categoryInSupermarket >= ? AND categoryInSupermarket < ?))")
+            params += [category_prefix, category_prefix + "/", category_prefix + "0"]
+        if min_price is not None:
+            where.append("unitPrice >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            where.append("unitPrice <= ?")
+            params.append(max_price)
+        sql = "SELECT record FROM products" + (" WHERE " + " AND ".join(where) if where else "")
+        return [json_codec.loads(row[0]) for row in self.conn.execute(sql + " ORDER BY productIdInSupermarket", params)]
+
+
+def iter_catalog_records(db_path: str) -> Iterator[Dict[str, Any]]:
+    """Yields every stored record (read-only, ordered by product ID)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for (record,) in conn.execute("SELECT record FROM products ORDER BY productIdInSupermarket"):
+            yield json_codec.loads(record)
+    finally:
+        conn.close()
+
+
+def iter_catalog_batches(db_path: str, batch_size: int, columns: Optional[List[str]] = None) -> Iterator[list]:
+    """
+    Yields lists of at most batch_size records. If every requested column is a typed column,
+    only those columns are read and the JSON records are not decoded at all.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if columns is not None and set(columns) <= set(COLUMNS[:-1]):
+            select = ", ".join(f'"{column}"' for column in columns)
+            cursor = conn.execute(f"SELECT {select} FROM products ORDER BY productIdInSupermarket")
+            decode = lambda row: dict(zip(columns, row))
+        else:
+            cursor = conn.execute("SELECT record FROM products ORDER BY productIdInSupermarket")
+            decode = lambda row: json_codec.loads(row[0])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [decode(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def ingest_folder(store: CatalogStore, folder_path: str) -> int:
+    """Backfill: upsert every record of a JSONL output folder. Returns the number of records."""
+    count = 0
+    for file_name in os.listdir(folder_path):
+        if file_name.endswith(".jsonl"):
+            for record in json_codec.iter_jsonl(os.path.join(folder_path, file_name)):
+                store.upsert(record)
+                count += 1
+    store.flush()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the SQLite product catalog.")
+    parser.add_argument("database", help="Path to the catalog SQLite file.")
+    parser.add_argument("--ingest", metavar="FOLDER", help="Upsert every record of a JSONL output folder.")
+    parser.add_argument("--product", help="productIdInSupermarket to look up.")
+    parser.add_argument("--brand", help="Exact brand.")
+    parser.add_argument("--category", help="Category prefix, e.g. 'Frescos/Carne'.")
+    parser.add_argument("--min-price", type=float, help="Minimum unitPrice.")
+    parser.add_argument("--max-price", type=float, help="Maximum unitPrice.")
+    args = parser.parse_args()
+
+    with CatalogStore(args.database) as store:
+        if args.ingest:
+            print(f"Stored {ingest_folder(store, args.ingest)} records from {args.ingest}")
+        elif args.product:
+            record = store.get(args.product)
+            if record:
+                sys.stdout.write(json_codec.dumps(record) + "\n")
+        else:
+            for record in store.query(args.brand, args.category, args.min_price, args.max_price):
+                sys.stdout.write(json_codec.dumps(record) + "\n")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import json_codec
+
+CATEGORY_SEPARATOR = "/"
+
+
+def category_path(category: Any, separator: str = CATEGORY_SEPARATOR) -> Tuple[str, ...]:
+    """
+    Splits a categoryInSupermarket string into its levels, e.g.
+    'Alimentación general/Quesos/Frescos' -> ('Alimentación general', 'Quesos', 'Frescos').
+    Levels are stripped; the path stops at the first empty level (as in brand_price.split_category_levels).
+    """
+    if not isinstance(category, str):
+        return ()
+    path = []
+    for part in category.split(separator):
+        part = part.strip()
+        if not part:
+            break
+        path.append(part)
+    return tuple(path)
+
+
+def sort_key(category: Any) -> tuple:
+    """Merge order: by category path, products without a category last."""
+    path = category_path(category)
+    return (0, path) if path else (1, path)
+
+
+def tree_path_for(jsonl_path: str) -> str:
+    return os.path.splitext(jsonl_path)[0] + ".categories.json"
+
+
+class CategoryNode:
+    """
+    A category and the contiguous rows (and bytes) of the merged file its subtree covers.
+    Rows of products whose path ends at this node come first, then each child's range.
+    """
+
+    __slots__ = ("name", "start", "end", "byte_start", "byte_end", "children")
+
+    def __init__(self, name: Optional[str], start: int, byte_start: int) -> None:
+        self.name = name
+        self.start = self.end = start
+        self.byte_start = self.byte_end = byte_start
+        self.children = {}
+
+    @property
+    def rows(self) -> range:
+        return range(self.start, self.end)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "rows": [self.start, self.end],
+            "bytes": [self.byte_start, self.byte_end],
+            "children": [child.to_json() for child in self.children.values()],
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "CategoryNode":
+        node = cls(data["name"], data["rows"][0], data["bytes"][0])
+        node.end, node.byte_end = data["rows"][1], data["bytes"][1]
+        for child in data["children"]:
+            node.children[child["name"]] = cls.from_json(child)
+        return node
+
+
+class CategoryTree:
+    """
+    Category trie of a merged JSONL file whose rows are sorted by category path (see
+    merged_catalog.write_merged_jsonl). Each node maps to a row range, so selecting a
+    subtree or grouping by any level is a walk over the nodes, with no string parsing.
+    """
+
+    def __init__(self, root: Optional[CategoryNode] = None) -> None:
+        self.root = root or CategoryNode(None, 0, 0)
+
+    def add(self, path: Tuple[str, ...], row: int, byte_start: int, byte_end: int) -> None:
+        """Appends the next row of the merged file; rows must arrive in category order."""
+        node = self.root
+        node.end, node.byte_end = row + 1, byte_end
+        for name in path:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = CategoryNode(name, row, byte_start)
+            elif child.end != row:
+                raise ValueError(f"Rows of category {'/'.join(path)} are not contiguous; sort by category first.")
+            child.end, child.byte_end = row + 1, byte_end
+            node = child
+
+    def node(self, path: Iterable[str]) -> Optional[CategoryNode]:
+        """The node of a category path (tuple of levels or 'a/b' string), or None."""
+        if isinstance(path, str):
+            path = category_path(path)
+        node = self.root
+        for name in path:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def groups(self, depth: int, within: Iterable[str] = ()) -> Iterator[Tuple[Tuple[str, ...], CategoryNode]]:
+        """
+        Yields (path, node) for every category at the given depth (1 = main categories) below
+        the category `within`, in row order.
+        """
+        if isinstance(within, str):
+            within = category_path(within)
+        within = tuple(within)
+        start = self.node(within)
+        if start is None or depth < len(within):
+            return
+        level = [(within, start)]
+        for _ in range(depth - len(within)):
+            level = [(path + (name,), child) for path, node in level for name, child in node.children.items()]
+        yield from level
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp"
+        json_codec.dump_file(self.root.to_json(), tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryTree":
+        return cls(CategoryNode.from_json(json_codec.load_file(path)))
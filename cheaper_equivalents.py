@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import sys
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import configparser
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+import json_codec
+import product_snapshot
+from cosine_similarity import NUTRITION_FEATURES, extract_nutrition_vector
+
+logger = logging.getLogger(__name__)
+
+# Similarities are rounded before ranking, so that a product ranked alone (incremental
+# refresh) and in a block of the whole catalog (full build) get exactly the same scores
+SIMILARITY_DECIMALS = 6
+
+
+def comparable_products(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Products that can be compared: a positive unitPrice, a measuringUnit.unit and some nutrition
+    data. Columns productId, denomination, brand, unit, unitPrice, fingerprint and vector (the
+    nutrition vector normalized to length 1), sorted by (unit, unitPrice, productId).
+    """
+    if df.empty or 'productIdInSupermarket' not in df.columns:
+        return pd.DataFrame(columns=["productId", "denomination", "brand", "unit", "unitPrice", "fingerprint", "vector"])
+    columns = {
+        "productId": df['productIdInSupermarket'].astype(str),
+        "denomination": df['denomination'] if 'denomination' in df.columns else None,
+        "brand": df['brand'] if 'brand' in df.columns else None,
+        "unit": df['measuringUnit'].map(
+            lambda unit: str(unit.get('unit') or '').strip().upper() if isinstance(unit, dict) else ''
+        ) if 'measuringUnit' in df.columns else '',
+        "unitPrice": pd.to_numeric(df['unitPrice'], errors='coerce') if 'unitPrice' in df.columns else np.nan,
+    }
+    products = pd.DataFrame(columns).reset_index(drop=True)
+    vectors = np.zeros((len(df), len(NUTRITION_FEATURES)))
+    if 'nutritionInformation' in df.columns:
+        vectors = np.array(
+            [extract_nutrition_vector(info, NUTRITION_FEATURES) for info in df['nutritionInformation']], dtype=float
+        ).reshape(len(df), len(NUTRITION_FEATURES))
+    norms = np.linalg.norm(vectors, axis=1)
+
+    keep = ((products['unitPrice'] > 0) & (products['unit'] != '') & (norms > 0)).to_numpy()
+    products, vectors, norms = products[keep].copy(), vectors[keep], norms[keep]
+    products['fingerprint'] = [
+        hashlib.blake2b(f"{unit}|{price!r}|".encode("utf-8") + vector.tobytes(), digest_size=8).hexdigest()
+        for unit, price, vector in zip(products['unit'], products['unitPrice'], vectors)
+    ]
+    products['vector'] = list(vectors / norms[:, np.newaxis])
+    products = products.drop_duplicates('productId', keep='last')
+    return products.sort_values(['unit', 'unitPrice', 'productId']).reset_index(drop=True)
+
+
+def cheaper_neighbours(vectors: np.ndarray, prices: np.ndarray, rows: np.ndarray, top_n: int,
+                       min_similarity: float, block_size: int) -> Iterator[Tuple[int, List[Tuple[int, float]]]]:
+    """
+    For each row of rows, the top_n most similar products with a strictly lower price, as
+    (row, [(row of the alternative, similarity)]). vectors (normalized) and prices are those
+    of one unit group sorted by (price, productId), so the cheaper products of a row are the
+    rows before its price: each block of rows is only multiplied with the rows cheaper than
+    its most expensive product, one tile of block_size columns at a time, keeping a running
+    top_n per row (memory stays block_size x block_size whatever the group size). Ties are
+    broken by (price, productId).
+    """
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        cuts = np.searchsorted(prices, prices[block], side='left')
+        width = int(cuts.max()) if len(block) else 0
+        best_sims = np.full((len(block), top_n), -np.inf)
+        best_columns = np.zeros((len(block), top_n), dtype=np.int64)
+        for tile_start in range(0, width, block_size):
+            columns = np.arange(tile_start, min(tile_start + block_size, width))
+            sims = np.round(vectors[block] @ vectors[columns].T, SIMILARITY_DECIMALS)
+            sims[(columns[np.newaxis, :] >= cuts[:, np.newaxis]) | (sims < min_similarity)] = -np.inf
+            # Merge the tile into the running top_n: best similarity first, then lowest row
+            merged_sims = np.hstack([best_sims, sims])
+            merged_columns = np.hstack([best_columns, np.broadcast_to(columns, sims.shape)])
+            order = np.lexsort((merged_columns, -merged_sims), axis=1)[:, :top_n]
+            best_sims = np.take_along_axis(merged_sims, order, axis=1)
+            best_columns = np.take_along_axis(merged_columns, order, axis=1)
+        for i, row in enumerate(block):
+            found = best_sims[i] > -np.inf
+            yield int(row), [(int(column), float(sim)) for column, sim in zip(best_columns[i][found], best_sims[i][found])]
+
+
+class SavingsStore:
+    """
+    Precomputed "cheaper equivalent" recommendations in SQLite.
+
+    For every comparable product, the savings table keeps its top_n nutritional neighbours
+    (cosine similarity of the nutrition vectors, at least min_similarity) that have the same
+    measuringUnit.unit and a lower unitPrice, indexed by product, by alternative and by saving.
+
+    The products table keeps a fingerprint (unit, unitPrice, nutrition) of every product the
+    table was computed from. refresh() recomputes only the recommendations a change can have
+    affected: those of the changed products, the lists that contain a changed or removed
+    product, and the products for which a changed product is now cheaper and at least as
+    similar as their last recommendation. The result is the same as a full rebuild.
+    """
+
+    def __init__(self, db_path: str, top_n: int = 3, min_similarity: float = 0.98, block_size: int = 256) -> None:
+        self.db_path = db_path
+        self.top_n = top_n
+        self.min_similarity = min_similarity
+        self.block_size = block_size
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS products (
+                productId TEXT PRIMARY KEY,
+                denomination TEXT,
+                brand TEXT,
+                unit TEXT NOT NULL,
+                unitPrice REAL NOT NULL,
+                fingerprint TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS savings (
+                productId TEXT NOT NULL,
+                rank INTEGER NOT NULL,
+                alternativeId TEXT NOT NULL,
+                similarity REAL NOT NULL,
+                unitPrice REAL NOT NULL,
+                alternativeUnitPrice REAL NOT NULL,
+                saving REAL NOT NULL,
+                unit TEXT NOT NULL,
+                PRIMARY KEY (productId, rank)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_savings_alternative ON savings (alternativeId);
+            CREATE INDEX IF NOT EXISTS idx_savings_saving ON savings (saving);
+        """)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "SavingsStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def settings(self) -> str:
+        return f"top_n={self.top_n};min_similarity={self.min_similarity};features={','.join(NUTRITION_FEATURES)}"
+
+    # --- Refresh ---
+
+    def refresh(self, df: pd.DataFrame, full: bool = False) -> Dict[str, int]:
+        """
+        Brings the recommendations up to date with a product table (product_snapshot.load_product_data).
+        A full rebuild happens on the first run, when the settings changed, or if full is set.
+        """
+        products = comparable_products(df)
+        stored = {row[0]: row[1] for row in self.conn.execute("SELECT productId, fingerprint FROM products")}
+        settings = self.conn.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        full = full or not stored or settings is None or settings[0] != self.settings()
+
+        current = dict(zip(products['productId'], products['fingerprint']))
+        changed = {pid for pid, fingerprint in current.items() if stored.get(pid) != fingerprint}
+        removed = set(stored) - set(current)
+        stats = {"products": len(products), "changed": len(changed), "removed": len(removed), "recomputed": 0}
+        if full:
+            affected = set(current)
+        else:
+            affected = self._affected(products, changed, removed)
+
+        with self.conn:
+            if full:
+                self.conn.execute("DELETE FROM savings")
+                self.conn.execute("DELETE FROM products")
+            else:
+                self._delete("DELETE FROM savings WHERE productId IN ({})", affected | removed)
+                self._delete("DELETE FROM products WHERE productId IN ({})", removed)
+            stats["recomputed"] = self._recompute(products, affected)
+            updated = products[products['productId'].isin(set(current) if full else changed)]
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?)",
+                zip(updated['productId'], updated['denomination'], updated['brand'], updated['unit'],
+                    updated['unitPrice'].astype(float), updated['fingerprint'])
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (self.settings(),))
+        stats["full"] = int(full)
+        return stats
+
+    def _delete(self, statement: str, product_ids: Set[str]) -> None:
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            self.conn.execute(statement.format(", ".join("?" * len(batch))), batch)
+
+    def _referencing(self, product_ids: Set[str]) -> Set[str]:
+        """Products whose recommendations contain one of product_ids."""
+        referencing = set()
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            referencing.update(row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT productId FROM savings WHERE alternativeId IN ({', '.join('?' * len(batch))})", batch
+            ))
+        return referencing
+
+    def _affected(self, products: pd.DataFrame, changed: Set[str], removed: Set[str]) -> Set[str]:
+        """Products whose recommendations may differ after the changes (see the class docstring)."""
+        affected = set(changed) | self._referencing(changed | removed)
+        if not changed:
+            return affected - removed
+        # Current list length and weakest similarity of every product
+        lists = {row[0]: (row[1], row[2]) for row in self.conn.execute(
+            "SELECT productId, COUNT(*), MIN(similarity) FROM savings GROUP BY productId"
+        )}
+        for _, group in products.groupby('unit', sort=False):
+            changed_rows = np.flatnonzero(group['productId'].isin(changed).to_numpy())
+            if not len(changed_rows):
+                continue
+            vectors = np.stack(group['vector'].to_numpy())
+            prices = group['unitPrice'].to_numpy(dtype=float)
+            ids = group['productId'].to_numpy()
+            full_list = np.array([lists.get(pid, (0, 0.0))[0] >= self.top_n for pid in ids])
+            weakest = np.array([lists.get(pid, (0, 0.0))[1] for pid in ids])
+            # Tiles of block_size changed products x block_size group rows
+            for start in range(0, len(changed_rows), self.block_size):
+                block = changed_rows[start:start + self.block_size]
+                for tile_start in range(0, len(ids), self.block_size):
+                    tile = slice(tile_start, tile_start + self.block_size)
+                    sims = np.round(vectors[tile] @ vectors[block].T, SIMILARITY_DECIMALS)
+                    entering = (
+                        (prices[tile, np.newaxis] > prices[block][np.newaxis, :])
+                        & (sims >= self.min_similarity)
+                        & (~full_list[tile, np.newaxis] | (sims >= weakest[tile, np.newaxis]))
+                    )
+                    affected.update(ids[tile][entering.any(axis=1)])
+        return affected - removed
+
+    def _recompute(self, products: pd.DataFrame, affected: Set[str]) -> int:
+        """Computes and inserts the recommendations of the affected products. Returns their number."""
+        count = 0
+        for unit, group in products.groupby('unit', sort=False):
+            rows = np.flatnonzero(group['productId'].isin(affected).to_numpy())
+            if not len(rows):
+                continue
+            vectors = np.stack(group['vector'].to_numpy())
+            prices = group['unitPrice'].to_numpy(dtype=float)
+            ids = group['productId'].to_numpy()
+            batch = []
+            for row, neighbours in cheaper_neighbours(vectors, prices, rows, self.top_n, self.min_similarity,
+                                                      self.block_size):
+                count += 1
+                for rank, (column, similarity) in enumerate(neighbours, 1):
+                    batch.append((ids[row], rank, ids[column], similarity, float(prices[row]), float(prices[column]),
+                                  1 - prices[column] / prices[row], unit))
+                if len(batch) >= 5000:
+                    self.conn.executemany("INSERT INTO savings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    batch = []
+            self.conn.executemany("INSERT INTO savings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        return count
+
+    # --- Queries ---
+
+    def alternatives(self, product_id: str) -> List[Dict[str, Any]]:
+        """The cheaper equivalents of a product, best first."""
+        self.conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in self.conn.execute("""
+                SELECT s.rank, s.alternativeId, p.denomination, p.brand, s.similarity,
+                       s.alternativeUnitPrice, s.saving, s.unit
+                FROM savings s LEFT JOIN products p ON p.productId = s.alternativeId
+                WHERE s.productId = ? ORDER BY s.rank
+            """, (product_id,))]
+        finally:
+            self.conn.row_factory = None
+
+    def best_savings(self, limit: int = 20, unit: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The largest relative savings over the whole catalog (best alternative of each product)."""
+        self.conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in self.conn.execute(f"""
+                SELECT s.productId, p.denomination, s.unitPrice, s.alternativeId, a.denomination AS alternative,
+                       s.alternativeUnitPrice, s.saving, s.similarity, s.unit
+                FROM savings s
+                LEFT JOIN products p ON p.productId = s.productId
+                LEFT JOIN products a ON a.productId = s.alternativeId
+                WHERE s.rank = 1 {'AND s.unit = ?' if unit else ''}
+                ORDER BY s.saving DESC LIMIT ?
+            """, ([unit.upper()] if unit else []) + [limit])]
+        finally:
+            self.conn.row_factory = None
+
+
+def store_from_config(config: configparser.ConfigParser) -> SavingsStore:
+    return SavingsStore(
+        config.get('SAVINGS', 'DATABASE', fallback='savings.db'),
+        config.getint('SAVINGS', 'TOP_N', fallback=3),
+        config.getfloat('SAVINGS', 'MIN_SIMILARITY', fallback=0.98),
+        config.getint('SAVINGS', 'BLOCK_SIZE', fallback=256),
+    )
+
+
+def refresh_savings(config: configparser.ConfigParser, source: str, full: bool = False) -> Dict[str, int]:
+    """Refreshes the savings table from a JSONL output folder or a catalog database."""
+    with store_from_config(config) as store:
+        return store.refresh(product_snapshot.load_product_data(source), full)
+
+
+if __name__ == "__main__":
+    from profiling import add_profile_arguments, maybe_profile
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Cheaper nutritional equivalents of every product.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subparsers.add_parser("refresh", help="Update the savings table from the crawled products.")
+    refresh_parser.add_argument("--source", default=None,
+                                help="JSONL folder or catalog database (default: [FOLDERS] JSONL_OUTPUT).")
+    refresh_parser.add_argument("--full", action="store_true", help="Recompute every product.")
+    add_profile_arguments(refresh_parser)
+    show_parser = subparsers.add_parser("show", help="Cheaper equivalents of one product.")
+    show_parser.add_argument("product_id", help="productIdInSupermarket.")
+    best_parser = subparsers.add_parser("best", help="Largest savings of the catalog.")
+    best_parser.add_argument("--limit", type=int, default=20, help="Number of products.")
+    best_parser.add_argument("--unit", default=None, help="Only this measuringUnit.unit, e.g. KG.")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if args.command == "refresh":
+        with maybe_profile("cheaper_equivalents", args):
+            started = time.perf_counter()
+            stats = refresh_savings(config, args.source or config['FOLDERS']['JSONL_OUTPUT'], args.full)
+            logger.info(f"{'Full rebuild' if stats['full'] else 'Incremental refresh'}: {stats['products']} comparable "
+                        f"products, {stats['changed']} changed, {stats['removed']} removed, {stats['recomputed']} "
+                        f"recomputed in {time.perf_counter() - started:.2f} s.")
+    else:
+        with store_from_config(config) as store:
+            rows = store.alternatives(args.product_id) if args.command == "show" else store.best_savings(args.limit, args.unit)
+            for row in rows:
+                sys.stdout.write(json_codec.dumps(row) + "\n")
@@ -1,16 +1,19 @@
 # File: similarity_searcher.py
 
-import os
-import jsonlines
+import argparse
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
 import logging
 import re
 
+import product_snapshot
+from category_tree import CategoryNode, CategoryTree, category_path
+from white_labels import BRAND_TYPES, WHITE_LABEL_FILE, WhiteLabelMatcher, load_white_label_brands, record_brand_type
+from profiling import add_profile_arguments, maybe_profile
+
 # --- Configuration ---
 JSONL_FOLDER = "jsonl_out"  # !!! ADAPT THIS to your actual output folder name from config.ini
+CATALOG_DATABASE = None  # Set to the [CATALOG] DATABASE file to read from the SQLite catalog instead
 NUTRITION_FEATURES = [
     'calories', 'protein', 'fat', 'carbohydrates',
     'sugars', 'salt', 'saturatedFattyAcids', 'fiber'
@@ -21,32 +24,20 @@ TOP_N_SIMILAR = 5 # Number of similar products to show
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def load_product_data(folder_path: str) -> pd.DataFrame:
-    """Loads all product data from .jsonl files in a folder."""
-    all_products = []
-    if not os.path.isdir(folder_path):
-        logging.error(f"Error: Folder not found: {folder_path}")
+    """Loads all product data (through the shared snapshot) indexed by productIdInSupermarket."""
+    df = product_snapshot.load_product_data(folder_path)
+    if df.empty:
+        return df
+    if 'productIdInSupermarket' not in df.columns:
+        logging.error("Column 'productIdInSupermarket' not found in product data.")
         return pd.DataFrame()
 
-    logging.info(f"Loading product data from: {folder_path}")
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".jsonl"):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with jsonlines.open(file_path, mode='r') as reader:
-                    for product in reader:
-                        if 'productIdInSupermarket' in product and product['productIdInSupermarket']:
-                            all_products.append(product)
-                        else:
-                            logging.warning(f"Skipping record in {filename} due to missing 'productIdInSupermarket'")
-            except Exception as e:
-                logging.error(f"Error reading {filename}: {e}")
-
-    if not all_products:
-        logging.error(f"No product data loaded from {folder_path}. Check the folder and file contents.")
-        return pd.DataFrame()
+    has_id = df['productIdInSupermarket'].notna() & (df['productIdInSupermarket'] != '')
+    if not has_id.all():
+        logging.warning(f"Skipping {int((~has_id).sum())} records due to missing 'productIdInSupermarket'")
+        df = df[has_id]
 
-    df = pd.DataFrame(all_products)
-    logging.info(f"Loaded {len(df)} products.")
+    df = df.copy()
     df['productIdInSupermarket'] = df['productIdInSupermarket'].astype(str)
     df = df.set_index('productIdInSupermarket', drop=False) 
     return df
@@ -82,6 +73,17 @@ def extract_nutrition_vector(nutrition_info: dict, features: list) -> list:
         vector.append(value)
     return vector
 
+def cosine_similarities(matrix: np.ndarray, target_index: int) -> np.ndarray:
+    """
+    Cosine similarity of one row of the matrix against every row (same results as
+    sklearn's cosine_similarity(matrix)[target_index], without building the n x n matrix).
+    All-zero rows get similarity 0.
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1.0
+    normalized = matrix / norms[:, np.newaxis]
+    return normalized @ normalized[target_index]
+
 def find_similar_products(product_id: str, df: pd.DataFrame, features: list, top_n: int = 5):
     """Finds products similar to the given product_id based on nutrition."""
     if product_id not in df.index:
@@ -98,14 +100,14 @@ def find_similar_products(product_id: str, df: pd.DataFrame, features: list, top
     nutrition_matrix_scaled = np.nan_to_num(nutrition_matrix_scaled)
 
 
-    logging.info("Calculating cosine similarity matrix...")
+    logging.info("Calculating cosine similarities...")
     try:
-        cosine_sim = cosine_similarity(nutrition_matrix_scaled)
         id_to_index = {id_: i for i, id_ in enumerate(df.index)}
         index_to_id = {i: id_ for id_, i in id_to_index.items()}
 
         target_index = id_to_index[product_id]
-        similarity_scores = list(enumerate(cosine_sim[target_index]))
+        target_similarities = cosine_similarities(nutrition_matrix_scaled, target_index)
+        similarity_scores = list(enumerate(target_similarities))
 
         similarity_scores = sorted(similarity_scores, key=lambda x: x[1], reverse=True)
         similar_products_indices = [i for i, score in similarity_scores[1:top_n + 1]] # Skip the first one 
@@ -115,7 +117,7 @@ def find_similar_products(product_id: str, df: pd.DataFrame, features: list, top
         results = []
         for i in similar_products_indices:
             similar_product_id = index_to_id[i]
-            score = cosine_sim[target_index, i]
+            score = target_similarities[i]
             name = df.loc[similar_product_id, 'denomination']
             print(f"- ID: {similar_product_id}, Name: {name}, Similarity: {score:.4f}")
             results.append({
@@ -131,34 +133,150 @@ def find_similar_products(product_id: str, df: pd.DataFrame, features: list, top
         return None
 
 
+class SimilarityIndex:
+    """
+    Normalized nutrition vectors of a dataset, built once and sorted by (brand type, category
+    path). Every (brand type, category subtree) partition is then a contiguous block of rows,
+    located through one category tree per brand type, so a filtered query only multiplies the
+    rows of its partition instead of ranking the whole catalog and post-filtering.
+    """
+
+    def __init__(self, df: pd.DataFrame, features: list, white_brands: WhiteLabelMatcher) -> None:
+        n = len(df)
+        vectors = np.nan_to_num(np.array(
+            [extract_nutrition_vector(info, features) for info in df['nutritionInformation']], dtype=float
+        ).reshape(n, len(features)))
+        brands = df['brand'].tolist() if 'brand' in df.columns else [None] * n
+        categories = df['categoryInSupermarket'].tolist() if 'categoryInSupermarket' in df.columns else [None] * n
+        # isWhiteLabel tag of the scraper where present and current (NaN for older records), else the brand
+        tags = df['isWhiteLabel'].tolist() if 'isWhiteLabel' in df.columns else [None] * n
+        fingerprints = df['whiteLabelFingerprint'].tolist() if 'whiteLabelFingerprint' in df.columns else [None] * n
+        types = [
+            BRAND_TYPES.index(record_brand_type(
+                {'brand': brand, 'isWhiteLabel': None if pd.isna(tag) else tag, 'whiteLabelFingerprint': fingerprint},
+                white_brands
+            ))
+            for brand, tag, fingerprint in zip(brands, tags, fingerprints)
+        ]
+        paths = [category_path(category) for category in categories]
+        order = sorted(range(n), key=lambda i: (types[i], paths[i]))
+
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        self.matrix = (vectors / norms[:, np.newaxis])[order]
+        self.ids = [str(df.index[i]) for i in order]
+        self.names = [df['denomination'].iat[i] if 'denomination' in df.columns else None for i in order]
+        self.brands = np.array(['' if brands[i] is None else str(brands[i]).strip().upper() for i in order], dtype=object)
+        self.paths = [paths[i] for i in order]
+        self.row_of = {product_id: row for row, product_id in enumerate(self.ids)}
+
+        self.trees = {}
+        row = 0
+        for type_index, name in enumerate(BRAND_TYPES):
+            tree = CategoryTree(CategoryNode(None, row, 0))
+            while row < n and types[order[row]] == type_index:
+                tree.add(self.paths[row], row, 0, 0)
+                row += 1
+            self.trees[name] = tree
+
+    def partition(self, category: str = None, brand_type_filter: str = None) -> list:
+        """Row slices of the products under a category prefix ('a/b') and of a brand type (None: any)."""
+        slices = []
+        for name in [brand_type_filter] if brand_type_filter else BRAND_TYPES:
+            node = self.trees[name].node(category) if category else self.trees[name].root
+            if node is not None and node.end > node.start:
+                slices.append(slice(node.start, node.end))
+        return slices
+
+    def category_of(self, product_id: str, depth: int) -> str:
+        """The first depth levels of a product's category, e.g. to search its own subtree."""
+        return "/".join(self.paths[self.row_of[product_id]][:depth])
+
+    def find_similar(self, product_id: str, top_n: int = 5, category: str = None, brand_type_filter: str = None,
+                     brand: str = None):
+        """
+        Top products most similar to product_id within the partition (category prefix, brand type)
+        and, optionally, of one exact brand. The target itself never counts as a result.
+        """
+        target_row = self.row_of.get(product_id)
+        if target_row is None:
+            logging.error(f"Product ID '{product_id}' not found in the dataset.")
+            return None
+
+        rows, scores = [], []
+        for part in self.partition(category, brand_type_filter):
+            part_rows = np.arange(part.start, part.stop)
+            part_scores = self.matrix[part] @ self.matrix[target_row]
+            if brand:
+                mask = self.brands[part] == brand.strip().upper()
+                part_rows, part_scores = part_rows[mask], part_scores[mask]
+            rows.append(part_rows)
+            scores.append(part_scores)
+        rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+        scores = np.concatenate(scores) if scores else np.array([])
+        keep = rows != target_row
+        rows, scores = rows[keep], scores[keep]
+        logging.info(f"Ranking {len(rows)} of {len(self.ids)} products.")
+
+        if len(rows) > top_n:
+            candidates = np.argpartition(-scores, top_n - 1)[:top_n] if top_n > 0 else np.array([], dtype=int)
+            rows, scores = rows[candidates], scores[candidates]
+        best = np.lexsort((rows, -scores))[:top_n]
+
+        results = []
+        for i in best:
+            row = rows[i]
+            print(f"- ID: {self.ids[row]}, Name: {self.names[row]}, Similarity: {scores[i]:.4f}")
+            results.append({"id": self.ids[row], "name": self.names[row], "score": scores[i]})
+        return results
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    product_df = load_product_data(JSONL_FOLDER)
+    parser = argparse.ArgumentParser(description="Find products with a similar nutrition profile.")
+    parser.add_argument("--category", default=None, help="Only products under this category prefix, e.g. 'Alimentación general/Lácteos y huevos'.")
+    parser.add_argument("--same-category", type=int, default=None, metavar="DEPTH",
+                        help="Only products sharing the first DEPTH category levels of the queried product.")
+    parser.add_argument("--brand-type", choices=BRAND_TYPES, default=None, help="Only white-label or non-white-label products.")
+    parser.add_argument("--brand", default=None, help="Only products of this brand.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
 
-    if not product_df.empty:
-        # Keep only products with some nutrition info for similarity calculation
-        # This avoids issues with all-zero vectors in cosine similarity
-        product_df_nutri = product_df.dropna(subset=['nutritionInformation'])
-        product_df_nutri = product_df_nutri[product_df_nutri['nutritionInformation'] != {}]
+    with maybe_profile("cosine_similarity", args):
+        product_df = load_product_data(CATALOG_DATABASE or JSONL_FOLDER)
+
+        if not product_df.empty:
+            # Keep only products with some nutrition info for similarity calculation
+            # This avoids issues with all-zero vectors in cosine similarity
+            product_df_nutri = product_df.dropna(subset=['nutritionInformation'])
+            product_df_nutri = product_df_nutri[product_df_nutri['nutritionInformation'] != {}]
         
-        valid_nutri_indices = []
-        for idx, row in product_df_nutri.iterrows():
-             vec = extract_nutrition_vector(row['nutritionInformation'], NUTRITION_FEATURES)
-             if any(v > 0 for v in vec): 
-                 valid_nutri_indices.append(idx)
-        product_df_nutri_filtered = product_df_nutri.loc[valid_nutri_indices]
-        if product_df_nutri_filtered.empty:
-             logging.warning("No products with valid numeric nutritional data found after filtering.")
+            valid_nutri_indices = []
+            for idx, row in product_df_nutri.iterrows():
+                 vec = extract_nutrition_vector(row['nutritionInformation'], NUTRITION_FEATURES)
+                 if any(v > 0 for v in vec): 
+                     valid_nutri_indices.append(idx)
+            product_df_nutri_filtered = product_df_nutri.loc[valid_nutri_indices]
+            if product_df_nutri_filtered.empty:
+                 logging.warning("No products with valid numeric nutritional data found after filtering.")
+            else:
+                logging.info(f"Proceeding with similarity calculation for {len(product_df_nutri_filtered)} products with nutrition data.")
+                similarity_index = SimilarityIndex(
+                    product_df_nutri_filtered, NUTRITION_FEATURES, load_white_label_brands(WHITE_LABEL_FILE)
+                )
+
+                while True:
+                    target_product_id = input(f"Enter the 'productIdInSupermarket' to find similar products (or 'quit'): ").strip()
+                    if target_product_id.lower() == 'quit':
+                        break
+                    if not target_product_id:
+                        continue
+                    category = args.category
+                    if args.same_category and target_product_id in similarity_index.row_of:
+                        category = similarity_index.category_of(target_product_id, args.same_category)
+                    similarity_index.find_similar(
+                        target_product_id, TOP_N_SIMILAR, category, args.brand_type, args.brand
+                    )
+                    print("-" * 20)
         else:
-            logging.info(f"Proceeding with similarity calculation for {len(product_df_nutri_filtered)} products with nutrition data.")
-
-            while True:
-                target_product_id = input(f"Enter the 'productIdInSupermarket' to find similar products (or 'quit'): ").strip()
-                if target_product_id.lower() == 'quit':
-                    break
-                if not target_product_id:
-                    continue
-                find_similar_products(target_product_id, product_df_nutri_filtered, NUTRITION_FEATURES, TOP_N_SIMILAR)
-                print("-" * 20)
-    else:
-        print("Could not load product data. Exiting.")
\ No newline at end of file
+            print("Could not load product data. Exiting.")
\ No newline at end of file
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import math
+import time
+import logging
+import argparse
+import configparser
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 24 * 60 * 60 * 1000
+DEFAULT_CHANGE_RATE = 0.1  # Changes per product and day assumed before a category has been observed
+CHANGE_KINDS = ("added", "changed")  # catalog_diff.py change lines that count as a change
+
+
+def change_rate(changed: int, products: int, interval_days: float) -> Optional[float]:
+    """
+    Poisson estimate of the change rate (per product and day) from the share of products that
+    changed over interval_days: P(changed) = 1 - exp(-rate * interval). None if nothing was observed.
+    """
+    if products <= 0 or interval_days <= 0:
+        return None
+    # Keep the share below 1 so that a category where everything changed gets a finite rate
+    share = min(changed / products, 1 - 1 / (2 * products))
+    return -math.log(1 - share) / interval_days
+
+
+class CrawlScheduler:
+    """
+    Chooses which [CATEGORIES] a run crawls.
+
+    For every category the state file keeps when it was last crawled, what a crawl of it cost
+    (requests) and how many products it had, and a smoothed change rate learned from earlier
+    crawls (share of products whose price fields moved between two crawls) or from a
+    catalog_diff.py change set. plan() first takes every category that would exceed the
+    maximum staleness by the next run, then spends the rest of the request budget on the
+    categories with the most expected changes per request.
+    """
+
+    def __init__(self, state_path: str, max_staleness_days: float, run_interval_days: float = 1.0,
+                 smoothing: float = 0.3) -> None:
+        self.state_path = state_path
+        self.max_staleness_days = max_staleness_days
+        self.run_interval_days = run_interval_days
+        self.smoothing = smoothing
+        self.categories = self.load()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.isfile(self.state_path):
+            return {}
+        try:
+            return json_codec.load_file(self.state_path).get("categories", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable scheduler state {self.state_path}: {e}")
+            return {}
+
+    def save(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        json_codec.dump_file({"categories": self.categories}, tmp_path, indent=True)
+        os.replace(tmp_path, self.state_path)
+
+    def observe(self, category: str, changed: int, products: int, interval_days: float) -> None:
+        """Folds one observation (changed out of products over interval_days) into the change rate."""
+        rate = change_rate(changed, products, interval_days)
+        if rate is None:
+            return
+        stats = self.categories.setdefault(category, {})
+        if stats.get("observations"):
+            rate = (1 - self.smoothing) * stats["rate"] + self.smoothing * rate
+        stats["rate"] = rate
+        stats["observations"] = stats.get("observations", 0) + 1
+
+    def record_crawl(self, category: str, crawl_ts: int, products: int, changed: int, requests: int) -> None:
+        """
+        Registers a finished crawl of a category: its cost and size, and the change rate since
+        the previous crawl (products fetched and how many of them were new or re-priced).
+        """
+        stats = self.categories.setdefault(category, {})
+        if stats.get("lastCrawled"):
+            self.observe(category, changed, products, (crawl_ts - stats["lastCrawled"]) / DAY_MS)
+        stats.update({"lastCrawled": crawl_ts, "requests": requests, "products": products})
+
+    def learn_from_diff(self, changes_path: str, folder_path: str, interval_days: float) -> Dict[str, Tuple[int, int]]:
+        """
+        Learns the change rates from a catalog_diff.py change set between two crawls interval_days
+        apart. Products are mapped to their categories through the listingCategories of the records
+        in folder_path (the newer crawl). Returns {category: (changed, products)}.
+        """
+        product_categories = {}
+        for file_name in os.listdir(folder_path):
+            if file_name.endswith(".jsonl"):
+                for record in json_codec.iter_jsonl(os.path.join(folder_path, file_name)):
+                    if record.get("productIdInSupermarket"):
+                        product_categories[str(record["productIdInSupermarket"])] = record.get("listingCategories") or []
+        products = Counter(category for categories in product_categories.values() for category in categories)
+        changed = Counter()
+        for change in json_codec.iter_jsonl(changes_path):
+            if change.get("change") in CHANGE_KINDS:
+                changed.update(product_categories.get(str(change.get("productIdInSupermarket")), []))
+
+        observed = {}
+        for category, count in products.items():
+            self.observe(category, changed[category], count, interval_days)
+            observed[category] = (changed[category], count)
+        return observed
+
+    def change_probability(self, category: str, now: int) -> float:
+        """Probability that a product of the category changed since its last crawl."""
+        stats = self.categories.get(category, {})
+        staleness_days = (now - stats.get("lastCrawled", 0)) / DAY_MS
+        return 1 - math.exp(-stats.get("rate", DEFAULT_CHANGE_RATE) * staleness_days)
+
+    def estimated_cost(self, category: str) -> float:
+        """Requests of the last crawl of the category, or the mean of the known categories."""
+        known = [stats["requests"] for stats in self.categories.values() if stats.get("requests")]
+        return self.categories.get(category, {}).get("requests") or (sum(known) / len(known) if known else 1.0)
+
+    def plan(self, categories: List[str], budget: int, now: int) -> List[Tuple[str, str]]:
+        """
+        [(category, reason)] to crawl this run, in crawl order. budget is the number of requests
+        (listing pages and product requests) of the run; 0 means no limit. Categories due for the
+        staleness guarantee are always included, even when they alone exceed the budget.
+        """
+        due, optional = [], []
+        for category in categories:
+            last_crawled = self.categories.get(category, {}).get("lastCrawled")
+            if not last_crawled:
+                due.append((math.inf, category, "never crawled"))
+                continue
+            staleness_days = (now - last_crawled) / DAY_MS
+            if staleness_days + self.run_interval_days > self.max_staleness_days:
+                due.append((staleness_days, category, f"stale for {staleness_days:.1f} days"))
+                continue
+            expected_changes = self.change_probability(category, now) * self.categories[category].get("products", 0)
+            optional.append((expected_changes / self.estimated_cost(category), category, expected_changes))
+
+        selected = [(category, reason) for _, category, reason in sorted(due, key=lambda entry: -entry[0])]
+        spent = sum(self.estimated_cost(category) for category, _ in selected)
+        if budget and spent > budget:
+            logger.warning(f"Categories due for the {self.max_staleness_days}-day staleness guarantee need "
+                           f"~{spent:.0f} requests, above the budget of {budget}.")
+        for score, category, expected_changes in sorted(optional, key=lambda entry: -entry[0]):
+            cost = self.estimated_cost(category)
+            if budget and spent + cost > budget:
+                continue
+            selected.append((category, f"~{expected_changes:.0f} expected changes, {score:.3f} per request"))
+            spent += cost
+        return selected
+
+
+def scheduler_from_config(config: configparser.ConfigParser) -> CrawlScheduler:
+    return CrawlScheduler(
+        config.get('SCHEDULER', 'STATE_FILE', fallback='crawl_schedule.json'),
+        config.getfloat('SCHEDULER', 'MAX_STALENESS_DAYS', fallback=7.0),
+        config.getfloat('SCHEDULER', 'RUN_INTERVAL_DAYS', fallback=1.0),
+        config.getfloat('SCHEDULER', 'RATE_SMOOTHING', fallback=0.3),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Inspect or train the change-frequency crawl scheduler.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plan_parser = subparsers.add_parser("plan", help="Show the categories the next run would crawl.")
+    plan_parser.add_argument("--budget", type=int, default=None, help="Request budget (default: [SCHEDULER]).")
+    learn_parser = subparsers.add_parser("learn", help="Learn change rates from a catalog_diff.py change set.")
+    learn_parser.add_argument("changes", help="Change set written by catalog_diff.py.")
+    learn_parser.add_argument("--folder", default=None, help="Output folder of the newer crawl (default: [FOLDERS]).")
+    learn_parser.add_argument("--days", type=float, required=True, help="Days between the two compared crawls.")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    scheduler = scheduler_from_config(config)
+    if args.command == "plan":
+        budget = args.budget if args.budget is not None else config.getint('SCHEDULER', 'REQUEST_BUDGET', fallback=0)
+        now = int(time.time() * 1000)
+        for category, reason in scheduler.plan(config['CATEGORIES']['CATEGORIES'].split(','), budget, now):
+            sys.stdout.write(f"{category:<60} {scheduler.estimated_cost(category):>8.0f} req  {reason}\n")
+    else:
+        observed = scheduler.learn_from_diff(args.changes, args.folder or config['FOLDERS']['JSONL_OUTPUT'], args.days)
+        scheduler.save()
+        for category, (changed, products) in sorted(observed.items()):
+            sys.stdout.write(f"{category:<60} {changed:>6}/{products:<6} rate {scheduler.categories[category]['rate']:.4f}/day\n")
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import time
+import socket
+import sqlite3
+import logging
+import shutil
+import argparse
+import subprocess
+import configparser
+from typing import Any, Dict, List, Optional
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 5.0  # Idle workers and the coordinator check the queue this often
+SHARD_ARCHIVE = "raw_archive"  # Raw payload archive of a worker, inside its shard folder ([ARCHIVE] ENABLED)
+
+
+class WorkQueue:
+    """
+    Durable queue of crawl work units in SQLite: one unit per (category, listing page).
+
+    The coordinator seeds page 1 of every category; the worker that processes a first page
+    queues the remaining pages of its category. Workers lease one unit at a time and renew
+    the lease while they work on it. A unit whose lease expired (the worker died or hung) goes
+    back to the queue when the next unit is leased, until it has failed MAX_ATTEMPTS times.
+    Leasing runs in a BEGIN IMMEDIATE transaction, so concurrent workers never get the same
+    unit; the database must live on a filesystem with working locks when the workers run on
+    several hosts.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 300.0, max_attempts: int = 3) -> None:
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS units (
+                unitId INTEGER PRIMARY KEY,
+                category TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                leaseExpires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                startedAt REAL,
+                finishedAt REAL,
+                products INTEGER NOT NULL DEFAULT 0,
+                requests INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                UNIQUE (category, page)
+            );
+            CREATE INDEX IF NOT EXISTS idx_units_state ON units (state, unitId);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                host TEXT,
+                pid INTEGER,
+                startedAt REAL,
+                lastSeen REAL
+            );
+        """)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def seed(self, categories: List[str], crawl_ts: int, reset: bool = False) -> bool:
+        """
+        Starts a crawl: page 1 of every category, with the crawl timestamp shared by all workers.
+        An unfinished crawl is resumed instead, unless reset is set. Returns True if seeded.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not reset and self.remaining():
+                self.conn.execute("COMMIT")
+                return False
+            self.conn.execute("DELETE FROM units")
+            self.conn.execute("DELETE FROM workers")
+            self.conn.executemany(
+                "INSERT INTO units (category, page) VALUES (?, 1)", [(category,) for category in categories]
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('crawlTs', ?)", (str(crawl_ts),))
+            self.conn.execute("COMMIT")
+            return True
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def crawl_timestamp(self) -> Optional[int]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'crawlTs'").fetchone()
+        return int(row["value"]) if row else None
+
+    def register_worker(self, worker: str) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?)", (worker, socket.gethostname(), os.getpid(), now, now)
+        )
+
+    def lease(self, worker: str) -> Optional[sqlite3.Row]:
+        """Leases the oldest pending unit to a worker, after re-queueing expired leases. None if nothing is pending."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, leaseExpires = NULL, error = 'lease expired' "
+                "WHERE state = 'leased' AND leaseExpires < ?",
+                (self.max_attempts, now)
+            )
+            unit = self.conn.execute(
+                "SELECT * FROM units WHERE state = 'pending' ORDER BY unitId LIMIT 1"
+            ).fetchone()
+            if unit is not None:
+                self.conn.execute(
+                    "UPDATE units SET state = 'leased', worker = ?, leaseExpires = ?, attempts = attempts + 1, "
+                    "startedAt = ? WHERE unitId = ?",
+                    (worker, now + self.lease_seconds, now, unit["unitId"])
+                )
+            self.conn.execute("UPDATE workers SET lastSeen = ? WHERE worker = ?", (now, worker))
+            self.conn.execute("COMMIT")
+            return unit
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, unit_id: int, worker: str) -> bool:
+        """Extends the lease of a unit; False if the worker no longer holds it."""
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE units SET leaseExpires = ? WHERE unitId = ? AND worker = ? AND state = 'leased'",
+            (now + self.lease_seconds, unit_id, worker)
+        )
+        self.conn.execute("UPDATE workers SET lastSeen = ? WHERE worker = ?", (now, worker))
+        return cursor.rowcount == 1
+
+    def add_pages(self, category: str, number_pages: int) -> None:
+        """Queues pages 2..number_pages of a category (pages already queued are kept)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO units (category, page) VALUES (?, ?)",
+                [(category, page) for page in range(2, number_pages + 1)]
+            )
+
+    def complete(self, unit_id: int, worker: str, products: int, requests: int) -> bool:
+        """Marks a unit done; False if its lease had expired and it went to another worker."""
+        cursor = self.conn.execute(
+            "UPDATE units SET state = 'done', leaseExpires = NULL, finishedAt = ?, products = ?, requests = ?, "
+            "error = NULL WHERE unitId = ? AND worker = ? AND state = 'leased'",
+            (time.time(), products, requests, unit_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, unit_id: int, worker: str, error: str) -> None:
+        """Gives a unit back after an error: queued again, or failed after MAX_ATTEMPTS attempts."""
+        self.conn.execute(
+            "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, leaseExpires = NULL, error = ? WHERE unitId = ? AND worker = ? AND state = 'leased'",
+            (self.max_attempts, error, unit_id, worker)
+        )
+
+    def remaining(self) -> int:
+        """Units pending or leased."""
+        return self.conn.execute("SELECT COUNT(*) FROM units WHERE state IN ('pending', 'leased')").fetchone()[0]
+
+    def progress(self) -> Dict[str, int]:
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for row in self.conn.execute("SELECT state, COUNT(*) AS units FROM units GROUP BY state"):
+            counts[row["state"]] = row["units"]
+        return counts
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Per worker: units done, products and requests, and products per minute since it started."""
+        rows = self.conn.execute("""
+            SELECT w.worker, w.host, w.pid, w.startedAt, w.lastSeen,
+                   COUNT(u.unitId) AS units, COALESCE(SUM(u.products), 0) AS products,
+                   COALESCE(SUM(u.requests), 0) AS requests
+            FROM workers w LEFT JOIN units u ON u.worker = w.worker AND u.state = 'done'
+            GROUP BY w.worker ORDER BY w.worker
+        """).fetchall()
+        stats = []
+        for row in rows:
+            minutes = max(row["lastSeen"] - row["startedAt"], 1.0) / 60
+            stats.append(dict(row, productsPerMinute=row["products"] / minutes))
+        return stats
+
+    def failed_units(self) -> List[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM units WHERE state = 'failed' ORDER BY unitId").fetchall()
+
+
+def queue_from_config(config: configparser.ConfigParser) -> WorkQueue:
+    return WorkQueue(
+        config.get('DISTRIBUTED', 'QUEUE_DATABASE', fallback='crawl_queue.db'),
+        config.getfloat('DISTRIBUTED', 'LEASE_SECONDS', fallback=300.0),
+        config.getint('DISTRIBUTED', 'MAX_ATTEMPTS', fallback=3),
+    )
+
+
+def seed_crawl(config: configparser.ConfigParser, queue: WorkQueue, reset: bool = False) -> bool:
+    """Seeds a new crawl of [CATEGORIES] and clears the shards of the previous one; False if one is resumed."""
+    categories = config['CATEGORIES']['CATEGORIES'].split(',')
+    if not queue.seed(categories, int(time.time() * 1000), reset):
+        return False
+    shutil.rmtree(config.get('DISTRIBUTED', 'SHARD_DIRECTORY', fallback='shards'), ignore_errors=True)
+    logger.info(f"Seeded {len(categories)} categories.")
+    return True
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(queue: WorkQueue, worker: str, shard_root: str, max_units: Optional[int] = None) -> int:
+    """
+    Leases and crawls units until the queue is drained (or max_units were done), writing the
+    records (and, with [ARCHIVE] ENABLED, the raw payloads) to its own shard folder,
+    shard_root/<worker>. Returns the number of units done.
+    """
+    from scraper_makro import Scraper
+    from raw_archive import RawArchive
+
+    os.makedirs(shard_root, exist_ok=True)
+    scraper = Scraper(offline=True, output_folder=os.path.join(shard_root, worker))
+    scraper.crawl_timestamp = queue.crawl_timestamp() or scraper.crawl_timestamp
+    if scraper.config.getboolean('ARCHIVE', 'ENABLED', fallback=False):
+        scraper.raw_archive = RawArchive(os.path.join(shard_root, worker, SHARD_ARCHIVE), scraper.crawl_timestamp)
+    queue.register_worker(worker)
+    done = 0
+    try:
+        while max_units is None or done < max_units:
+            unit = queue.lease(worker)
+            if unit is None:
+                if not queue.remaining():
+                    break
+                # Other workers hold the remaining units; their leases may still expire
+                time.sleep(POLL_SECONDS)
+                continue
+            try:
+                if crawl_unit(queue, scraper, worker, unit):
+                    done += 1
+            except Exception as e:
+                logger.exception(f"Unit {unit['category']} page {unit['page']} failed")
+                queue.release(unit["unitId"], worker, str(e))
+    finally:
+        # Listing categories of products this worker saw in several units
+        scraper.apply_extra_categories()
+        if scraper.raw_archive:
+            scraper.raw_archive.close()
+    logger.info(f"Worker {worker} finished: {done} units.")
+    return done
+
+
+def crawl_unit(queue: WorkQueue, scraper, worker: str, unit: sqlite3.Row) -> bool:
+    """Crawls one listing page and the products on it. Returns True if the unit was completed."""
+    category, page = unit["category"], unit["page"]
+    requests_before, products = scraper.requests_made, 0
+    parsed = scraper.fetch_listing_page(category, page)
+    if parsed is None:
+        queue.release(unit["unitId"], worker, "listing page request failed")
+        return False
+    if page == 1:
+        queue.add_pages(category, scraper.page_count(parsed))
+
+    renewed = time.monotonic()
+    for record in scraper.parser_products(scraper.iter_product_ids([parsed], category), category):
+        scraper.write_product(record)
+        products += 1
+        if time.monotonic() - renewed > queue.lease_seconds / 4:
+            if not queue.renew(unit["unitId"], worker):
+                logger.warning(f"Lost the lease of {category} page {page}; another worker re-crawls it.")
+            renewed = time.monotonic()
+    if not queue.complete(unit["unitId"], worker, products, scraper.requests_made - requests_before):
+        logger.warning(f"Lease of {category} page {page} expired before it was completed.")
+        return False
+    return True
+
+
+def merge_shards(config: configparser.ConfigParser, shard_root: str, crawl_ts: int, full_crawl: bool = True) -> Dict[str, int]:
+    """
+    Merges the shard folders of every worker into [FOLDERS] JSONL_OUTPUT (and its store
+    subfolders). A product crawled by several workers keeps its most recently written record,
+    with the listingCategories of all of them. The primary-store records then go to the
+    central stores enabled in config.ini (price history, rollups, catalog, text index, savings), as
+    a single-process crawl would have written them, and the raw payload archives of the shards
+    are combined into the crawl's archive in [ARCHIVE] DIRECTORY.
+    """
+    from price_history import PriceHistory
+    from price_rollups import PriceRollups
+    from catalog_store import CatalogStore
+    from text_index import update_index
+    from white_labels import load_white_label_brands
+
+    folder = config['FOLDERS']['JSONL_OUTPUT']
+    store_ids = [store_id.strip() for store_id in config.get('API', 'EXTRA_STORE_IDS', fallback='').split(',')
+                 if store_id.strip() and store_id.strip() != config['API']['STORE_ID']]
+    shards = sorted(os.path.join(shard_root, name) for name in os.listdir(shard_root)
+                    if os.path.isdir(os.path.join(shard_root, name)))
+
+    history = rollups = catalog = None
+    if config.getboolean('HISTORY', 'ENABLED', fallback=False):
+        history = PriceHistory(config['HISTORY']['DATABASE'])
+    if config.getboolean('HISTORY', 'ROLLUPS', fallback=False):
+        rollups = PriceRollups(config['HISTORY']['DATABASE'], load_white_label_brands())
+    if config.getboolean('CATALOG', 'ENABLED', fallback=False):
+        catalog = CatalogStore(config['CATALOG']['DATABASE'], config.getint('CATALOG', 'BATCH_SIZE', fallback=500))
+
+    stats = {"shards": len(shards), "records": 0, "duplicates": 0}
+    try:
+        for subfolder in [""] + store_ids:
+            destination = os.path.join(folder, subfolder)
+            os.makedirs(destination, exist_ok=True)
+            # File name -> shard copies; only the names are held in memory
+            copies = {}
+            for shard in shards:
+                shard_folder = os.path.join(shard, subfolder)
+                if os.path.isdir(shard_folder):
+                    for file_name in os.listdir(shard_folder):
+                        if file_name.endswith(".jsonl"):
+                            copies.setdefault(file_name, []).append(os.path.join(shard_folder, file_name))
+
+            for file_name, paths in copies.items():
+                records = []
+                for path in sorted(paths, key=os.path.getmtime):
+                    record = next(json_codec.iter_jsonl(path), None)
+                    if record:
+                        records.append(record)
+                if not records:
+                    continue
+                record = records[-1]
+                listed = list(record.get("listingCategories") or [])
+                for other in records[:-1]:
+                    listed += [category for category in other.get("listingCategories") or [] if category not in listed]
+                record["listingCategories"] = listed
+                json_codec.write_jsonl(os.path.join(destination, file_name), [record])
+                stats["records"] += 1
+                stats["duplicates"] += len(records) - 1
+                if subfolder:
+                    continue
+                if history:
+                    history.record(record, crawl_ts)
+                if rollups:
+                    rollups.add(record)
+                if catalog:
+                    catalog.upsert(record)
+    finally:
+        if history:
+            history.close()
+        if catalog:
+            catalog.close()
+    if config.getboolean('ARCHIVE', 'ENABLED', fallback=False):
+        stats["archived"] = merge_shard_archives(shards, config['ARCHIVE']['DIRECTORY'], crawl_ts)
+    if rollups:
+        if full_crawl:
+            rollups.commit_crawl(crawl_ts)
+        else:
+            logger.info("Not storing price rollups: some units of this crawl failed.")
+        rollups.close()
+    if config.getboolean('TEXT_INDEX', 'ENABLED', fallback=False):
+        update_index(config['TEXT_INDEX']['DATABASE'], folder)
+    if config.getboolean('SAVINGS', 'ENABLED', fallback=False):
+        from cheaper_equivalents import refresh_savings
+        refresh_savings(config, folder)
+    return stats
+
+
+def merge_shard_archives(shards: List[str], directory: str, crawl_ts: int) -> int:
+    """
+    Writes the raw payload archives of the shards to betty_<crawl_ts>.jsonl.gz in directory, and
+    their price archives to betty_<crawl_ts>.prices.jsonl.gz, so reparse.py replays a distributed
+    crawl like a single-process one. The files are concatenated as gzip members, without
+    decompressing them. Returns the number of shard archives merged.
+    """
+    from raw_archive import PRICES_SUFFIX, archive_files, is_price_archive
+
+    os.makedirs(directory, exist_ok=True)
+    destinations = {}
+    merged = 0
+    try:
+        for shard in shards:
+            shard_archive = os.path.join(shard, SHARD_ARCHIVE)
+            if not os.path.isdir(shard_archive):
+                continue
+            for path in archive_files(shard_archive, prices=True):
+                suffix = PRICES_SUFFIX if is_price_archive(path) else ".jsonl.gz"
+                if suffix not in destinations:
+                    destinations[suffix] = open(os.path.join(directory, f"betty_{crawl_ts}{suffix}"), "wb")
+                with open(path, "rb") as source:
+                    shutil.copyfileobj(source, destinations[suffix])
+                merged += 1
+    finally:
+        for destination in destinations.values():
+            destination.close()
+    return merged
+
+
+def log_progress(queue: WorkQueue) -> None:
+    counts = queue.progress()
+    logger.info(f"Units: {counts['done']} done, {counts['leased']} leased, {counts['pending']} pending, "
+                f"{counts['failed']} failed.")
+    for stats in queue.worker_stats():
+        logger.info(f"  {stats['worker']:<30} {stats['units']:>5} units {stats['products']:>7} products "
+                    f"{stats['requests']:>7} requests {stats['productsPerMinute']:>8.1f} products/min")
+
+
+def coordinate(config: configparser.ConfigParser, queue: WorkQueue, workers: int, reset: bool = False) -> int:
+    """
+    Local coordinator: seeds (or resumes) the crawl, starts the worker processes, logs the
+    progress until they exit, and merges the shards. Workers on other hosts can join with
+    `distributed_crawl.py worker` while it runs. Returns the number of failed units.
+    """
+    shard_root = config.get('DISTRIBUTED', 'SHARD_DIRECTORY', fallback='shards')
+    if not seed_crawl(config, queue, reset):
+        logger.info("Resuming the unfinished crawl in the queue.")
+
+    script = os.path.abspath(__file__)
+    processes = [
+        subprocess.Popen([sys.executable, script, "worker", "--id", f"{socket.gethostname()}-{index}"])
+        for index in range(workers)
+    ]
+    while any(process.poll() is None for process in processes):
+        time.sleep(POLL_SECONDS)
+        log_progress(queue)
+    # Units of workers that died are re-queued; finish them here if no worker is left
+    if queue.remaining():
+        logger.warning(f"{queue.remaining()} units left after the workers exited; crawling them in-process.")
+        run_worker(queue, f"{socket.gethostname()}-coordinator", shard_root)
+    log_progress(queue)
+
+    failed = queue.failed_units()
+    for unit in failed:
+        logger.error(f"Unit {unit['category']} page {unit['page']} failed after {unit['attempts']} attempts: {unit['error']}")
+    stats = merge_shards(config, shard_root, queue.crawl_timestamp(), full_crawl=not failed)
+    logger.info(f"Merged {stats['records']} records from {stats['shards']} shards "
+                f"({stats['duplicates']} crawled by several workers).")
+    return len(failed)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Crawl with several worker processes over a lease-based work queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Seed the queue, run local workers, and merge their shards.")
+    run_parser.add_argument("--workers", type=int, default=None, help="Local worker processes (default: [DISTRIBUTED]).")
+    run_parser.add_argument("--reset", action="store_true", help="Start a new crawl even if the last one is unfinished.")
+    seed_parser = subparsers.add_parser("seed", help="Queue a new crawl for workers started separately.")
+    seed_parser.add_argument("--reset", action="store_true", help="Start a new crawl even if the last one is unfinished.")
+    worker_parser = subparsers.add_parser("worker", help="Lease and crawl units until the queue is drained.")
+    worker_parser.add_argument("--id", default=None, help="Worker id and shard folder name (default: <host>-<pid>).")
+    worker_parser.add_argument("--max-units", type=int, default=None, help="Stop after this many units.")
+    subparsers.add_parser("status", help="Show the queue progress and per-worker throughput.")
+    subparsers.add_parser("merge", help="Merge the shards into the output folder.")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    shard_root = config.get('DISTRIBUTED', 'SHARD_DIRECTORY', fallback='shards')
+    with queue_from_config(config) as queue:
+        if args.command == "run":
+            workers = args.workers or config.getint('DISTRIBUTED', 'WORKERS', fallback=4)
+            sys.exit(1 if coordinate(config, queue, workers, args.reset) else 0)
+        elif args.command == "seed":
+            if not seed_crawl(config, queue, args.reset):
+                print("An unfinished crawl is queued; use --reset to replace it.")
+        elif args.command == "worker":
+            run_worker(queue, args.id or default_worker_id(), shard_root, args.max_units)
+        elif args.command == "status":
+            log_progress(queue)
+        else:
+            if queue.remaining():
+                logger.warning(f"{queue.remaining()} units are still pending or leased.")
+            stats = merge_shards(config, shard_root, queue.crawl_timestamp() or int(time.time() * 1000),
+                                 full_crawl=not queue.failed_units() and not queue.remaining())
+            print(f"Merged {stats['records']} records from {stats['shards']} shards "
+                  f"({stats['duplicates']} crawled by several workers).")
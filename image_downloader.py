@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator
+from urllib.parse import urlparse
+
+import requests
+
+import json_codec
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+BUFFER_SIZE = 1024 * 1024  # Read/write buffer for image bodies
+N_ATTEMPTS = 3
+WAIT_TIME = 3
+
+
+class ImageDownloader:
+    """
+    Image stage, run after the product crawl.
+
+    Reads the imageLinks URLs of the scraped products and downloads them with a bounded
+    thread pool. Each URL is stored once, as <sha1 of the URL>.<ext>, and its ETag /
+    Last-Modified validators are kept in a manifest so later runs send conditional GETs
+    and skip unchanged images (304 Not Modified).
+    """
+
+    def __init__(self, image_directory: str, user_agent: str, max_workers: int = 8) -> None:
+        self.image_directory = image_directory
+        self.user_agent = user_agent
+        self.max_workers = max_workers
+        os.makedirs(image_directory, exist_ok=True)
+        self.manifest_path = os.path.join(image_directory, MANIFEST_FILE)
+        self.manifest = self.load_manifest()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {"downloaded": 0, "not_modified": 0, "failed": 0}
+
+    def load_manifest(self) -> Dict[str, dict]:
+        if not os.path.isfile(self.manifest_path):
+            return {}
+        try:
+            return json_codec.load_file(self.manifest_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return {}
+
+    def save_manifest(self) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        json_codec.dump_file(self.manifest, tmp_path)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def session(self) -> requests.Session:
+        """One session (and connection pool) per worker thread."""
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+            self.local.session.headers.update({
+                "User-Agent": self.user_agent,
+                "Accept": "image/avif,image/webp,*/*",
+                "Accept-Language": "en-US,en;q=0.5",
+                "Accept-Encoding": "gzip, deflate, br",
+                "Connection": "keep-alive",
+            })
+        return self.local.session
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def file_name(self, url: str) -> str:
+        ext = os.path.splitext(urlparse(url).path)[1].lower() or ".jpg"
+        return self.url_key(url) + ext
+
+    def download(self, url: str) -> None:
+        """Download one image unless the server reports it unchanged."""
+        key = self.url_key(url)
+        with self.lock:
+            entry = dict(self.manifest.get(key, {}))
+        file_path = os.path.join(self.image_directory, entry.get("file") or self.file_name(url))
+
+        headers = {"Referer": url}
+        if os.path.isfile(file_path):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        for attempt in range(1, N_ATTEMPTS + 1):
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=30) as response:
+                    if response.status_code == 304:
+                        self._count("not_modified")
+                        return
+                    response.raise_for_status()
+                    tmp_path = file_path + ".part"
+                    with open(tmp_path, "wb", buffering=BUFFER_SIZE) as fd:
+                        for chunk in response.iter_content(BUFFER_SIZE):
+                            fd.write(chunk)
+                    os.replace(tmp_path, file_path)
+                    validators = {
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }
+                break
+            except requests.exceptions.HTTPError as e:
+                # 4xx will not get better by retrying
+                if e.response is not None and e.response.status_code < 500:
+                    logger.warning(f"Image not available ({e.response.status_code}): {url}")
+                    self._count("failed")
+                    return
+                error = e
+            except requests.exceptions.RequestException as e:
+                error = e
+            if attempt == N_ATTEMPTS:
+                logger.error(f"Could not download {url}: {error}")
+                self._count("failed")
+                return
+            time.sleep(WAIT_TIME)
+
+        with self.lock:
+            self.manifest[key] = {"url": url, "file": os.path.basename(file_path), **validators}
+        self._count("downloaded")
+
+    def _count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+    def run(self, urls: Iterator[str]) -> Dict[str, int]:
+        """Download every distinct URL with at most max_workers concurrent requests."""
+        unique_urls = {}
+        for url in urls:
+            unique_urls.setdefault(self.url_key(url), url)
+        logger.info(f"Downloading {len(unique_urls)} distinct images with {self.max_workers} workers.")
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                # Consume the results so exceptions are not silently lost
+                for _ in pool.map(self.download, unique_urls.values()):
+                    pass
+        finally:
+            self.save_manifest()
+        logger.info(f"Images: {self.stats}")
+        return self.stats
+
+
+def iter_image_urls(folder_path: str) -> Iterator[str]:
+    """Yields the imageLinks URLs of every product record in a JSONL folder."""
+    for file_name in os.listdir(folder_path):
+        if not file_name.endswith(".jsonl"):
+            continue
+        for record in json_codec.iter_jsonl(os.path.join(folder_path, file_name)):
+            links = record.get("imageLinks") or []
+            for url in ([links] if isinstance(links, str) else links):
+                if url:
+                    yield url
+
+
+if __name__ == "__main__":
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+
+    parser = argparse.ArgumentParser(description="Download the product images referenced by the scraped records.")
+    parser.add_argument("--input", default=config['FOLDERS']['JSONL_OUTPUT'], help="Folder with the product .jsonl files.")
+    parser.add_argument("--output", default=config['FOLDERS']['IMAGE_DIRECTORY'], help="Image directory.")
+    parser.add_argument("--workers", type=int, default=8, help="Maximum concurrent downloads.")
+    args = parser.parse_args()
+
+    downloader = ImageDownloader(args.output, config['USER_AGENT']['USER_AGENT'], args.workers)
+    downloader.run(iter_image_urls(args.input))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+JSON encoding and decoding for every reader and writer of the pipeline.
+
+The fastest installed backend is used (orjson, then the stdlib json module); JSON_CODEC=json
+in the environment, or set_backend(), forces one. Whatever the backend:
+- decoding takes bytes (or str) directly, so files are read in binary mode;
+- encoding produces compact UTF-8 with non-ASCII characters unescaped (ensure_ascii=False),
+  and indent=True gives two-space indentation;
+- both backends write the same bytes for the records of the scraper, so files written by
+  one compare byte-for-byte with files written by the other.
+"""
+
+import os
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND_PREFERENCE = ["orjson", "json"]
+
+
+def _stdlib_loads(data: Union[bytes, str]) -> Any:
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj: Any, indent: bool = False) -> bytes:
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_loads(data: Union[bytes, str]) -> Any:
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # NaN/Infinity literals and integers above 64 bits, which only the stdlib accepts
+        return json.loads(data)
+
+
+def _orjson_dumps(obj: Any, indent: bool = False) -> bytes:
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0))
+    except orjson.JSONEncodeError:
+        # Types orjson does not serialize (e.g. float subclasses, integers above 64 bits)
+        return _stdlib_dumps(obj, indent)
+
+
+BACKENDS: Dict[str, Dict[str, Callable]] = {"json": {"loads": _stdlib_loads, "dumps": _stdlib_dumps}}
+if orjson is not None:
+    BACKENDS["orjson"] = {"loads": _orjson_loads, "dumps": _orjson_dumps}
+
+BACKEND = None
+_loads = _dumps = None
+
+
+def set_backend(name: str) -> None:
+    """Selects a backend by name ('orjson' or 'json'); raises ValueError if it is not installed."""
+    global BACKEND, _loads, _dumps
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend '{name}' is not available (installed: {', '.join(sorted(BACKENDS))}).")
+    BACKEND = name
+    _loads, _dumps = BACKENDS[name]["loads"], BACKENDS[name]["dumps"]
+
+
+set_backend(os.environ.get("JSON_CODEC") or next(name for name in BACKEND_PREFERENCE if name in BACKENDS))
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Decodes a JSON document from UTF-8 bytes (preferred) or str."""
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return _loads(data)
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Encodes obj as UTF-8 JSON."""
+    return _dumps(obj, indent)
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Encodes obj as a JSON str (for text sinks such as stdout or SQLite TEXT columns)."""
+    return _dumps(obj, indent).decode("utf-8")
+
+
+def load_file(path: str) -> Any:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def dump_file(obj: Any, path: str, indent: bool = False) -> None:
+    if BACKEND == "json":
+        # Streamed, instead of building the whole document in memory as str and then as bytes
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, **({"indent": 2} if indent else {"separators": (",", ":")}))
+        return
+    with open(path, "wb") as f:
+        f.write(_dumps(obj, indent))
+
+
+def iter_jsonl(path: str) -> Iterator[Any]:
+    """Yields the records of a JSONL file; blank lines are skipped."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+
+def write_jsonl(path: str, records: Iterable[Any]) -> None:
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(_dumps(record) + b"\n")
@@ -1,18 +1,25 @@
-import json
 import csv
 import os
+import argparse
 
-def json_to_csv(json_file, csv_file):
+import json_codec
+from catalog_store import iter_catalog_records
+from profiling import add_profile_arguments, maybe_profile
+
+def json_to_csv(json_file, csv_file, from_catalog=False):
     """
     Converts a JSON file to a CSV file, ensuring all keys are considered as columns and missing values are filled with "Not found".
 
-    :param json_file: Path to the input JSON file.
+    :param json_file: Path to the input JSON file (or catalog database, see from_catalog).
     :param csv_file: Path to the output CSV file.
+    :param from_catalog: json_file is a catalog database (see catalog_store.py).
     """
     try:
-        # Read the JSON file
-        with open(json_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        # Read the JSON file (or the catalog database)
+        if from_catalog:
+            data = list(iter_catalog_records(json_file))
+        else:
+            data = json_codec.load_file(json_file)
 
         # Ensure the JSON data is a list of dictionaries
         if not isinstance(data, list):
@@ -49,12 +56,22 @@ def json_to_csv(json_file, csv_file):
         print(f"An error occurred: {e}")
 
 # Example usage
-json_file_path = 'results/flattened_output.json'  # Replace with your JSON file path
-csv_file_path = 'results/output.csv'  # Replace with your desired CSV output path
+if __name__ == "__main__":
+    json_file_path = 'results/flattened_output.json'  # Replace with your JSON file path
+    csv_file_path = 'results/output.csv'  # Replace with your desired CSV output path
+
+    parser = argparse.ArgumentParser(description="Convert the scraped products to CSV.")
+    parser.add_argument("--catalog", default=None, help="Read the products from this catalog database instead.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
 
-# Ensure the output directory exists
-os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
+    # Ensure the output directory exists
+    os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
 
-# Convert JSON to CSV
-json_to_csv(json_file_path, csv_file_path)
+    # Convert JSON to CSV
+    with maybe_profile("json_to_csv", args):
+        if args.catalog:
+            json_to_csv(args.catalog, csv_file_path, from_catalog=True)
+        else:
+            json_to_csv(json_file_path, csv_file_path)
 
@@ -2,14 +2,19 @@ import os
 import sys
 import subprocess
 import logging
+import argparse
 import datetime
 
+from profiling import new_run_dir, print_run_summary
+
 # --- Configuration ---
 JSONL_OUTPUT_FOLDER = "jsonl_output" # Define the JSONL output folder name
 RESULTS_FOLDER = "results"          # Define the results folder name
 SCRAPER_SCRIPT = "scraper_makro.py"
 MERGE_SCRIPT = "merge_jsonl.py"
 CSV_CONVERTER_SCRIPT = "json_to_csv.py"
+IMAGE_SCRIPT = "image_downloader.py"
+DOWNLOAD_IMAGES = False             # Run the image stage after the scraper
 # --- End Configuration ---
 
 # Configure logging
@@ -35,12 +40,12 @@ def create_folders():
         logger.error(f"Error creating folders: {e}")
         sys.exit(1) # Exit if folders can't be created
 
-def run_script(script_name):
+def run_script(script_name, extra_args=()):
     """Runs a given Python script as a subprocess."""
     try:
         logger.info(f"--- Running script: {script_name} ---")
         process = subprocess.run(
-            [sys.executable, script_name],
+            [sys.executable, script_name, *extra_args],
             check=True, # Raise an exception if the script fails (non-zero exit code)
             capture_output=True, # Capture stdout/stderr
             text=True, # Decode stdout/stderr as text
@@ -64,22 +69,33 @@ def run_script(script_name):
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scraper, merge and CSV stages.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile every stage into one profiles/run_<timestamp> directory.")
+    args = parser.parse_args()
+
     logger.info("=== Starting Main Orchestration Script ===")
 
     create_folders()
+    profile_dir = new_run_dir() if args.profile else None
+    profile_args = ["--profile", "--profile-dir", profile_dir] if profile_dir else []
 
     # Step 1: Run the scraper
-    if not run_script(SCRAPER_SCRIPT):
+    if not run_script(SCRAPER_SCRIPT, profile_args):
         logger.error("Scraper script failed. Aborting.")
         sys.exit(1)
 
+    # Optional: download product images (does not block the data pipeline)
+    if DOWNLOAD_IMAGES and not run_script(IMAGE_SCRIPT):
+        logger.error("Image download script failed. Continuing without images.")
+
     # Step 2: Merge JSONL files
-    if not run_script(MERGE_SCRIPT):
+    if not run_script(MERGE_SCRIPT, profile_args):
         logger.error("Merging script failed. Aborting.")
         sys.exit(1)
 
     # Step 3: Convert merged JSONL to CSV
-    if not run_script(CSV_CONVERTER_SCRIPT):
+    if not run_script(CSV_CONVERTER_SCRIPT, profile_args):
         logger.error("CSV conversion script failed.")
         sys.exit(1) # Still exit, but maybe less critical than previous steps failing
 
@@ -87,3 +103,6 @@ if __name__ == "__main__":
     logger.info(f"Individual JSONL files are in: ./{JSONL_OUTPUT_FOLDER}")
     logger.info(f"Merged JSONL and CSV files are in: ./{RESULTS_FOLDER}")
     logger.info(f"Detailed log for this run: {log_file}")
+    if profile_dir:
+        print_run_summary(profile_dir)
+        logger.info(f"Profiles of this run are in: ./{profile_dir}")
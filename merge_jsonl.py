@@ -1,6 +1,10 @@
 import os
-import json
-import jsonlines
+import argparse
+
+import json_codec
+from catalog_store import iter_catalog_records
+from merged_catalog import write_merged_jsonl
+from profiling import add_profile_arguments, maybe_profile
 
 def merge_jsonl_to_json(input_dir, output_file):
     """
@@ -9,28 +13,73 @@ def merge_jsonl_to_json(input_dir, output_file):
     Args:
         input_dir (str): Path to the directory containing .jsonl files.
         output_file (str): Path to the output JSON file.
-    """
-    all_data = []
-
-    # Iterate over all files in the directory
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(".jsonl"):
-            file_path = os.path.join(input_dir, file_name)
 
-            # Read each .jsonl file and append its contents to the list
-            with jsonlines.open(file_path) as reader:
-                for obj in reader:
-                    all_data.append(obj)
+    Returns:
+        list: The merged records, so they can be reused without parsing the files again.
+    """
+    # Read every .jsonl file of the directory, in file name order
+    all_data = list(iter_jsonl_folder(input_dir))
 
     # Write all collected data into a single JSON file
-    with open(output_file, "w", encoding="utf-8") as json_file:
-        json.dump(all_data, json_file, ensure_ascii=False, indent=4)
+    json_codec.dump_file(all_data, output_file, indent=True)
 
     print(f"Merged {len(all_data)} records from .jsonl files into {output_file}")
+    return all_data
+
+def merge_catalog_to_json(db_path, output_file):
+    """
+    Writes every record of the SQLite catalog (see catalog_store.py) into a single JSON file.
+
+    Args:
+        db_path (str): Path to the catalog database.
+        output_file (str): Path to the output JSON file.
+
+    Returns:
+        list: The merged records.
+    """
+    all_data = list(iter_catalog_records(db_path))
+
+    json_codec.dump_file(all_data, output_file, indent=True)
+
+    print(f"Merged {len(all_data)} records from catalog {db_path} into {output_file}")
+    return all_data
+
+def iter_jsonl_folder(input_dir):
+    """
+    Yields the records of every .jsonl file in the directory, in file name order.
+    """
+    for file_name in sorted(os.listdir(input_dir)):
+        if file_name.endswith(".jsonl"):
+            yield from json_codec.iter_jsonl(os.path.join(input_dir, file_name))
+
+def merge_to_indexed_jsonl(records, output_file):
+    """
+    Writes the records, sorted by category, to a single JSON Lines file plus its offset index and
+    category tree (see merged_catalog.py and category_tree.py), for O(1) lookups of single
+    products and contiguous row ranges per category.
+
+    Args:
+        records (iterable): Product records.
+        output_file (str): Path to the merged .jsonl file; the index is written next to it (.idx).
+    """
+    count = write_merged_jsonl(records, output_file)
+    print(f"Merged {count} records into {output_file} (indexed)")
 
 # Example usage
 if __name__ == "__main__":
     input_directory = "jsonl_out"  # Replace with your input directory path
     output_file = "results/results.json"       # Output file name
+    merged_jsonl_file = "results/merged_products.jsonl"  # Indexed JSON Lines output
+
+    parser = argparse.ArgumentParser(description="Merge the scraped products into a single JSON file.")
+    parser.add_argument("--catalog", default=None, help="Read the products from this catalog database instead.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
 
-    merge_jsonl_to_json(input_directory, output_file)
+    with maybe_profile("merge_jsonl", args):
+        if args.catalog:
+            records = merge_catalog_to_json(args.catalog, output_file)
+        else:
+            records = merge_jsonl_to_json(input_directory, output_file)
+        # Same records for the indexed file: every source is read and decoded only once
+        merge_to_indexed_jsonl(records, merged_jsonl_file)
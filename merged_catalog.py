@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import argparse
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import json_codec
+from category_tree import CategoryTree, category_path, sort_key, tree_path_for
+
+# Offset index written next to the merged JSONL (<name>.idx): a header followed by an
+# open-addressing hash table of fixed-size slots (key hash, byte offset, byte length).
+INDEX_MAGIC = b"MKIX"
+INDEX_VERSION = 1
+HEADER = struct.Struct("<4sIQQ")  # magic, version, number of slots, number of records
+SLOT = struct.Struct("<QQI")      # product ID hash (0 = empty slot), offset, length
+
+
+def index_path_for(jsonl_path: str) -> str:
+    return os.path.splitext(jsonl_path)[0] + ".idx"
+
+
+def key_hash(product_id: str) -> int:
+    """64-bit hash of a product ID; never 0, which marks an empty slot."""
+    value = int.from_bytes(hashlib.blake2b(product_id.encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1
+
+
+def write_index(index_path: str, entries: Dict[str, tuple]) -> None:
+    """
+    Writes the offset index of {product ID: (offset, length)}. The table has a power-of-two
+    size of at least twice the number of records, so lookups need about one probe.
+    """
+    n_slots = 1
+    while n_slots < 2 * max(len(entries), 1):
+        n_slots *= 2
+    table = bytearray(n_slots * SLOT.size)
+    for product_id, (offset, length) in entries.items():
+        hashed = key_hash(product_id)
+        slot = hashed & (n_slots - 1)
+        while SLOT.unpack_from(table, slot * SLOT.size)[0]:
+            slot = (slot + 1) & (n_slots - 1)
+        SLOT.pack_into(table, slot * SLOT.size, hashed, offset, length)
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, n_slots, len(entries)))
+        f.write(table)
+    os.replace(tmp_path, index_path)
+
+
+def write_merged_jsonl(records: Iterable[Dict[str, Any]], output_file: str) -> int:
+    """
+    Writes the records, sorted by category path, to a merged JSONL file plus its offset index and
+    category tree (see category_tree.py). When a product ID occurs more than once, the last record
+    wins in the index. Returns the number of records written.
+    """
+    records = sorted(records, key=lambda record: sort_key(record.get("categoryInSupermarket")))
+    entries = {}
+    tree = CategoryTree()
+    with open(output_file, "wb") as f:
+        offset = 0
+        for row, record in enumerate(records):
+            line = json_codec.dumps_bytes(record) + b"\n"
+            product_id = record.get("productIdInSupermarket")
+            if product_id:
+                entries[str(product_id)] = (offset, len(line) - 1)
+            f.write(line)
+            tree.add(category_path(record.get("categoryInSupermarket")), row, offset, offset + len(line))
+            offset += len(line)
+    write_index(index_path_for(output_file), entries)
+    tree.save(tree_path_for(output_file))
+    return len(records)
+
+
+class MergedCatalog:
+    """
+    Random access to a merged JSONL file through its offset index.
+
+    Both files are memory-mapped: opening costs two mmap calls whatever the catalog size,
+    and get() decodes only the requested record.
+    """
+
+    def __init__(self, jsonl_path: str, index_path: Optional[str] = None) -> None:
+        self.jsonl_path = jsonl_path
+        self.index_path = index_path or index_path_for(jsonl_path)
+        self._files = [open(self.jsonl_path, "rb"), open(self.index_path, "rb")]
+        self.data = self._map(self._files[0])
+        self.index = self._map(self._files[1])
+        magic, version, self.n_slots, self.n_records = HEADER.unpack_from(self.index, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"{self.index_path} is not a merged catalog index (version {INDEX_VERSION})")
+
+    @staticmethod
+    def _map(f) -> Any:
+        # mmap cannot map empty files
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def _candidates(self, product_id: str) -> Iterator[bytes]:
+        """JSON lines whose slot hash matches the product ID (normally exactly one)."""
+        hashed = key_hash(product_id)
+        mask = self.n_slots - 1
+        slot = hashed & mask
+        while True:
+            stored, offset, length = SLOT.unpack_from(self.index, HEADER.size + slot * SLOT.size)
+            if stored == 0:
+                return
+            if stored == hashed:
+                yield self.data[offset:offset + length]
+            slot = (slot + 1) & mask
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """The decoded record of a product, or None."""
+        for line in self._candidates(product_id):
+            record = json_codec.loads(line)
+            if str(record.get("productIdInSupermarket")) == product_id:
+                return record
+        return None
+
+    def __contains__(self, product_id: str) -> bool:
+        return self.get(product_id) is not None
+
+    def __len__(self) -> int:
+        return self.n_records
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """All records, in file order."""
+        return self.iter_bytes(0, len(self.data))
+
+    def iter_bytes(self, byte_start: int, byte_end: int) -> Iterator[Dict[str, Any]]:
+        """The records of a byte range made of whole lines, e.g. a category tree node."""
+        start = byte_start
+        while start < byte_end:
+            end = self.data.find(b"\n", start, byte_end)
+            end = byte_end if end == -1 else end
+            if end > start:
+                yield json_codec.loads(self.data[start:end])
+            start = end + 1
+
+    def category_tree(self) -> CategoryTree:
+        """The category tree written next to the merged file."""
+        return CategoryTree.load(tree_path_for(self.jsonl_path))
+
+    def close(self) -> None:
+        for mapped in (getattr(self, "data", None), getattr(self, "index", None)):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self) -> "MergedCatalog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look products up in a merged JSONL file through its offset index.")
+    parser.add_argument("merged", help="Merged JSONL file (its .idx index must exist).")
+    parser.add_argument("product_ids", nargs="+", help="productIdInSupermarket values to print.")
+    args = parser.parse_args()
+
+    with MergedCatalog(args.merged) as catalog:
+        for product_id in args.product_ids:
+            record = catalog.get(product_id)
+            if record is None:
+                sys.stderr.write(f"Product not found: {product_id}\n")
+            else:
+                sys.stdout.write(json_codec.dumps(record) + "\n")
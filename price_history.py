@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import sys
+import sqlite3
+import argparse
+import datetime
+from typing import Any, Dict, List, Optional
+
+import json_codec
+
+# Product fields tracked over time (JSONL field names are used as column names)
+PRICE_FIELDS = ["priceWithTax", "price", "offerPrice", "unitPrice", "promotion"]
+
+
+class PriceHistory:
+    """
+    Append-only time series of product prices, stored in SQLite.
+
+    An observation (one row per product and crawl timestamp) is only written when at least
+    one of PRICE_FIELDS differs from the previous observation of that product, so an
+    unchanged catalog costs nothing to record. Observations are indexed by product and by
+    (category, timestamp) for per-product and per-category range queries.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 500) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.create_schema()
+
+    def create_schema(self) -> None:
+        columns = ", ".join(f'"{field}"' for field in PRICE_FIELDS)
+        self.conn.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS price_observations (
+                productId TEXT NOT NULL,
+                crawlTs INTEGER NOT NULL,
+                category TEXT,
+                {columns},
+                PRIMARY KEY (productId, crawlTs)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_observations_category_ts
+                ON price_observations (category, crawlTs);
+            CREATE TABLE IF NOT EXISTS latest_prices (
+                productId TEXT PRIMARY KEY,
+                crawlTs INTEGER NOT NULL,
+                {columns}
+            ) WITHOUT ROWID;
+        """)
+
+    def record(self, items: Dict[str, Any], crawl_ts: int) -> bool:
+        """
+        Record the price fields of a product seen at crawl_ts.
+        Returns True if they changed since the last observation (and were written).
+        """
+        product_id = items.get("productIdInSupermarket")
+        if not product_id:
+            return False
+        values = [self._normalize(items.get(field)) for field in PRICE_FIELDS]
+
+        previous = self.conn.execute(
+            "SELECT * FROM latest_prices WHERE productId = ?", (product_id,)
+        ).fetchone()
+        if previous is not None and [previous[field] for field in PRICE_FIELDS] == values:
+            return False
+
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO price_observations VALUES ({', '.join('?' * (len(values) + 3))})",
+            [product_id, crawl_ts, items.get("categoryInSupermarket")] + values
+        )
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO latest_prices VALUES ({', '.join('?' * (len(values) + 2))})",
+            [product_id, crawl_ts] + values
+        )
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+        return True
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        """Store numbers as REAL and anything else as text (None stays NULL)."""
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        return str(value)
+
+    def flush(self) -> None:
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self) -> "PriceHistory":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def product_history(self, product_id: str, start: Optional[int] = None,
+                        end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Observations of one product between start and end (ms timestamps, inclusive).
+        """
+        where, params = self._time_range(start, end)
+        rows = self.conn.execute(
+            f"SELECT * FROM price_observations WHERE productId = ?{where} ORDER BY crawlTs",
+            [product_id] + params
+        )
+        return [dict(row) for row in rows]
+
+    def category_history(self, category_prefix: str, start: Optional[int] = None,
+                         end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Observations of every product whose categoryInSupermarket is category_prefix or
+        one of its subcategories (e.g. "Frescos/Carne"), between start and end.
+        """
+        where, params = self._time_range(start, end)
+        rows = self.conn.execute(
+            "SELECT * FROM price_observations "
+            f"WHERE (category = ? OR (category >= ? AND category < ?)){where} "
+            "ORDER BY category, productId, crawlTs",
+            # "/" + 1 == "0": the half-open range covers exactly the "<prefix>/..." strings
+            [category_prefix, category_prefix + "/", category_prefix + "0"] + params
+        )
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _time_range(start: Optional[int], end: Optional[int]):
+        where, params = "", []
+        if start is not None:
+            where += " AND crawlTs >= ?"
+            params.append(start)
+        if end is not None:
+            where += " AND crawlTs <= ?"
+            params.append(end)
+        return where, params
+
+
+def parse_date(value: str) -> int:
+    """ISO date/datetime (e.g. 2025-04-01 or 2025-04-01T12:00) to a ms timestamp."""
+    return int(datetime.datetime.fromisoformat(value).timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the price history store.")
+    parser.add_argument("database", help="Path to the price history SQLite file.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--product", help="productIdInSupermarket to query.")
+    group.add_argument("--category", help="Category prefix to query, e.g. 'Frescos/Carne'.")
+    parser.add_argument("--since", type=parse_date, help="Start date (ISO format).")
+    parser.add_argument("--until", type=parse_date, help="End date (ISO format).")
+    args = parser.parse_args()
+
+    with PriceHistory(args.database) as history:
+        if args.product:
+            observations = history.product_history(args.product, args.since, args.until)
+        else:
+            observations = history.category_history(args.category, args.since, args.until)
+    for observation in observations:
+        sys.stdout.write(json_codec.dumps(observation) + "\n")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import sqlite3
+import argparse
+import datetime
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_codec
+from price_history import parse_date
+from white_labels import BRAND_TYPES, WhiteLabelMatcher, load_white_label_brands, record_brand_type
+
+# Same price column and category separator as brand_price.py
+PRICE_COLUMN = "unitPrice"
+CATEGORY_SEPARATOR = "/"
+
+
+def category_levels(category: Any, separator: str = CATEGORY_SEPARATOR) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Splits a categoryInSupermarket string into (main category, first subcategory), the same
+    way brand_price.split_category_levels does. Missing levels are returned as None.
+    """
+    if not isinstance(category, str):
+        return None, None
+    parts = [part.strip() or None for part in category.split(separator, 2)]
+    return parts[0], parts[1] if len(parts) > 1 else None
+
+
+class PriceRollups:
+    """
+    Materialized per-crawl white-label vs. non-white-label price aggregates.
+
+    While a crawl runs, products are folded into in-memory (sum, count) aggregates per
+    (main category, first subcategory, brand type); commit_crawl() stores them once the crawl
+    is finished. Historical crawls are never recomputed, and trend queries only read the
+    small aggregate table.
+    """
+
+    def __init__(self, db_path: str, white_brands: WhiteLabelMatcher) -> None:
+        self.white_brands = white_brands
+        self.aggregates = defaultdict(lambda: [0.0, 0])
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS crawl_rollups (
+                crawlTs INTEGER NOT NULL,
+                mainCategory TEXT NOT NULL,
+                subcategory TEXT NOT NULL,
+                brandType TEXT NOT NULL,
+                priceSum REAL NOT NULL,
+                productCount INTEGER NOT NULL,
+                PRIMARY KEY (crawlTs, mainCategory, subcategory, brandType)
+            ) WITHOUT ROWID;
+        """)
+
+    def add(self, items: Dict[str, Any]) -> None:
+        """Fold one product record of the running crawl into the aggregates."""
+        main_category, subcategory = category_levels(items.get("categoryInSupermarket"))
+        price = items.get(PRICE_COLUMN)
+        # Like brand_price, products without a main category (e.g. "/Quesos/Frescos") are left out
+        if main_category is None or subcategory is None or isinstance(price, bool) or not isinstance(price, (int, float)) or price <= 0:
+            return
+        aggregate = self.aggregates[(main_category, subcategory, record_brand_type(items, self.white_brands))]
+        aggregate[0] += price
+        aggregate[1] += 1
+
+    def commit_crawl(self, crawl_ts: int) -> int:
+        """Store the aggregates of the finished crawl and reset them. Returns the number of rows written."""
+        rows = [(crawl_ts,) + key + tuple(value) for key, value in self.aggregates.items()]
+        with self.conn:
+            self.conn.execute("DELETE FROM crawl_rollups WHERE crawlTs = ?", (crawl_ts,))
+            self.conn.executemany("INSERT INTO crawl_rollups VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.aggregates.clear()
+        return len(rows)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def query(self, start: Optional[int] = None, end: Optional[int] = None,
+              main_category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Raw per-crawl aggregates between start and end (ms timestamps, inclusive)."""
+        sql = "SELECT * FROM crawl_rollups WHERE crawlTs BETWEEN ? AND ?"
+        params = [start if start is not None else 0, end if end is not None else sys.maxsize]
+        if main_category:
+            sql += " AND mainCategory = ?"
+            params.append(main_category)
+        cursor = self.conn.execute(sql + " ORDER BY crawlTs, mainCategory, subcategory, brandType", params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def daily_gap(self, start: Optional[int] = None, end: Optional[int] = None,
+                  main_category: Optional[str] = None, subcategory: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Daily trend of the mean price per brand type and of the gap between them.
+        When a day has several crawls, its last crawl is used.
+        """
+        sql = """
+            WITH daily AS (
+                SELECT MAX(crawlTs) AS crawlTs
+                FROM (SELECT DISTINCT crawlTs FROM crawl_rollups WHERE crawlTs BETWEEN ? AND ?)
+                GROUP BY date(crawlTs / 1000, 'unixepoch', 'localtime')
+            )
+            SELECT r.crawlTs, r.brandType, SUM(r.priceSum) / SUM(r.productCount), SUM(r.productCount)
+            FROM crawl_rollups r JOIN daily d ON r.crawlTs = d.crawlTs
+            WHERE 1 = 1
+        """
+        params = [start if start is not None else 0, end if end is not None else sys.maxsize]
+        for column, value in (("mainCategory", main_category), ("subcategory", subcategory)):
+            if value:
+                sql += f" AND r.{column} = ?"
+                params.append(value)
+        sql += " GROUP BY r.crawlTs, r.brandType ORDER BY r.crawlTs"
+
+        days = {}
+        for crawl_ts, brand, mean_price, count in self.conn.execute(sql, params):
+            day = days.setdefault(crawl_ts, {
+                "day": datetime.date.fromtimestamp(crawl_ts / 1000).isoformat(), "crawlTs": crawl_ts
+            })
+            day[f"{brand}_price"] = mean_price
+            day[f"{brand}_count"] = count
+
+        trend = []
+        for day in days.values():
+            white, non_white = day.get(f"{BRAND_TYPES[0]}_price"), day.get(f"{BRAND_TYPES[1]}_price")
+            day["gap"] = non_white - white if white is not None and non_white is not None else None
+            day["gap_pct"] = day["gap"] / non_white * 100 if day["gap"] is not None else None
+            trend.append(day)
+        return trend
+
+
+def plot_gap_trend(trend: List[Dict[str, Any]], title: str, output_path: Optional[str] = None) -> None:
+    """Line chart of the daily mean price per brand type. Saved to output_path if given, shown otherwise."""
+    import matplotlib
+    if output_path:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    days = [datetime.date.fromisoformat(day["day"]) for day in trend]
+    fig, ax = plt.subplots(figsize=(15, 8))
+    for brand in BRAND_TYPES:
+        ax.plot(days, [day.get(f"{brand}_price") for day in trend], marker="o", label=brand)
+    ax.set_title(title, fontsize=16)
+    ax.set_ylabel(f"Mean {PRICE_COLUMN} (€)", fontsize=12)
+    ax.legend(title="Brand Type")
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    if output_path:
+        fig.savefig(output_path)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def ingest_folder(rollups: PriceRollups, folder_path: str, crawl_ts: int) -> int:
+    """
+    Backfill: materialize the aggregates of an existing JSONL output folder as crawl crawl_ts.
+    Aggregates already added for the running crawl are discarded: the folder replaces them.
+    """
+    rollups.aggregates.clear()
+    for file_name in os.listdir(folder_path):
+        if file_name.endswith(".jsonl"):
+            for record in json_codec.iter_jsonl(os.path.join(folder_path, file_name)):
+                rollups.add(record)
+    return rollups.commit_crawl(crawl_ts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="White-label vs. non-white-label price rollups across crawls.")
+    parser.add_argument("database", help="Path to the rollups SQLite file (can be the price history file).")
+    parser.add_argument("--ingest", metavar="FOLDER", help="Materialize the aggregates of a JSONL output folder.")
+    parser.add_argument("--crawl-date", type=parse_date, help="Crawl date for --ingest (default: now).")
+    parser.add_argument("--days", type=int, default=90, help="Trend length in days.")
+    parser.add_argument("--main-category", help="Restrict the trend to a main category.")
+    parser.add_argument("--subcategory", help="Restrict the trend to a first-level subcategory.")
+    parser.add_argument("--output", help="Write the trend chart here instead of showing it.")
+    parser.add_argument("--white-label-file", default="white_label_brands.json")
+    args = parser.parse_args()
+
+    rollups = PriceRollups(args.database, load_white_label_brands(args.white_label_file))
+    if args.ingest:
+        crawl_ts = args.crawl_date or int(datetime.datetime.now().timestamp() * 1000)
+        print(f"Stored {ingest_folder(rollups, args.ingest, crawl_ts)} aggregate rows for {args.ingest}")
+    else:
+        start = int((datetime.datetime.now() - datetime.timedelta(days=args.days)).timestamp() * 1000)
+        trend = rollups.daily_gap(start, None, args.main_category, args.subcategory)
+        for day in trend:
+            sys.stdout.write(json_codec.dumps(day) + "\n")
+        scope = " / ".join(filter(None, [args.main_category, args.subcategory])) or "all categories"
+        if trend:
+            plot_gap_trend(trend, f"White-Label vs. Non-White-Label {PRICE_COLUMN}, last {args.days} days ({scope})", args.output)
+    rollups.close()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf8
+
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+
+# Fields computed per product by the scraper (fields_map plus the values set by the handlers).
+# The supermarket constants (name, postal code, currency, country) are not part of a record:
+# they are the same for every product of a store and are added when the record is serialized.
+RECORD_FIELDS = (
+    "productIdInSupermarket", "denomination", "description", "brand",
+    "isWhiteLabel", "whiteLabelFingerprint",
+    "priceWithTax", "price", "unitPrice", "unitPriceWithOffer", "offerPrice", "kgGross",
+    "isWeightArticle", "alwaysGoodPrice", "promotion", "percentPromotion",
+    "measuringUnit", "units", "rawIngredients", "manufacturer", "countryOfOrigin",
+    "categoryInSupermarket", "listingCategories", "nutritionInformation", "characteristics",
+    "imageLinks", "link",
+)
+STORE_CONSTANT_FIELDS = ("supermarket", "supermarketPostalCode", "currency", "country")
+
+_FIELD_SET = frozenset(RECORD_FIELDS)
+
+
+class ProductRecord:
+    """
+    One scraped product, stored in slots instead of a per-product dictionary.
+
+    Supports the small mapping interface the field handlers rely on (get, [], in), so a
+    record can be filled exactly like the dictionaries it replaces. Unset fields behave
+    like missing keys.
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, values: Optional[Mapping[str, Any]] = None) -> None:
+        """
+        :param values: Initial fields (e.g. a stored JSONL record); keys that are not
+            record fields, such as the supermarket constants, are ignored.
+        """
+        if values:
+            for key, value in values.items():
+                if key in _FIELD_SET:
+                    setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in _FIELD_SET else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _FIELD_SET:
+            raise KeyError(f"Unknown product field: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in _FIELD_SET and hasattr(self, key)
+
+    def keys(self) -> Iterator[str]:
+        return (key for key in RECORD_FIELDS if hasattr(self, key))
+
+    def items(self) -> Iterator:
+        return ((key, getattr(self, key)) for key in self.keys())
+
+    def copy(self) -> "ProductRecord":
+        record = ProductRecord()
+        for key, value in self.items():
+            setattr(record, key, value)
+        return record
+
+    def to_dict(self, keys: Iterable[str], constants: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        The output dictionary: the given keys in order, taken from constants (the per-store
+        supermarket attributes) or from the record, None when neither has them.
+        """
+        constants = constants or {}
+        return {key: constants[key] if key in constants else self.get(key) for key in keys}
+
+    def __repr__(self) -> str:
+        return f"ProductRecord({dict(self.items())!r})"
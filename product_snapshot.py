@@ -0,0 +1,167 @@
+# File: product_snapshot.py
+
+import os
+import pickle
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+import pandas as pd
+
+import json_codec
+
+from catalog_store import iter_catalog_batches, iter_catalog_records
+
+# --- Configuration ---
+SNAPSHOT_FILE_NAME = ".product_snapshot.pkl"  # Stored inside the JSONL folder unless a path is given
+SNAPSHOT_VERSION = 1
+# --- End Configuration ---
+
+logger = logging.getLogger(__name__)
+
+
+def folder_fingerprint(folder_path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Returns a {filename: (size, mtime_ns)} map for every .jsonl file in the folder.
+    Cheap to compute (one stat per file) and enough to detect added, removed or rewritten files.
+    """
+    fingerprint = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.endswith(".jsonl") and entry.is_file():
+                stat = entry.stat()
+                fingerprint[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return fingerprint
+
+
+def read_jsonl_files(folder_path: str, filenames: List[str]) -> Tuple[List[dict], List[str]]:
+    """
+    Reads the given .jsonl files and returns the records plus, for each record,
+    the name of the file it came from.
+    """
+    records = []
+    sources = []
+    for filename in filenames:
+        file_path = os.path.join(folder_path, filename)
+        try:
+            for product in json_codec.iter_jsonl(file_path):
+                records.append(product)
+                sources.append(filename)
+        except Exception as e:
+            logger.error(f"Error reading {filename}: {e}")
+    return records, sources
+
+
+def _read_snapshot(snapshot_path: str):
+    """Returns the stored snapshot dictionary, or None if missing/unreadable/outdated."""
+    if not os.path.isfile(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {snapshot_path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        logger.info(f"Snapshot {snapshot_path} has an old format, rebuilding.")
+        return None
+    return snapshot
+
+
+def _write_snapshot(snapshot_path: str, snapshot: dict) -> None:
+    """Writes the snapshot atomically so a crash never leaves a half-written file behind."""
+    tmp_path = snapshot_path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        logger.error(f"Could not write snapshot {snapshot_path}: {e}")
+
+
+def load_product_data(folder_path: str, snapshot_path: str = None) -> pd.DataFrame:
+    """
+    Loads all product data from the .jsonl files in a folder, going through a binary snapshot.
+    If folder_path is a catalog database file (see catalog_store.py), the products are read from it.
+
+    The snapshot keeps the product table plus the fingerprint of the folder it was built from:
+    - unchanged folder: the table is loaded straight from the snapshot;
+    - changed folder: only added/rewritten files are parsed, rows of removed files are dropped.
+    """
+    if os.path.isfile(folder_path):
+        df = pd.DataFrame(list(iter_catalog_records(folder_path)))
+        logger.info(f"Loaded {len(df)} products from catalog {folder_path}.")
+        return df
+    if not os.path.isdir(folder_path):
+        logger.error(f"Error: Folder not found: {folder_path}")
+        return pd.DataFrame()
+
+    snapshot_path = snapshot_path or os.path.join(folder_path, SNAPSHOT_FILE_NAME)
+    fingerprint = folder_fingerprint(folder_path)
+    snapshot = _read_snapshot(snapshot_path)
+
+    if snapshot is not None and snapshot["fingerprint"] == fingerprint:
+        df = snapshot["frame"]
+        logger.info(f"Loaded {len(df)} products from snapshot {snapshot_path}.")
+        return df
+
+    if snapshot is None:
+        logger.info(f"Loading product data from: {folder_path}")
+        old_df, old_sources, old_fingerprint = pd.DataFrame(), [], {}
+    else:
+        old_df, old_sources, old_fingerprint = snapshot["frame"], snapshot["sources"], snapshot["fingerprint"]
+
+    # Files to (re)parse and files whose previous rows are no longer valid
+    changed = [name for name, stat in fingerprint.items() if old_fingerprint.get(name) != stat]
+    stale = set(changed) | (old_fingerprint.keys() - fingerprint.keys())
+    if snapshot is not None:
+        logger.info(f"Snapshot outdated: {len(changed)} new/changed files, "
+                    f"{len(old_fingerprint.keys() - fingerprint.keys())} removed files.")
+
+    keep_mask = [source not in stale for source in old_sources]
+    kept_df = old_df[keep_mask] if len(old_df) else old_df
+    kept_sources = [source for source, keep in zip(old_sources, keep_mask) if keep]
+
+    new_records, new_sources = read_jsonl_files(folder_path, changed)
+    frames = [frame for frame in (kept_df, pd.DataFrame(new_records)) if len(frame)]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    sources = kept_sources + new_sources
+
+    if df.empty:
+        logger.error(f"No product data loaded from {folder_path}. Check the folder and file contents.")
+        return df
+
+    _write_snapshot(snapshot_path, {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fingerprint,
+        "sources": sources,
+        "frame": df,
+    })
+    logger.info(f"Loaded {len(df)} products.")
+    return df
+
+
+def iter_product_batches(folder_path: str, batch_size: int, columns: List[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams the products of a folder as DataFrames of at most batch_size rows, without
+    ever holding the whole catalog. If columns is given, only those columns are kept.
+    A catalog database file can be given instead of a folder.
+    """
+    if os.path.isfile(folder_path):
+        for records in iter_catalog_batches(folder_path, batch_size, columns):
+            yield pd.DataFrame(records, columns=columns)
+        return
+    if not os.path.isdir(folder_path):
+        logger.error(f"Error: Folder not found: {folder_path}")
+        return
+
+    batch = []
+    for filename in sorted(folder_fingerprint(folder_path)):
+        records, _ = read_jsonl_files(folder_path, [filename])
+        if columns is not None:
+            records = [{key: record.get(key) for key in columns} for record in records]
+        batch.extend(records)
+        while len(batch) >= batch_size:
+            yield pd.DataFrame(batch[:batch_size], columns=columns)
+            batch = batch[batch_size:]
+    if batch:
+        yield pd.DataFrame(batch, columns=columns)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional
+
+PROFILE_ROOT = "profiles"            # Run directories are created here: profiles/run_<timestamp>/
+SAMPLE_INTERVAL = 0.01               # Seconds between stack samples of the main thread
+MEMORY_SNAPSHOT_INTERVAL = 10.0      # Seconds between tracemalloc snapshots
+TRACEMALLOC_FRAMES = 10               # Frames kept per allocation; tracing costs more with deeper stacks
+TOP_FUNCTIONS = 20
+
+
+def new_run_dir(root: str = PROFILE_ROOT) -> str:
+    run_dir = os.path.join(root, datetime.datetime.now().strftime("run_%Y%m%d_%H%M%S"))
+    os.makedirs(run_dir, exist_ok=True)
+    return run_dir
+
+
+def add_profile_arguments(parser) -> None:
+    """The --profile / --profile-dir options shared by every pipeline entry point."""
+    parser.add_argument("--profile", action="store_true",
+                        help="Write CPU and memory profiles of this run (collapsed stacks, for flame graphs).")
+    parser.add_argument("--profile-dir", default=None,
+                        help=f"Run directory for the profiles (default: a new {PROFILE_ROOT}/run_<timestamp>).")
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _Sampler(threading.Thread):
+    """
+    Background thread that samples the main thread's stack every SAMPLE_INTERVAL seconds and
+    takes a tracemalloc snapshot every MEMORY_SNAPSHOT_INTERVAL seconds.
+    """
+
+    def __init__(self, stage: str, run_dir: str) -> None:
+        super().__init__(name=f"profiler-{stage}", daemon=True)
+        self.stage = stage
+        self.run_dir = run_dir
+        self.target_id = threading.main_thread().ident
+        self.stacks = Counter()
+        self.snapshots = 0
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        next_snapshot = time.monotonic() + MEMORY_SNAPSHOT_INTERVAL
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.target_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            if time.monotonic() >= next_snapshot:
+                self.write_memory_snapshot()
+                next_snapshot = time.monotonic() + MEMORY_SNAPSHOT_INTERVAL
+
+    def write_memory_snapshot(self) -> None:
+        """Live allocations by traceback, as collapsed stacks weighted by bytes."""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        path = os.path.join(self.run_dir, f"{self.stage}.mem.{self.snapshots:03d}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("traceback"):
+                # Frames are ordered from the oldest call to the allocation site
+                stack = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)
+                f.write(f"{stack} {stat.size}\n")
+        self.snapshots += 1
+
+    def write_cpu_stacks(self) -> str:
+        path = os.path.join(self.run_dir, f"{self.stage}.cpu.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        return path
+
+
+@contextmanager
+def profile_stage(stage: str, run_dir: Optional[str] = None) -> Iterator[str]:
+    """
+    Profiles the enclosed block and writes, into run_dir:
+    - <stage>.prof: cProfile statistics (pstats / snakeviz);
+    - <stage>.cpu.collapsed: sampled stacks of the main thread (flamegraph.pl / speedscope);
+    - <stage>.mem.NNN.collapsed: periodic tracemalloc snapshots, bytes per allocation stack;
+    - <stage>.summary.txt: top functions by cumulative time (also printed).
+    """
+    run_dir = run_dir or new_run_dir()
+    os.makedirs(run_dir, exist_ok=True)
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    sampler = _Sampler(stage, run_dir)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield run_dir
+    finally:
+        profiler.disable()
+        sampler.stopped.set()
+        sampler.join()
+        sampler.write_memory_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - started
+
+        profiler.dump_stats(os.path.join(run_dir, f"{stage}.prof"))
+        sampler.write_cpu_stacks()
+        summary_path = os.path.join(run_dir, f"{stage}.summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"Stage {stage}: {elapsed:.2f} s, traced memory peak {peak / 1e6:.1f} MB, "
+                    f"{sum(sampler.stacks.values())} stack samples, {sampler.snapshots} memory snapshots\n")
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(summary_path, encoding="utf-8") as f:
+            sys.stdout.write(f.read())
+        sys.stdout.write(f"Profiles written to {run_dir}\n")
+
+
+def maybe_profile(stage: str, args):
+    """profile_stage(stage) if the parsed arguments ask for it, a no-op context otherwise."""
+    if getattr(args, "profile", False):
+        return profile_stage(stage, args.profile_dir)
+    return nullcontext()
+
+
+def print_run_summary(run_dir: str) -> None:
+    """Prints the summaries of every stage profiled in a run directory."""
+    for name in sorted(os.listdir(run_dir)):
+        if name.endswith(".summary.txt"):
+            with open(os.path.join(run_dir, name), encoding="utf-8") as f:
+                sys.stdout.write(f.read() + "\n")
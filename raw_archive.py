@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import re
+import gzip
+import logging
+from typing import Any, Dict, Iterator, List, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+PRICES_SUFFIX = ".prices.jsonl.gz"
+_ARCHIVE_NAME = re.compile(r"^betty_(\d+)(\.prices)?\.jsonl\.gz$")
+
+
+class RawArchive:
+    """
+    Append-only, gzip-compressed archive of raw betty-articles payloads.
+
+    Two files per crawl, each opened on its first entry:
+    * betty_<crawl timestamp>.jsonl.gz, one JSON line per product whose details were fetched:
+      {"id": <product id>, "ts": <fetch timestamp>, "payload": <response JSON>}.
+    * betty_<crawl timestamp>.prices.jsonl.gz, one JSON line per details=false price payload:
+      {"kind": "stores" | "refresh", "products": {<article id>: <productIdInSupermarket>},
+      "stores": [<store id>], "ts": <fetch timestamp>, "payload": <response JSON>}. "stores" entries
+      hold the extra-store prices of a freshly crawled product, "refresh" entries a batch of a
+      price-only refresh (see reparse.py for how they are replayed).
+    Opening an existing file appends a new gzip member, which readers handle transparently.
+    """
+
+    def __init__(self, directory: str, crawl_ts: int, compress_level: int = 6) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"betty_{crawl_ts}.jsonl.gz")
+        self.prices_path = os.path.join(directory, f"betty_{crawl_ts}{PRICES_SUFFIX}")
+        self.compress_level = compress_level
+        self.files = {}
+
+    def _write(self, path: str, entry: Dict[str, Any]) -> None:
+        if path not in self.files:
+            self.files[path] = gzip.open(path, "ab", compresslevel=self.compress_level)
+        self.files[path].write(json_codec.dumps_bytes(entry) + b"\n")
+
+    def append(self, product_id: str, payload: Dict[str, Any], fetch_ts: int) -> None:
+        self._write(self.path, {"id": product_id, "ts": fetch_ts, "payload": payload})
+
+    def append_prices(self, kind: str, products: Dict[str, str], store_ids: List[str], payload: Dict[str, Any],
+                      fetch_ts: int) -> None:
+        self._write(self.prices_path, {
+            "kind": kind, "products": products, "stores": store_ids, "ts": fetch_ts, "payload": payload,
+        })
+
+    def close(self) -> None:
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+
+def is_price_archive(path: str) -> bool:
+    return path.endswith(PRICES_SUFFIX)
+
+
+def archive_files(path: str, prices: bool = False) -> List[str]:
+    """
+    A single archive file, or every archive of a directory in crawl order. With prices, the price
+    archives are included too, each right after the payload archive of the same crawl.
+    """
+    if os.path.isfile(path):
+        return [path]
+    archives = []
+    for name in os.listdir(path):
+        match = _ARCHIVE_NAME.match(name)
+        if match and (prices or not match.group(2)):
+            archives.append(((int(match.group(1)), bool(match.group(2))), os.path.join(path, name)))
+    return [archive for _, archive in sorted(archives)]
+
+
+def iter_raw_lines(path: str) -> Iterator[bytes]:
+    """
+    Yields the raw (still JSON-encoded) lines of an archive file. A file truncated by an
+    interrupted crawl yields every complete line before the damaged tail.
+    """
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if line.endswith(b"\n"):
+                    yield line
+        except (EOFError, OSError) as e:
+            logger.warning(f"Archive {path} is truncated, stopping at the damaged tail: {e}")
+
+
+def iter_archive(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yields (product id, payload) for every entry of a payload (not price) archive file."""
+    for line in iter_raw_lines(path):
+        entry = json_codec.loads(line)
+        yield entry["id"], entry["payload"]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List
+
+import json_codec
+from raw_archive import archive_files, is_price_archive, iter_raw_lines
+from scraper_makro import Scraper
+
+logger = logging.getLogger(__name__)
+
+# Scraper instance of each worker process (created once by the pool initializer)
+_scraper = None
+
+
+def _init_worker() -> None:
+    global _scraper
+    _scraper = Scraper(offline=True)
+    # One INFO line per written product would dominate the run time
+    logging.getLogger("scraper_makro").setLevel(logging.WARNING)
+
+
+def reparse_lines(lines: List[bytes]) -> int:
+    """
+    Worker task: run the transform logic of parser_product_details over archived
+    payloads and write the resulting records. Returns the number of records written.
+    """
+    written = 0
+    for line in lines:
+        entry = json_codec.loads(line)
+        items = _scraper.transform_product_details(entry["id"], entry["payload"])
+        if items is not None and items.get("productIdInSupermarket"):
+            # The listing categories come from the crawl, not from the payload: keep the stored ones
+            stored = _scraper.read_stored_record(
+                os.path.join(_scraper.FOLDER, f"makro_{items['productIdInSupermarket']}.jsonl")
+            )
+            if stored:
+                items["listingCategories"] = stored.get("listingCategories")
+            _scraper.write_item(items)
+            written += 1
+    return written
+
+
+def reparse_price_lines(lines: List[bytes]) -> int:
+    """
+    Worker task: replay archived details=false price payloads on top of the records rebuilt from
+    the payload archive of the same crawl. "stores" entries rebuild the extra-store records from the
+    primary one (as parser_store_prices does), "refresh" entries re-run the price handlers of a
+    price-only refresh on the stored record of each store. Returns the number of records written.
+    """
+    written = 0
+    for line in lines:
+        entry = json_codec.loads(line)
+        for product_id, product_id_in_supermarket in entry["products"].items():
+            file_name = f"makro_{product_id_in_supermarket}.jsonl"
+            if entry["kind"] == "stores":
+                record = _scraper.read_stored_record(os.path.join(_scraper.FOLDER, file_name))
+                if not record:
+                    continue
+                store_items = _scraper.transform_store_prices(product_id, entry["payload"], record, entry["stores"])
+                for store_id, items in store_items.items():
+                    _scraper.write_item(items, store_id)
+                    written += 1
+                continue
+            for store_id in entry["stores"]:
+                record = _scraper.read_stored_record(os.path.join(_scraper.STORE_FOLDERS[store_id], file_name))
+                if not record:
+                    continue
+                items = _scraper.transform_price_refresh(product_id, entry["payload"], store_id, record)
+                if items is not None and any(items.get(key) != record.get(key) for key in _scraper.PRICE_OUTPUT_KEYS):
+                    _scraper.write_item(items, store_id)
+                    written += 1
+    return written
+
+
+def iter_chunks(path: str, chunk_size: int) -> Iterator[List[bytes]]:
+    chunk = []
+    for line in iter_raw_lines(path):
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def reparse(archive_path: str, workers: int, chunk_size: int) -> int:
+    """
+    Re-derive the JSONL outputs from one archive file or a directory of archives, without network.
+    Archives are processed in crawl order so that the latest payload of a product wins, the price
+    archive of a crawl right after its payload archive; the entries of each archive are spread over
+    a process pool, with a bounded number of chunks in flight.
+    """
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for path in archive_files(archive_path, prices=True):
+            logger.info(f"Re-parsing {path}")
+            task = reparse_price_lines if is_price_archive(path) else reparse_lines
+            pending = set()
+            for chunk in iter_chunks(path, chunk_size):
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total += sum(future.result() for future in done)
+                pending.add(pool.submit(task, chunk))
+            total += sum(future.result() for future in wait(pending).done)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the JSONL outputs from archived betty-articles payloads.")
+    parser.add_argument("archive", nargs="?", default=None,
+                        help="Archive file or directory (default: [ARCHIVE] DIRECTORY from config.ini).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores).")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Archived payloads per worker task.")
+    args = parser.parse_args()
+
+    archive_path = args.archive
+    if archive_path is None:
+        import configparser
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+        archive_path = config['ARCHIVE']['DIRECTORY']
+
+    start = time.time()
+    written = reparse(archive_path, args.workers, args.chunk_size)
+    elapsed = time.time() - start
+    logger.info(f"Re-parsed {written} products in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} products/s).")
@@ -4,15 +4,24 @@
 import sys
 import os
 import re
-import json
-import jsonlines
 import logging
 import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 from urllib.parse import urljoin
+from collections import defaultdict
 
 import configparser
+import json_codec
 from process_request import ProcessRequest
+from price_history import PriceHistory
+from price_rollups import PriceRollups, ingest_folder
+from catalog_store import CatalogStore
+from raw_archive import RawArchive
+from bloom_filter import BloomFilter
+from crawl_scheduler import scheduler_from_config
+from text_index import update_index
+from product_record import ProductRecord
+from white_labels import load_white_label_brands
 CALCULATED = False
 
 # Configure logging
@@ -28,13 +37,25 @@ class Scraper:
     A scraper class for extracting product information from an online store.
     """
 
-    def __init__(self) -> None:
+    # Price fields (stores/<id>/sellingPriceInfo), re-computed by a price refresh
+    PRICE_FIELDS = ("priceWithTax", "price", "offerPrice", "kgGross", "promotion")
+    # Every field read from stores/<id> (the price block plus the store's supplier), re-computed per extra store
+    STORE_FIELDS = PRICE_FIELDS + ("manufacturer",)
+    # Output fields set by the price handlers: a price refresh rewrites a record when one of them moved
+    PRICE_OUTPUT_KEYS = PRICE_FIELDS + ("unitPrice", "unitPriceWithOffer", "percentPromotion")
+
+    def __init__(self, offline: bool = False, output_folder: Optional[str] = None) -> None:
+        """
+        :param offline: Re-parse mode (see reparse.py) and crawl workers (see distributed_crawl.py):
+            no price history, rollups, catalog, raw archive, scheduler, text index or savings table.
+        :param output_folder: JSONL folder to write to instead of [FOLDERS] JSONL_OUTPUT.
+        """
         # Load configuration
         self.config = configparser.ConfigParser()
         self.config.read('config.ini')
 
         # Folders
-        self.FOLDER = self.create_folder(self.config['FOLDERS']['JSONL_OUTPUT'])
+        self.FOLDER = self.create_folder(output_folder or self.config['FOLDERS']['JSONL_OUTPUT'])
         self.IMAGE_DIRECTORY = self.create_folder(self.config['FOLDERS']['IMAGE_DIRECTORY'])
 
         # Networking
@@ -45,156 +66,513 @@ class Scraper:
         self.PRODUCT_KEYS = self.config['PRODUCT_FIELDS']['KEYS'].split(',')
         self.MAX_ITEMS_PER_PAGE = int(self.config['SCRAPER']['MAX_ITEMS_PER_PAGE'])
 
-    def run(self) -> None:
+        # Stores: the primary store gets the full crawl, extra stores only their price block
+        self.STORE_ID = self.config['API']['STORE_ID']
+        self.EXTRA_STORE_IDS = [
+            store_id.strip() for store_id in self.config.get('API', 'EXTRA_STORE_IDS', fallback='').split(',')
+            if store_id.strip() and store_id.strip() != self.STORE_ID
+        ]
+        self.STORE_FOLDERS = {self.STORE_ID: self.FOLDER}
+        for store_id in self.EXTRA_STORE_IDS:
+            self.STORE_FOLDERS[store_id] = self.create_folder(os.path.join(self.FOLDER, store_id))
+        self.active_store = self.STORE_ID
+        self._fields_maps = {}
+        # Supermarket attributes of each store, attached to the records when they are serialized
+        self.store_constants = {store_id: self.get_store_constants(store_id) for store_id in self.STORE_FOLDERS}
+
+        # Run-scoped deduplication: products listed in several categories are fetched once.
+        # 'exact' keeps {article id: productIdInSupermarket}; 'bloom' a compact Bloom filter.
+        self.DEDUP_MODE = self.config.get('SCRAPER', 'DEDUP_MODE', fallback='exact').strip().lower()
+        if self.DEDUP_MODE == 'bloom':
+            self.seen_products = BloomFilter(
+                self.config.getint('SCRAPER', 'BLOOM_CAPACITY', fallback=1000000),
+                self.config.getfloat('SCRAPER', 'BLOOM_ERROR_RATE', fallback=0.001)
+            )
+        else:
+            self.seen_products = {}
+        self.extra_categories = defaultdict(set)  # article id -> further listing categories
+        # Categories of a scheduled partial crawl (None: every category is crawled). The stored
+        # listingCategories outside them are kept, as this run cannot tell whether they still apply.
+        self.partial_crawl = None
+        self.dedup_saved_requests = 0
+        self.requests_made = 0  # Listing pages and product requests of this run
+
+        # White-label brands, compiled once per run: records are tagged with isWhiteLabel when written
+        self.white_labels = load_white_label_brands()
+
+        # Price history (optional): every record written is also offered to the history store
+        self.crawl_timestamp = self.get_timestamp()
+        self.price_history = None
+        if not offline and self.config.getboolean('HISTORY', 'ENABLED', fallback=False):
+            self.price_history = PriceHistory(self.config['HISTORY']['DATABASE'])
+        self.price_rollups = None
+        if not offline and self.config.getboolean('HISTORY', 'ROLLUPS', fallback=False):
+            self.price_rollups = PriceRollups(self.config['HISTORY']['DATABASE'], self.white_labels)
+
+        # Catalog store (optional): current records in SQLite, for indexed queries
+        self.catalog = None
+        if not offline and self.config.getboolean('CATALOG', 'ENABLED', fallback=False):
+            self.catalog = CatalogStore(
+                self.config['CATALOG']['DATABASE'],
+                self.config.getint('CATALOG', 'BATCH_SIZE', fallback=500)
+            )
+
+        # Raw payload archive (optional): allows re-deriving the outputs offline with reparse.py
+        self.raw_archive = None
+        if not offline and self.config.getboolean('ARCHIVE', 'ENABLED', fallback=False):
+            self.raw_archive = RawArchive(self.config['ARCHIVE']['DIRECTORY'], self.crawl_timestamp)
+
+        # Crawl scheduler (optional): only the categories most likely to have changed, within a budget
+        self.scheduler = None
+        if not offline and self.config.getboolean('SCHEDULER', 'ENABLED', fallback=False):
+            self.scheduler = scheduler_from_config(self.config)
+
+        # Full-text index (optional): updated from the output folder after every completed crawl
+        self.text_index_path = None
+        if not offline and self.config.getboolean('TEXT_INDEX', 'ENABLED', fallback=False):
+            self.text_index_path = self.config['TEXT_INDEX']['DATABASE']
+
+        # Cheaper-equivalent recommendations (optional): refreshed after every run, price-only runs included
+        self.savings_enabled = not offline and self.config.getboolean('SAVINGS', 'ENABLED', fallback=False)
+
+    def run(self, prices_only: bool = False) -> None:
         """
         Entry point to start scraping. Reads categories from config and launches the process.
+
+        :param prices_only: Refresh the prices of the stored records instead of a full crawl.
         """
         categories = self.config['CATEGORIES']['CATEGORIES'].split(',')
-        self.scrape_categories(categories)
+        full_crawl = True
+        if self.scheduler and not prices_only:
+            plan = self.scheduler.plan(
+                categories, self.config.getint('SCHEDULER', 'REQUEST_BUDGET', fallback=0), self.crawl_timestamp
+            )
+            for category, reason in plan:
+                logger.info(f"Scheduled category {category}: {reason}")
+            full_crawl = len(plan) == len(categories)
+            categories = [category for category, _ in plan]
+            if not full_crawl:
+                self.partial_crawl = set(categories)
+        try:
+            if prices_only:
+                self.refresh_prices()
+            else:
+                self.scrape_categories(categories)
+        finally:
+            if self.scheduler:
+                self.scheduler.save()
+            if self.price_history:
+                self.price_history.close()
+            if self.catalog:
+                self.catalog.close()
+            if self.raw_archive:
+                self.raw_archive.close()
+        # Rollups are only materialized for crawls that completed
+        if self.price_rollups:
+            if not full_crawl:
+                # The scheduler skipped some categories: aggregate the whole output folder instead,
+                # where their products keep the records of their last crawl
+                rows = ingest_folder(self.price_rollups, self.FOLDER, self.crawl_timestamp)
+                logger.info(f"Stored {rows} price rollup rows for this crawl (rebuilt from the output folder).")
+            elif not prices_only:
+                rows = self.price_rollups.commit_crawl(self.crawl_timestamp)
+                logger.info(f"Stored {rows} price rollup rows for this crawl.")
+            self.price_rollups.close()
+        if self.text_index_path and not prices_only:
+            stats = update_index(self.text_index_path, self.FOLDER)
+            logger.info(f"Text index updated: {stats['added']} added, {stats['updated']} updated, "
+                        f"{stats['removed']} removed, {stats['unchanged']} unchanged.")
+        if self.savings_enabled:
+            # Imported here: the savings stage needs pandas and NumPy, the crawl itself does not
+            from cheaper_equivalents import refresh_savings
+            stats = refresh_savings(self.config, self.FOLDER)
+            logger.info(f"Savings table refreshed: {stats['recomputed']} products recomputed "
+                        f"({stats['changed']} changed, {stats['removed']} removed).")
+
+    def refresh_prices(self) -> None:
+        """
+        Price-only refresh of the previously stored records (all stores).
+
+        No listing pages and no details block are requested: one details=false request per batch of
+        products returns the price blocks of every store, only the price handlers are re-run on top
+        of the stored record, and a record is rewritten only when one of its price fields moved.
+        """
+        batch_size = self.config.getint('SCRAPER', 'PRICE_REFRESH_BATCH_SIZE', fallback=1)
+        store_ids = [self.STORE_ID] + self.EXTRA_STORE_IDS
+        stats = {"checked": 0, "changed": 0, "missing": 0, "requests": 0}
+
+        file_names = sorted(name for name in os.listdir(self.FOLDER) if name.endswith(".jsonl"))
+        for start in range(0, len(file_names), batch_size):
+            # Stored records of this batch, per store: {article id: {store id: record}}
+            stored = {}
+            for file_name in file_names[start:start + batch_size]:
+                for store_id in store_ids:
+                    record = self.read_stored_record(os.path.join(self.STORE_FOLDERS[store_id], file_name))
+                    if record:
+                        stored.setdefault(self.article_id(record), {})[store_id] = record
+            if not stored:
+                continue
+
+            parsed_json = self.fetch_product_payload(",".join(stored), store_ids, details=False)
+            stats["requests"] += 1
+            if self.raw_archive and parsed_json:
+                products = {product_id: next(iter(records.values())).get("productIdInSupermarket")
+                            for product_id, records in stored.items()}
+                self.raw_archive.append_prices("refresh", products, store_ids, parsed_json, self.get_timestamp())
+            for product_id, records in stored.items():
+                for store_id, record in records.items():
+                    stats["checked"] += 1
+                    items = self.transform_price_refresh(product_id, parsed_json, store_id, record)
+                    if items is None:
+                        stats["missing"] += 1
+                        continue
+                    if any(items.get(key) != record.get(key) for key in self.PRICE_OUTPUT_KEYS):
+                        stats["changed"] += 1
+                        self.write_item(items, store_id)
+
+        logger.info(f"Price refresh finished: {stats['checked']} records checked, {stats['changed']} rewritten, "
+                    f"{stats['missing']} without price data, {stats['requests']} requests.")
+
+    def transform_price_refresh(self, product_id: str, parsed_json: Dict[str, Any], store_id: str,
+                                record: Dict[str, Any]) -> Optional[ProductRecord]:
+        """
+        A stored record of a store with its price fields re-computed from a details=false payload
+        (None if the payload has no price block of the product in that store). No network access.
+        """
+        store_path = ["result", product_id, "variants", "0032", "bundles", "0021", "stores", store_id]
+        if not self.get_value(parsed_json, store_path):
+            return None
+        return self.transform_product_details(product_id, parsed_json, store_id=store_id, fields=self.PRICE_FIELDS,
+                                              items=record)
+
+    @staticmethod
+    def read_stored_record(path: str) -> Optional[dict]:
+        """Return the product record stored in a JSONL file, or None if missing/unreadable."""
+        if not os.path.isfile(path):
+            return None
+        try:
+            return next(json_codec.iter_jsonl(path), None)
+        except Exception as e:
+            logger.error(f"Could not read stored record {path}: {e}")
+            return None
 
     def scrape_categories(self, categories: List[str]) -> None:
         """
-        Main scraping logic: iterate through categories and pages, parse and store product info.
+        Main scraping logic, as a streaming pipeline per category:
+        listing pages -> new product IDs -> product records -> JSONL sink.
+        Only the record being processed is held in memory.
         """
         for category in categories:
             logger.info(f"Scraping category: {category}")
-            page = 1
-            number_pages = None
-
-            while True:
-                logger.info(f"Fetching page {page} for category {category}")
-                query_string = (
-                    f"searchdiscover/articlesearch/search?"
-                    f"storeId={self.config['API']['STORE_ID']}"
-                    f"&language={self.config['API']['LANGUAGE']}"
-                    f"&country={self.config['API']['COUNTRY']}"
-                    f"&query=*"
-                    f"&rows={self.MAX_ITEMS_PER_PAGE}"
-                    f"&page={page}"
-                    f"&filter=category:{category}"
-                    f"&facets=true"
-                    f"&categories=true"
-                    f"&__t={self.get_timestamp()}"
+            requests_before, products, changed = self.requests_made, 0, 0
+            product_ids = self.iter_product_ids(self.iter_listing_pages(category), category)
+            for record in self.parser_products(product_ids, category):
+                if self.scheduler:
+                    products += 1
+                    changed += self.record_changed(record)
+                self.write_product(record)
+            if self.scheduler:
+                self.scheduler.record_crawl(
+                    category, self.crawl_timestamp, products, changed, self.requests_made - requests_before
                 )
-                url = urljoin(self.URL_BASE, query_string)
 
-                response = self.prequest.set_request(
-                    url=url,
-                    headers=self.get_headers(1)
-                )
-                if not response:
-                    logger.error("No response or error while requesting page data.")
-                    break
+        self.apply_extra_categories()
+        logger.info(f"Deduplication saved {self.dedup_saved_requests} detail requests "
+                    f"({sum(len(c) for c in self.extra_categories.values())} repeated listings).")
 
-                try:
-                    parsed = response.json()
-                except Exception as e:
-                    logger.error(f"Could not parse listing JSON: {e}")
-                    break
-
-                amount = parsed.get("amount")
-                if not amount:
-                    logger.info("No products found or 'amount' missing. Stopping.")
-                    break
-
-                # Determine the total number of pages if not known
-                if number_pages is None:
-                    # E.g. if amount=125, MAX_ITEMS_PER_PAGE=50 => number_pages=3
-                    number_pages = (amount // self.MAX_ITEMS_PER_PAGE) + (1 if amount % self.MAX_ITEMS_PER_PAGE else 0)
-
-                # Parse products
-                for item_dict in self.parser_products(parsed):
-                    # Add additional attributes from config
-                    item_dict["supermarket"] = self.config['SUPERMARKET']['NAME']
-                    item_dict["supermarketPostalCode"] = self.config['SUPERMARKET']['POSTAL_CODE']
-                    item_dict["currency"] = self.config['SUPERMARKET']['CURRENCY']
-                    item_dict["country"] = self.config['SUPERMARKET']['COUNTRY']
-
-                    pid = item_dict.get("productIdInSupermarket")
-                    if pid:
-                        self.dict_to_jsonl(item_dict, pid)
-
-                if page < number_pages:
-                    page += 1
-                else:
-                    break
+    def record_changed(self, record: ProductRecord) -> bool:
+        """Whether a freshly fetched record is new or re-priced compared to the stored one (primary store)."""
+        stored = self.read_stored_record(os.path.join(self.FOLDER, f"makro_{record.get('productIdInSupermarket')}.jsonl"))
+        return stored is None or any(record.get(key) != stored.get(key) for key in self.PRICE_OUTPUT_KEYS)
 
-    def parser_products(self, parsed: Dict[str, Any]) -> List[dict]:
+    def get_store_constants(self, store_id: str) -> Dict[str, str]:
         """
-        Given the parsed JSON from the product listing, fetch details for each product ID.
+        Supermarket attributes of a store, from its optional [STORE_<id>] section or [SUPERMARKET].
         """
-        output_items = []
-        results = parsed.get("results", {})
-        for key_id in results:
-            product_details = self.parser_product_details(key_id)
-            if product_details:
-                output_items.append(product_details)
-        return output_items
+        section = f"STORE_{store_id}"
+        supermarket = self.config[section] if self.config.has_section(section) else self.config['SUPERMARKET']
+        return {
+            "supermarket": supermarket.get('NAME', self.config['SUPERMARKET']['NAME']),
+            "supermarketPostalCode": supermarket.get('POSTAL_CODE', self.config['SUPERMARKET']['POSTAL_CODE']),
+            "currency": self.config['SUPERMARKET']['CURRENCY'],
+            "country": self.config['SUPERMARKET']['COUNTRY'],
+        }
 
-    def parser_product_details(self, product_id: str) -> dict:
+    def write_product(self, record: ProductRecord) -> None:
         """
-        Given a product_id, fetch its details (name, brand, ingredients, price, etc.).
-        Returns a dictionary of product details.
+        Write the record of a freshly fetched product and, in multi-store mode, its records in the extra stores.
+        """
+        self.write_item(record)
+        if self.EXTRA_STORE_IDS:
+            for store_id, store_record in self.parser_store_prices(record).items():
+                self.write_item(store_record, store_id)
+
+    def write_item(self, record: ProductRecord, store_id: Optional[str] = None) -> None:
+        """
+        Write the product record of a store (default: the primary store), if it has an ID.
+        """
+        pid = record.get("productIdInSupermarket")
+        if pid:
+            self.dict_to_jsonl(record, pid, store_id)
+
+    def iter_listing_pages(self, category: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the parsed listing pages of a category, requesting the next page only when
+        the previous one has been consumed.
+        """
+        page = 1
+        number_pages = None
+
+        while True:
+            parsed = self.fetch_listing_page(category, page)
+            if parsed is None:
+                return
+
+            if not parsed.get("amount"):
+                logger.info("No products found or 'amount' missing. Stopping.")
+                return
+
+            # Determine the total number of pages if not known
+            if number_pages is None:
+                number_pages = self.page_count(parsed)
+
+            yield parsed
+
+            if page < number_pages:
+                page += 1
+            else:
+                return
+
+    def fetch_listing_page(self, category: str, page: int) -> Optional[Dict[str, Any]]:
         """
+        Fetch one listing page of a category. Returns the parsed JSON, or None on error.
+        """
+        logger.info(f"Fetching page {page} for category {category}")
+        query_string = (
+            f"searchdiscover/articlesearch/search?"
+            f"storeId={self.STORE_ID}"
+            f"&language={self.config['API']['LANGUAGE']}"
+            f"&country={self.config['API']['COUNTRY']}"
+            f"&query=*"
+            f"&rows={self.MAX_ITEMS_PER_PAGE}"
+            f"&page={page}"
+            f"&filter=category:{category}"
+            f"&facets=true"
+            f"&categories=true"
+            f"&__t={self.get_timestamp()}"
+        )
+        url = urljoin(self.URL_BASE, query_string)
 
+        response = self.prequest.set_request(
+            url=url,
+            headers=self.get_headers(1)
+        )
+        self.requests_made += 1
+        if not response:
+            logger.error("No response or error while requesting page data.")
+            return None
 
+        try:
+            return json_codec.loads(response.content)
+        except Exception as e:
+            logger.error(f"Could not parse listing JSON: {e}")
+            return None
+
+    def page_count(self, parsed: Dict[str, Any]) -> int:
+        """
+        Number of listing pages of a category, from the 'amount' of any of its parsed pages.
+        """
+        # E.g. if amount=125, MAX_ITEMS_PER_PAGE=50 => number_pages=3
+        amount = parsed.get("amount") or 0
+        return (amount // self.MAX_ITEMS_PER_PAGE) + (1 if amount % self.MAX_ITEMS_PER_PAGE else 0)
+
+    def iter_product_ids(self, pages: Iterable[Dict[str, Any]], category: Optional[str] = None) -> Iterator[str]:
+        """
+        Yields the article IDs of the listing pages that were not fetched yet in this run.
+        Products already fetched are skipped; their listing category is recorded instead.
+        """
+        for parsed in pages:
+            for key_id in parsed.get("results", {}):
+                article_id = re.sub(r'0032$', "", key_id.strip())
+                if article_id in self.seen_products:
+                    self.extra_categories[article_id].add(category)
+                    self.dedup_saved_requests += 1 + (1 if self.EXTRA_STORE_IDS else 0)
+                    continue
+                yield article_id
+
+    def parser_products(self, product_ids: Iterable[str], category: Optional[str] = None) -> Iterator[ProductRecord]:
+        """
+        Fetch the details of each product ID and yield its record.
+        """
+        for article_id in product_ids:
+            record = self.parser_product_details(article_id)
+            if record is None:
+                continue
+            record["listingCategories"] = [category] if category else []
+            if self.partial_crawl is not None:
+                record["listingCategories"] += self.uncrawled_listing_categories(record)
+            if isinstance(self.seen_products, dict):
+                self.seen_products[article_id] = record.get("productIdInSupermarket")
+            else:
+                self.seen_products.add(article_id)
+            yield record
+
+    def uncrawled_listing_categories(self, record: ProductRecord) -> List[str]:
+        """
+        The listing categories of the stored record (primary store) that the running partial crawl
+        does not visit. Those visited are re-discovered by the crawl itself (apply_extra_categories).
+        """
+        stored = self.read_stored_record(os.path.join(self.FOLDER, f"makro_{record.get('productIdInSupermarket')}.jsonl"))
+        listed = (stored or {}).get("listingCategories") or []
+        return [category for category in listed if category not in self.partial_crawl]
+
+    def apply_extra_categories(self) -> None:
+        """
+        Append the extra listing categories collected by deduplication to the stored records
+        (every store). In Bloom mode the article id -> file mapping is rebuilt with one pass
+        over the output folder.
+        """
+        if not self.extra_categories:
+            return
+        if isinstance(self.seen_products, dict):
+            product_ids = {article: self.seen_products.get(article) for article in self.extra_categories}
+        else:
+            product_ids = {}
+            for file_name in os.listdir(self.FOLDER):
+                if file_name.endswith(".jsonl"):
+                    record = self.read_stored_record(os.path.join(self.FOLDER, file_name))
+                    if record and self.article_id(record) in self.extra_categories:
+                        product_ids[self.article_id(record)] = record.get("productIdInSupermarket")
+
+        for article_id, categories in self.extra_categories.items():
+            pid = product_ids.get(article_id)
+            if not pid:
+                continue
+            for folder in self.STORE_FOLDERS.values():
+                path = os.path.join(folder, f"makro_{pid}.jsonl")
+                record = self.read_stored_record(path)
+                if record is None:
+                    continue
+                listed = record.get("listingCategories") or []
+                record["listingCategories"] = listed + sorted(c for c in categories if c and c not in listed)
+                self.jsonl_out(record, pid, folder)
+                if self.catalog and folder == self.FOLDER:
+                    self.catalog.upsert(record)
+
+    def parser_product_details(self, product_id: str) -> Optional[ProductRecord]:
+        """
+        Given a product_id, fetch its details (name, brand, ingredients, price, etc.).
+        Returns the product record, or None on error.
+        """
         # Remove trailing "0032" if present
         product_id = re.sub(r'0032$', "", product_id.strip())
 
+        parsed_json = self.fetch_product_payload(product_id, [self.STORE_ID], details=True)
+        if not parsed_json:
+            return None
+
+        if self.raw_archive:
+            self.raw_archive.append(product_id, parsed_json, self.get_timestamp())
+
+        return self.transform_product_details(product_id, parsed_json)
+
+    def parser_store_prices(self, record: ProductRecord) -> Dict[str, ProductRecord]:
+        """
+        Multi-store mode: given the full record of a product in the primary store, fetch only the
+        price block of the extra stores (one details=false request for all of them) and return
+        {store_id: record}. The store-dependent fields (STORE_FIELDS) are read from each store's block;
+        the store-independent ones are reused from the primary record.
+        """
+        product_id = self.article_id(record)
+        parsed_json = self.fetch_product_payload(product_id, self.EXTRA_STORE_IDS, details=False)
+        if not parsed_json:
+            return {}
+
+        if self.raw_archive:
+            self.raw_archive.append_prices("stores", {product_id: record.get("productIdInSupermarket")},
+                                           self.EXTRA_STORE_IDS, parsed_json, self.get_timestamp())
+        return self.transform_store_prices(product_id, parsed_json, record, self.EXTRA_STORE_IDS)
+
+    def transform_store_prices(self, product_id: str, parsed_json: Dict[str, Any], record: Dict[str, Any],
+                               store_ids: List[str]) -> Dict[str, ProductRecord]:
+        """
+        The records of a product in the given stores, from its primary-store record and the
+        details=false payload of those stores. No network access (see parser_store_prices).
+        """
+        store_items = {}
+        for store_id in store_ids:
+            store_path = ["result", product_id, "variants", "0032", "bundles", "0021", "stores", store_id]
+            if not self.get_value(parsed_json, store_path):
+                logger.warning(f"No price block for product {product_id} in store {store_id}")
+                continue
+            store_record = self.transform_product_details(
+                product_id, parsed_json, store_id=store_id, fields=self.STORE_FIELDS, items=record
+            )
+            if store_record is not None:
+                store_items[store_id] = store_record
+        return store_items
+
+    def fetch_product_payload(self, product_id: str, store_ids: List[str], details: bool = True) -> dict:
+        """
+        Fetch the betty-articles payload of a product (or comma-separated products) for the given stores.
+        With details=False the API leaves out the (store-independent) details block.
+        Returns the parsed JSON, or an empty dictionary on error.
+        """
         # Build product detail URL
         query_string = (
             "evaluate.article.v1/betty-articles?"
             f"ids={product_id}"
             "&country=ES"
             "&locale=es-ES"
-            "&storeIds=00057"
-            "&details=true"
+            f"&storeIds={','.join(store_ids)}"
+            f"&details={'true' if details else 'false'}"
             f"&__t={self.get_timestamp()}"
         )
         url_product = urljoin(self.URL_BASE, query_string)
 
         # Fetch data from the API
         response = self.prequest.set_request(url_product, headers=self.get_headers(2))
+        self.requests_made += 1
         if not response:
             logger.error(f"No response for product detail URL: {url_product}")
             return {}
 
         # Parse JSON response
         try:
-            parsed_json = response.json()
+            return json_codec.loads(response.content)
         except Exception as e:
             logger.error(f"Could not parse JSON for product {product_id}. Error: {e}")
             return {}
 
+    @staticmethod
+    def article_id(items: dict) -> str:
+        """
+        The article ID used by the detail API, recovered from the product link
+        (shop/pv/<article id>/0032/0021/<name>).
+        """
+        match = re.search(r'/pv/([^/]+)/0032/', items.get("link") or "")
+        return match.group(1) if match else items.get("productIdInSupermarket", "")
+
+    def transform_product_details(self, product_id: str, parsed_json: Dict[str, Any], store_id: Optional[str] = None,
+                                  fields: Optional[tuple] = None,
+                                  items: Optional[Dict[str, Any]] = None) -> Optional[ProductRecord]:
+        """
+        Turn a betty-articles payload into a product record (None if the payload has no such product).
+        No network access: used for live crawls and for re-parsing archived payloads.
+
+        :param store_id: Store whose price block is read (default: the primary store).
+        :param fields: Only compute these fields (e.g. PRICE_FIELDS), in fields_map order.
+        :param items: Previously computed record (or stored dictionary) to start from; not modified.
+        """
         # Extract the result for this product
         result = parsed_json.get("result", {}).get(product_id)
         if not result:
-            return {}
-
-        # Prepare a dictionary for storing product details
-        items = {}
+            return None
 
-        # The fields and their JSON "path chains"
-        fields_map = {
-            "productIdInSupermarket": ["variants", "0032", "bundles", "0021", "customerDisplayId"],
-            "denomination":          ["variants", "0032", "description"],
-            "categoryInSupermarket": ["variants", "0032", "categories"],
-            "brand":                 ["brandName"],
-            "manufacturer":          ["variants", "0032", "bundles", "0021", "stores", "00057", "supplier", "supplierName"],
-            "description":           ["variants", "0032", "bundles", "0021", "details", "longDescription"],
-            "measuringUnit":         ["variants", "0032", "bundles", "0021", "contentData", "weightPerPiece"],
-            "units":                 ["variants", "0032", "bundles", "0021", "selector", "contentSize"],
-            "priceWithTax":          ["variants", "0032", "bundles", "0021", "stores", "00057", "sellingPriceInfo", "finalPrice"],
-            "price":                 ["variants", "0032", "bundles", "0021", "stores", "00057", "sellingPriceInfo", "shelfPrice"],
-            "offerPrice":            ["variants", "0032", "bundles", "0021", "stores", "00057", "sellingPriceInfo", "basePrice"],
-            "kgGross":               ["variants", "0032", "bundles", "0021", "stores", "00057", "sellingPriceInfo", "kgGross"],
-            "isWeightArticle":       ["variants", "0032", "bundles", "0021", "isWeightArticle"],
-            "rawIngredients":        ["variants", "0032", "bundles", "0021", "details", "features"],
-            "nutritionInformation":  ["variants", "0032", "bundles", "0021", "details", "nutritionalTable"],
-            "characteristics":       ["variants", "0032", "bundles", "0021", "details", "characteristicsTable"],
-            "promotion":             ["variants", "0032", "bundles", "0021", "stores", "00057", "sellingPriceInfo", "summaryDnrInfo", "name"],
-            # "imageLinks":            ["variants", "0032", "imageUrlL"]
-        }
+        # Prepare the record for storing product details
+        items = ProductRecord(items)
+        self.active_store = store_id or self.STORE_ID
+        fields_map = self.get_fields_map(self.active_store)
 
         # A dictionary mapping field names to "transform" handler methods
         field_handlers = {
@@ -208,12 +586,14 @@ class Scraper:
             "characteristics":       self._handle_characteristics,
             "offerPrice":            self._handle_offer_price,
             "kgGross":               self._handle_kg_gross,
-            # "imageLinks":            self._handle_images,
+            "imageLinks":            self._handle_images,
         }
 
         # 1) Extract all raw values by following the paths in fields_map.
         # 2) Apply transformations if a handler exists.
         for key, path_chain in fields_map.items():
+            if fields is not None and key not in fields:
+                continue
             raw_value = self.get_value(result, path_chain.copy())
             if key in field_handlers:
                 items[key] = field_handlers[key](raw_value, items, result)
@@ -233,6 +613,35 @@ class Scraper:
 
         return items
 
+    def get_fields_map(self, store_id: str) -> Dict[str, List[str]]:
+        """
+        The product fields and their JSON "path chains" for a store (built once per store).
+        """
+        if store_id not in self._fields_maps:
+            # The fields and their JSON "path chains"
+            fields_map = {
+                "productIdInSupermarket": ["variants", "0032", "bundles", "0021", "customerDisplayId"],
+                "denomination":          ["variants", "0032", "description"],
+                "categoryInSupermarket": ["variants", "0032", "categories"],
+                "brand":                 ["brandName"],
+                "manufacturer":          ["variants", "0032", "bundles", "0021", "stores", store_id, "supplier", "supplierName"],
+                "description":           ["variants", "0032", "bundles", "0021", "details", "longDescription"],
+                "measuringUnit":         ["variants", "0032", "bundles", "0021", "contentData", "weightPerPiece"],
+                "units":                 ["variants", "0032", "bundles", "0021", "selector", "contentSize"],
+                "priceWithTax":          ["variants", "0032", "bundles", "0021", "stores", store_id, "sellingPriceInfo", "finalPrice"],
+                "price":                 ["variants", "0032", "bundles", "0021", "stores", store_id, "sellingPriceInfo", "shelfPrice"],
+                "offerPrice":            ["variants", "0032", "bundles", "0021", "stores", store_id, "sellingPriceInfo", "basePrice"],
+                "kgGross":               ["variants", "0032", "bundles", "0021", "stores", store_id, "sellingPriceInfo", "kgGross"],
+                "isWeightArticle":       ["variants", "0032", "bundles", "0021", "isWeightArticle"],
+                "rawIngredients":        ["variants", "0032", "bundles", "0021", "details", "features"],
+                "nutritionInformation":  ["variants", "0032", "bundles", "0021", "details", "nutritionalTable"],
+                "characteristics":       ["variants", "0032", "bundles", "0021", "details", "characteristicsTable"],
+                "promotion":             ["variants", "0032", "bundles", "0021", "stores", store_id, "sellingPriceInfo", "summaryDnrInfo", "name"],
+                "imageLinks":            ["variants", "0032", "imageUrlL"],
+            }
+            self._fields_maps[store_id] = fields_map
+        return self._fields_maps[store_id]
+
     def create_folder(self, directory_name: str) -> str:
         """
         Create a folder if it does not exist, and return its absolute path.
@@ -288,30 +697,10 @@ class Scraper:
         ]
         return headers[index]
 
-    def download_file(self, response, file_name: str) -> Union[str, bool]:
-        """
-        Download a file (e.g., image) from a response object and save it to disk.
-
-        :param response: The requests response object (stream=True).
-        :param file_name: The name of the file to save locally.
-        :return: The path of the saved file or False if failed with status 404.
-        """
-        if response.status_code == 404:
-            return False
-
-        chunk_size = 2000
-        file_path = os.path.join(self.IMAGE_DIRECTORY, file_name)
-        with open(file_path, 'wb') as fd:
-            for chunk in response.iter_content(chunk_size):
-                fd.write(chunk)
-        return file_path
-
-    def jsonl_out(self, items: dict, product_id: str) -> None:
+    def jsonl_out(self, items: dict, product_id: str, folder: Optional[str] = None) -> None:
         file_name = f"makro_{product_id}.jsonl"
-        output_path = os.path.join(self.FOLDER, file_name)
-        with jsonlines.open(output_path, mode='w',
-                            dumps=lambda x: json.dumps(x, ensure_ascii=False)) as writer:
-            writer.write(items)
+        output_path = os.path.join(folder or self.FOLDER, file_name)
+        json_codec.write_jsonl(output_path, [items])
 
     def parser_measuring(self, value_dict: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Union[str, float]]:
         """
@@ -354,15 +743,26 @@ class Scraper:
             "unit": items.get("unit", "")
         }
 
-    def dict_to_jsonl(self, items: dict, product_id: str) -> None:
+    def dict_to_jsonl(self, record: ProductRecord, product_id: str, store_id: Optional[str] = None) -> None:
         """
-        Filter the product dictionary to only the desired keys and then write to JSONL.
+        Serialize the record to the desired keys, with the store's supermarket attributes, and write
+        it to JSONL (in the store's folder). Price history, rollups and the
+        catalog only follow the primary store.
         """
-        filtered_items = {key: items.get(key) for key in self.PRODUCT_KEYS}
+        store_id = store_id or self.STORE_ID
+        filtered_items = record.to_dict(self.PRODUCT_KEYS, self.store_constants[store_id])
         with open('debug.txt', 'a') as f:
             f.write(f"link:{filtered_items.get('link')}, unitprice:{filtered_items.get('unitPrice')}\n")
         logger.info(f"Writing item to JSONL: {filtered_items['denomination']}")
-        self.jsonl_out(filtered_items, product_id)
+        self.jsonl_out(filtered_items, product_id, self.STORE_FOLDERS[store_id])
+        if store_id != self.STORE_ID:
+            return
+        if self.price_history:
+            self.price_history.record(filtered_items, self.crawl_timestamp)
+        if self.price_rollups:
+            self.price_rollups.add(filtered_items)
+        if self.catalog:
+            self.catalog.upsert(filtered_items)
 
     def get_value(self, obj: Any, chain: List[str]) -> Any:
         """
@@ -386,9 +786,13 @@ class Scraper:
 
     def _handle_brand(self, val, items, result):
         """
-        Fallback to 'MAKRO' brand if nothing is found.
+        Fallback to 'MAKRO' brand if nothing is found. Also tags the record with isWhiteLabel and
+        the fingerprint of the list it was computed from.
         """
-        return val if val else "MAKRO"
+        brand = val if val else "MAKRO"
+        items["isWhiteLabel"] = self.white_labels.is_white_label(brand)
+        items["whiteLabelFingerprint"] = self.white_labels.fingerprint
+        return brand
 
     def _handle_manufacturer(self, val, items, result):
         """
@@ -505,12 +909,12 @@ class Scraper:
             # Check for promotion labels
             promo_labels = self.get_value(result, [
                 "variants", "0032", "bundles", "0021", "stores",
-                "00057", "sellingPriceInfo", "promotionLabels"
+                self.active_store, "sellingPriceInfo", "promotionLabels"
             ])
             # Check for levels info
             levels = self.get_value(result, [
                 "variants", "0032", "bundles", "0021", "stores",
-                "00057", "sellingPriceInfo", "summaryDnrInfo", "levels"
+                self.active_store, "sellingPriceInfo", "summaryDnrInfo", "levels"
             ])
 
             # If no promotion labels or levels, it's not a real promotion
@@ -573,7 +977,7 @@ class Scraper:
             alt_unit_price = self.get_value(
                 result,
                 [
-                    "variants", "0032", "bundles", "0021", "stores", "00057",
+                    "variants", "0032", "bundles", "0021", "stores", self.active_store,
                     "sellingPriceInfo", "basePriceData", "pricePerUnit", "netPrice"
                 ]
             )
@@ -600,22 +1004,10 @@ class Scraper:
 
     def _handle_images(self, val, items, result):
         """
-        Download images using parser_images and return the original URL (or empty list).
+        Return the image URL as a list (or empty list).
+        Images are downloaded afterwards by image_downloader.py, outside the product crawl.
         """
-        product_id = items.get("productIdInSupermarket", "unknown")
-        urls = []
-        if val:
-            response = self.prequest.set_request(
-                val,
-                headers=self.get_headers(index=3, url_refer=val),
-                stream=True
-            )
-            if response:
-                file_name = f"{product_id}.jpg"
-                self.download_file(response, file_name)
-                urls.append(val)
-        return urls
-
+        return [val] if val else []
 
     @staticmethod
     def get_timestamp() -> int:
@@ -627,7 +1019,16 @@ class Scraper:
 
 
 if __name__ == "__main__":
+    import argparse
+    from profiling import add_profile_arguments, maybe_profile
+    parser = argparse.ArgumentParser(description="Makro product scraper.")
+    parser.add_argument("--prices-only", action="store_true",
+                        help="Only refresh prices and promotions of the previously stored records.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
     print("Current Working Directory:", os.getcwd())
-    scraper = Scraper()
-    scraper.run()
+    with maybe_profile("scraper", args):
+        scraper = Scraper()
+        scraper.run(prices_only=args.prices_only)
 
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# coding: utf8
+
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+import argparse
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import json_codec
+from catalog_store import iter_catalog_records
+
+# Query field name -> record field (strings written by _handle_ingredients, _handle_characteristics, ...)
+INDEXED_FIELDS = {
+    "ingredients": "rawIngredients",
+    "description": "description",
+    "characteristics": "characteristics",
+}
+BATCH_SIZE = 20000  # Documents whose postings are merged into the index at a time
+TOKEN_PATTERN = re.compile(r"[0-9a-zñ]+")
+QUERY_PATTERN = re.compile(r'\(|\)|(?:\w+:)?"[^"]*"|[^\s()"]+')
+OPERATORS = ("AND", "OR", "NOT")
+# Accents and diaeresis are folded; ñ is a letter of its own in Spanish and is kept
+_FOLD = str.maketrans("áàâäãéèêëíìîïóòôöõúùûüç", "aaaaaeeeeiiiiooooouuuuc")
+
+
+def fold(text: str) -> str:
+    """Lowercases and removes accents: 'Azúcar, AÇAÍ, Año' -> 'azucar, acai, año'."""
+    text = text.lower().translate(_FOLD)
+    if text.isascii():
+        return text
+    text = unicodedata.normalize("NFKD", text.replace("ñ", "\0"))
+    return "".join(c for c in text if not unicodedata.combining(c)).replace("\0", "ñ")
+
+
+def tokenize(text: Any) -> List[str]:
+    return TOKEN_PATTERN.findall(fold(text)) if isinstance(text, str) else []
+
+
+def encode_varints(values: Iterable[int]) -> bytes:
+    """Unsigned LEB128: 7 bits per byte, high bit set on every byte but the last."""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> List[int]:
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value, shift = 0, 0
+    return values
+
+
+def encode_postings(postings: Dict[int, List[int]], previous_doc: int = 0) -> bytes:
+    """
+    Posting list: for every document in ascending order, the gap to the previous document ID,
+    the number of positions and the position gaps, all as varints. previous_doc lets new
+    documents be appended to an existing list.
+    """
+    values = []
+    for doc_id in sorted(postings):
+        positions = postings[doc_id]
+        values += [doc_id - previous_doc, len(positions)]
+        values += [position - previous for previous, position in zip([0] + positions, positions)]
+        previous_doc = doc_id
+    return encode_varints(values)
+
+
+def decode_postings(data: bytes) -> Dict[int, List[int]]:
+    values, postings, doc_id, i = decode_varints(data), {}, 0, 0
+    while i < len(values):
+        doc_id += values[i]
+        count, position, positions = values[i + 1], 0, []
+        for gap in values[i + 2:i + 2 + count]:
+            position += gap
+            positions.append(position)
+        postings[doc_id] = positions
+        i += 2 + count
+    return postings
+
+
+def document_terms(record: Dict[str, Any]) -> Dict[str, List[int]]:
+    """{'<field>:<token>': [positions]} of the indexed fields of a record."""
+    terms = defaultdict(list)
+    for field, record_field in INDEXED_FIELDS.items():
+        for position, token in enumerate(tokenize(record.get(record_field))):
+            terms[f"{field}:{token}"].append(position)
+    return terms
+
+
+def fingerprint(record: Dict[str, Any]) -> str:
+    text = "\x1f".join(str(record.get(record_field) or "") for record_field in INDEXED_FIELDS.values())
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def iter_source_records(source: str) -> Iterator[Dict[str, Any]]:
+    """The records of a JSONL output folder, or of a catalog database (see catalog_store.py)."""
+    if os.path.isfile(source):
+        yield from iter_catalog_records(source)
+        return
+    for file_name in sorted(os.listdir(source)):
+        if file_name.endswith(".jsonl"):
+            yield from json_codec.iter_jsonl(os.path.join(source, file_name))
+
+
+class TextIndex:
+    """
+    Inverted index of the ingredient, description and characteristics texts, stored in SQLite.
+
+    Each term (field + folded token) has one posting list, a varint-encoded blob of document
+    gaps and token positions (for phrase queries). Each document keeps a fingerprint of its
+    texts and the IDs of its terms, so update() only re-indexes products whose texts changed
+    and drops removed products from exactly the posting lists they were in.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS documents (
+                docId INTEGER PRIMARY KEY,
+                productId TEXT NOT NULL UNIQUE,
+                denomination TEXT,
+                fingerprint TEXT NOT NULL,
+                terms BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS terms (
+                termId INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE,
+                lastDoc INTEGER NOT NULL,
+                postings BLOB NOT NULL
+            );
+        """)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "TextIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- Indexing ---
+
+    def update(self, records: Iterable[Dict[str, Any]], complete: bool = True) -> Dict[str, int]:
+        """
+        Brings the index up to date with the records. With complete=True the records are the whole
+        catalog and indexed products missing from them are removed. Returns counts per outcome.
+        """
+        existing = {
+            product_id: (doc_id, doc_fingerprint)
+            for product_id, doc_id, doc_fingerprint in self.conn.execute(
+                "SELECT productId, docId, fingerprint FROM documents"
+            )
+        }
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        batch = []
+        with self.conn:
+            for record in records:
+                product_id = record.get("productIdInSupermarket")
+                if not product_id or str(product_id) in seen:
+                    continue
+                product_id = str(product_id)
+                seen.add(product_id)
+                known = existing.get(product_id)
+                if known and known[1] == fingerprint(record):
+                    stats["unchanged"] += 1
+                    continue
+                stats["updated" if known else "added"] += 1
+                batch.append((product_id, record))
+                if len(batch) >= BATCH_SIZE:
+                    self._index_batch(batch, existing)
+                    batch = []
+            if batch:
+                self._index_batch(batch, existing)
+            if complete:
+                removed = [existing[product_id][0] for product_id in existing.keys() - seen]
+                self._remove_documents(removed)
+                stats["removed"] = len(removed)
+        return stats
+
+    def _old_terms(self, doc_ids: List[int]) -> Dict[int, List[str]]:
+        """{docId: [term]} of indexed documents."""
+        old = {}
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT docId, terms FROM documents WHERE docId IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            term_ids = {doc_id: decode_varints(blob) for doc_id, blob in rows}
+            wanted = sorted({term_id for ids in term_ids.values() for term_id in ids})
+            names = {}
+            for term_start in range(0, len(wanted), 500):
+                term_chunk = wanted[term_start:term_start + 500]
+                names.update(self.conn.execute(
+                    f"SELECT termId, term FROM terms WHERE termId IN ({', '.join('?' * len(term_chunk))})", term_chunk
+                ))
+            for doc_id, ids in term_ids.items():
+                old[doc_id] = [names[term_id] for term_id in ids if term_id in names]
+        return old
+
+    def _index_batch(self, batch: List[Tuple[str, Dict[str, Any]]], existing: Dict[str, Tuple[int, str]]) -> None:
+        # term -> {docId: positions, or None to remove the document from the term}
+        changes = defaultdict(dict)
+        old_terms = self._old_terms([existing[product_id][0] for product_id, _ in batch if product_id in existing])
+        doc_terms = {}
+        for product_id, record in batch:
+            if product_id in existing:
+                doc_id = existing[product_id][0]
+                for term in old_terms.get(doc_id, []):
+                    changes[term][doc_id] = None
+                self.conn.execute(
+                    "UPDATE documents SET denomination = ?, fingerprint = ? WHERE docId = ?",
+                    (record.get("denomination"), fingerprint(record), doc_id)
+                )
+            else:
+                doc_id = self.conn.execute(
+                    "INSERT INTO documents (productId, denomination, fingerprint, terms) VALUES (?, ?, ?, ?)",
+                    (product_id, record.get("denomination"), fingerprint(record), b"")
+                ).lastrowid
+                existing[product_id] = (doc_id, fingerprint(record))
+            doc_terms[doc_id] = document_terms(record)
+            for term, positions in doc_terms[doc_id].items():
+                changes[term][doc_id] = positions
+
+        term_ids = self._apply_changes(changes)
+        self.conn.executemany(
+            "UPDATE documents SET terms = ? WHERE docId = ?",
+            [(encode_varints(sorted(term_ids[term] for term in terms)), doc_id) for doc_id, terms in doc_terms.items()]
+        )
+
+    def _remove_documents(self, doc_ids: List[int]) -> None:
+        changes = defaultdict(dict)
+        for doc_id, terms in self._old_terms(doc_ids).items():
+            for term in terms:
+                changes[term][doc_id] = None
+        self._apply_changes(changes)
+        self.conn.executemany("DELETE FROM documents WHERE docId = ?", [(doc_id,) for doc_id in doc_ids])
+
+    def _apply_changes(self, changes: Dict[str, Dict[int, Optional[List[int]]]]) -> Dict[str, int]:
+        """
+        Merges the changes into the posting lists and returns {term: termId} of the terms that
+        still have documents. Documents added after every document of a list are appended to the
+        stored blob without decoding it (the common case: new products get new, larger IDs).
+        """
+        term_ids = {}
+        for term, doc_changes in changes.items():
+            row = self.conn.execute("SELECT termId, lastDoc, postings FROM terms WHERE term = ?", (term,)).fetchone()
+            if row is None:
+                postings = {doc_id: positions for doc_id, positions in doc_changes.items() if positions is not None}
+                if postings:
+                    term_ids[term] = self.conn.execute(
+                        "INSERT INTO terms (term, lastDoc, postings) VALUES (?, ?, ?)",
+                        (term, max(postings), encode_postings(postings))
+                    ).lastrowid
+                continue
+            term_id, last_doc, blob = row
+            if min(doc_changes) > last_doc and None not in doc_changes.values():
+                blob += encode_postings(doc_changes, last_doc)
+                last_doc = max(doc_changes)
+            else:
+                postings = decode_postings(blob)
+                for doc_id, positions in doc_changes.items():
+                    if positions is None:
+                        postings.pop(doc_id, None)
+                    else:
+                        postings[doc_id] = positions
+                if not postings:
+                    self.conn.execute("DELETE FROM terms WHERE termId = ?", (term_id,))
+                    continue
+                blob, last_doc = encode_postings(postings), max(postings)
+            self.conn.execute("UPDATE terms SET lastDoc = ?, postings = ? WHERE termId = ?", (last_doc, blob, term_id))
+            term_ids[term] = term_id
+        return term_ids
+
+    # --- Queries ---
+
+    def postings(self, term: str) -> Dict[int, List[int]]:
+        row = self.conn.execute("SELECT postings FROM terms WHERE term = ?", (term,)).fetchone()
+        return decode_postings(row[0]) if row else {}
+
+    def all_documents(self) -> Set[int]:
+        return {doc_id for (doc_id,) in self.conn.execute("SELECT docId FROM documents")}
+
+    def _prefix_documents(self, field: str, prefix: str) -> Set[int]:
+        docs = set()
+        low = f"{field}:{prefix}"
+        for (blob,) in self.conn.execute("SELECT postings FROM terms WHERE term >= ? AND term < ?", (low, low + "\U0010ffff")):
+            docs.update(decode_postings(blob))
+        return docs
+
+    def _phrase_documents(self, field: str, tokens: List[str]) -> Set[int]:
+        """Documents whose field contains the tokens consecutively."""
+        lists = [self.postings(f"{field}:{token}") for token in tokens]
+        docs = set(lists[0]).intersection(*lists[1:])
+        matches = set()
+        for doc_id in docs:
+            starts = set(lists[0][doc_id])
+            for offset, postings in enumerate(lists[1:], 1):
+                starts &= {position - offset for position in postings[doc_id]}
+            if starts:
+                matches.add(doc_id)
+        return matches
+
+    def term_documents(self, field: Optional[str], text: str) -> Set[int]:
+        """
+        Documents matching one query term: a word, a 'prefix*' or a phrase (several tokens),
+        in one field or (field None) in any indexed field.
+        """
+        if field is not None and field not in INDEXED_FIELDS:
+            raise ValueError(f"Unknown field '{field}' (fields: {', '.join(INDEXED_FIELDS)}).")
+        fields = [field] if field else list(INDEXED_FIELDS)
+        tokens = tokenize(text)
+        docs = set()
+        if not tokens:
+            return docs
+        for name in fields:
+            if len(tokens) == 1 and text.endswith("*"):
+                docs |= self._prefix_documents(name, tokens[0])
+            elif len(tokens) == 1:
+                docs |= set(self.postings(f"{name}:{tokens[0]}"))
+            else:
+                docs |= self._phrase_documents(name, tokens)
+        return docs
+
+    def search(self, query: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        [(productId, denomination)] of the products matching a boolean query, e.g.
+        'ingredients:palma AND NOT description:"sin gluten"' or 'azúcar OR edulcorante*'.
+        Terms are ANDed by default; NOT binds tighter than AND, AND tighter than OR.
+        """
+        doc_ids = sorted(_QueryParser(self, query).parse())
+        results = []
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            results += self.conn.execute(
+                f"SELECT productId, denomination FROM documents WHERE docId IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+        return sorted(results)
+
+
+class _QueryParser:
+    """Recursive descent over: or := and (OR and)* ; and := not (AND? not)* ; not := NOT not | ( or ) | term."""
+
+    def __init__(self, index: TextIndex, query: str) -> None:
+        self.index = index
+        self.tokens = QUERY_PATTERN.findall(query)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def parse(self) -> Set[int]:
+        if not self.tokens:
+            return set()
+        result = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected '{self.peek()}' in query.")
+        return result
+
+    def parse_or(self) -> Set[int]:
+        result = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            result = result | self.parse_and()
+        return result
+
+    def parse_and(self) -> Set[int]:
+        result = self.parse_not()
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            result = result & self.parse_not()
+        return result
+
+    def parse_not(self) -> Set[int]:
+        if self.peek() == "NOT":
+            self.take()
+            return self.index.all_documents() - self.parse_not()
+        if self.peek() == "(":
+            self.take()
+            result = self.parse_or()
+            if self.peek() != ")":
+                raise ValueError("Missing ')' in query.")
+            self.take()
+            return result
+        if self.peek() is None or self.peek() in OPERATORS or self.peek() == ")":
+            raise ValueError("Incomplete query: a term is missing.")
+        token = self.take()
+        field, text = None, token
+        match = re.match(r"(\w+):(.*)$", token)
+        if match:
+            field, text = match.group(1), match.group(2)
+        return self.index.term_documents(field, text.strip('"'))
+
+
+def update_index(db_path: str, source: str) -> Dict[str, int]:
+    """Incremental update of the index from a JSONL output folder or a catalog database."""
+    with TextIndex(db_path) as index:
+        return index.update(iter_source_records(source))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text index over ingredients, descriptions and characteristics.")
+    parser.add_argument("database", help="Index SQLite file.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="Build or incrementally update the index.")
+    update_parser.add_argument("source", help="JSONL output folder or catalog database.")
+    query_parser = subparsers.add_parser("query", help="Run a boolean query.")
+    query_parser.add_argument("query", help="E.g. 'ingredients:palma AND NOT description:\"sin gluten\"'.")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        stats = update_index(args.database, args.source)
+        print(", ".join(f"{count} {outcome}" for outcome, count in stats.items()))
+    else:
+        with TextIndex(args.database) as text_index:
+            try:
+                matches = text_index.search(args.query)
+            except ValueError as e:
+                sys.stderr.write(f"{e}\n")
+                sys.exit(2)
+        for product_id, denomination in matches:
+            sys.stdout.write(f"{product_id}\t{denomination or ''}\n")
+        sys.stderr.write(f"{len(matches)} products\n")
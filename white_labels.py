@@ -0,0 +1,180 @@
+# File: white_labels.py
+
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import json_codec
+
+# --- Configuration ---
+WHITE_LABEL_FILE = "white_label_brands.json"
+# --- End Configuration ---
+
+BRAND_TYPES = ['White-Label', 'Non-White-Label']
+
+_TOKEN = re.compile(r"[0-9A-Z]+")
+_END = ""  # Trie key of a complete listed name (tokens are never empty)
+_PREFIX = " "  # Trie key of a name whose longer variants also match
+
+def fold_brand(brand: Any) -> str:
+    """
+    Canonical form of a brand: accents removed, uppercase, punctuation and whitespace runs
+    collapsed into single spaces ("Eroski Bio/ECO + E.Natur" -> "EROSKI BIO ECO E NATUR").
+    """
+    text = unicodedata.normalize("NFKD", str(brand)).encode("ascii", "ignore").decode("ascii").upper()
+    return " ".join(_TOKEN.findall(text))
+
+class WhiteLabelMatcher:
+    """
+    White-label classification of brand strings, compiled once from the listed names.
+
+    Names and brands are folded (fold_brand) and split into tokens, and the names are compiled
+    into a token trie. A brand matches a listed name when both fold to the same tokens
+    ("EROSKI." and "Eroski" match "EROSKI"). Only the names listed in prefixes also match the
+    brands that start with their tokens: with "EROSKI" there, "eroskí seleqtia" and
+    "EROSKI BIO/ECO" match too, but never "EROSKIMO". Short generic names ("ARO", "BELLE",
+    "n/a") stay exact. Names that fold to nothing ("-", " ") only match the same literal
+    brand. A missing brand (None) is never white-label.
+
+    Results are memoized per brand string, so classifying a column costs one trie walk per
+    distinct brand. fingerprint identifies the list, to tell stale isWhiteLabel tags apart.
+    """
+
+    def __init__(self, names: Iterable[str], prefixes: Iterable[str] = ()) -> None:
+        self.trie = {}
+        self.entries = set()  # (kind, folded name): kind is _END (exact) or _PREFIX
+        self.literals = set()
+        self.memo = {}
+        for name, key in [(name, _END) for name in names] + [(name, _PREFIX) for name in prefixes]:
+            tokens = fold_brand(name).split()
+            if not tokens:
+                self.literals.add(str(name).strip().upper())
+                continue
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[key] = " ".join(tokens)
+            self.entries.add((key, node[key]))
+        self.fingerprint = hashlib.blake2b(
+            json_codec.dumps_bytes([sorted(self.entries), sorted(self.literals)]), digest_size=8
+        ).hexdigest()
+
+    def canonical(self, brand: Any) -> Optional[str]:
+        """
+        The listed name a brand matches (folded; the longest one when several prefixes apply), the
+        literal name for brands without letters or digits, or None.
+        """
+        if brand is None:
+            return None
+        try:
+            return self.memo[brand]
+        except (KeyError, TypeError):
+            pass
+        tokens = fold_brand(brand).split()
+        match = None
+        if not tokens:
+            literal = str(brand).strip().upper()
+            match = literal if literal in self.literals else None
+        node = self.trie
+        for depth, token in enumerate(tokens, 1):
+            node = node.get(token)
+            if node is None:
+                break
+            match = node.get(_PREFIX, match)
+            if depth == len(tokens):
+                match = node.get(_END, match)
+        try:
+            self.memo[brand] = match
+        except TypeError:
+            pass
+        return match
+
+    def is_white_label(self, brand: Any) -> bool:
+        return self.canonical(brand) is not None
+
+    def brand_type(self, brand: Any) -> str:
+        return BRAND_TYPES[0] if self.is_white_label(brand) else BRAND_TYPES[1]
+
+    def table(self) -> Dict[Any, Optional[str]]:
+        """The brand -> canonical white-label name table memoized so far (None: not white-label)."""
+        return dict(self.memo)
+
+    def __contains__(self, brand: Any) -> bool:
+        return self.is_white_label(brand)
+
+    def __len__(self) -> int:
+        return len(self.entries) + len(self.literals)
+
+def load_white_label_brands(file_path: str = WHITE_LABEL_FILE) -> WhiteLabelMatcher:
+    """
+    Loads the white label brands of a JSON file, compiled into a matcher (empty on errors):
+    "general" lists the names matched exactly (after folding), "prefixes" the names whose
+    longer variants also match.
+    """
+    try:
+        data = json_codec.load_file(file_path)
+        matcher = WhiteLabelMatcher(
+            (brand for brand in data.get("general", []) if isinstance(brand, str)),
+            (brand for brand in data.get("prefixes", []) if isinstance(brand, str)),
+        )
+        logging.info(f"Loaded {len(matcher)} white-label brand names.")
+        return matcher
+    except FileNotFoundError:
+        logging.error(f"Error: White label file not found: {file_path}")
+    except ValueError:
+        logging.error(f"Error: Could not decode JSON from {file_path}")
+    except Exception as e:
+        logging.error(f"Error loading white label brands: {e}")
+    return WhiteLabelMatcher([])
+
+def brand_type(brand: Optional[str], white_brands: WhiteLabelMatcher) -> str:
+    """
+    Classifies a single brand as 'White-Label' or 'Non-White-Label'
+    (same rules as brand_price.classify_brands, for code paths without pandas).
+    """
+    return white_brands.brand_type(brand)
+
+def record_brand_type(record: Mapping[str, Any], white_brands: WhiteLabelMatcher) -> str:
+    """
+    Brand type of a product record: its isWhiteLabel tag, set by the scraper when the record
+    was written, if it was computed from the current list (whiteLabelFingerprint); otherwise the
+    classification of its brand (older records, or the list was edited since).
+    """
+    tag = record.get("isWhiteLabel")
+    if tag is not None and record.get("whiteLabelFingerprint") == white_brands.fingerprint:
+        return BRAND_TYPES[0] if tag else BRAND_TYPES[1]
+    return brand_type(record.get("brand"), white_brands)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check which brands the white-label list matches, and through which listed name."
+    )
+    parser.add_argument("brands", nargs="*", help="Brand strings to check.")
+    parser.add_argument("--folder", help="Also check every distinct brand of a JSONL output folder.")
+    parser.add_argument("--white-label-file", default=WHITE_LABEL_FILE)
+    args = parser.parse_args()
+
+    matcher = load_white_label_brands(args.white_label_file)
+    brands = Counter(args.brands)
+    if args.folder:
+        for file_name in os.listdir(args.folder):
+            if file_name.endswith(".jsonl"):
+                for record in json_codec.iter_jsonl(os.path.join(args.folder, file_name)):
+                    brands[record.get("brand")] += 1
+    # White-label brands first, grouped by the listed name they matched
+    for brand, count in sorted(brands.items(), key=lambda item: (matcher.canonical(item[0]) is None,
+                                                                 str(matcher.canonical(item[0])), str(item[0]))):
+        canonical = matcher.canonical(brand)
+        if canonical is None:
+            how = "not white-label"
+        elif fold_brand(brand) in (canonical, ""):
+            how = f"exact {canonical!r}"
+        else:
+            how = f"prefix {canonical!r}"
+        sys.stdout.write(f"{brand!r:<45} {count:>7}  {how}\n")